@@ -84,6 +84,22 @@ class TmplSig:
 
         return LogicSigAccount(bytes(contract))
 
+    def get_sig_account(self, acct_seq_start: int, emitter: bytes, app_id: int, app_address: str) -> LogicSigAccount:
+        """the storage account for emitter/acct_seq_start, as the lsig that signs its opt in
+        (asset storage uses the asset id and b"native")"""
+        return self.populate(
+            {
+                "TMPL_ADDR_IDX": acct_seq_start,
+                "TMPL_EMITTER_ID": emitter.hex(),
+                "TMPL_APP_ID": app_id,
+                "TMPL_APP_ADDRESS": decode_address(app_address).hex(),
+            }
+        )
+
+    def get_sig_address(self, acct_seq_start: int, emitter: bytes, app_id: int, app_address: str) -> str:
+        """get_sig_address of the token bridge, done off chain"""
+        return self.get_sig_account(acct_seq_start, emitter, app_id, app_address).address()
+
     def get_bytecode_chunk(self, idx: int) -> Bytes:
         start = 0
         if idx > 0:
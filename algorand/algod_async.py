@@ -0,0 +1,160 @@
+#!/usr/bin/python3
+"""
+Async access to algod for the host tooling
+
+Everything that talks to a node (relayer, provisioning, indexers) goes through the
+small interface below, local_algod.LocalAlgod implements the same one offline.
+
+    suggested_params()                  -> SuggestedParams
+    local_state(address, app_id)        -> decoded local state, None if not opted in
+    global_state(app_id)                -> decoded global state
+    send_group(signed)                  -> txid of the first transaction
+    send_raw_group(raw)                 -> the same for already encoded signed transactions
+
+PooledAlgod adds compile(teal) and application_info(app_id) and is the one to share
+across a process: shared_algod() hands out the same AlgodClient to the contract
+builders instead of each of them constructing its own.
+"""
+import asyncio
+import base64
+import copy
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+from algosdk.error import AlgodHTTPError
+from algosdk.future import transaction
+from algosdk.v2client.algod import AlgodClient
+
+from local_state import decode_local_state
+
+TESTNET_TOKEN = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+TESTNET_URL = "https://testnet-api.algonode.cloud"
+
+
+@functools.lru_cache(maxsize=None)
+def shared_algod(token: str = TESTNET_TOKEN, url: str = TESTNET_URL) -> AlgodClient:
+    """
+    One AlgodClient per (token, url) for the whole process
+    """
+    return AlgodClient(token, url)
+
+
+class ThreadedAlgod:
+    """
+    The async interface over algosdk's blocking AlgodClient, each call on a worker thread
+    """
+
+    def __init__(self, client: AlgodClient):
+        self.client = client
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        return await asyncio.to_thread(self.client.suggested_params)
+
+    async def local_state(self, address: str, app_id: int) -> Optional[Dict[bytes, Union[bytes, int]]]:
+        try:
+            info = await asyncio.to_thread(self.client.account_application_info, address, app_id)
+        except AlgodHTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        if "app-local-state" not in info:
+            return None
+        return decode_local_state(info["app-local-state"].get("key-value", []))
+
+    async def global_state(self, app_id: int) -> Dict[bytes, Union[bytes, int]]:
+        info = await asyncio.to_thread(self.client.application_info, app_id)
+        return decode_local_state(info["params"].get("global-state", []))
+
+    async def send_group(self, signed: list) -> str:
+        return await asyncio.to_thread(self.client.send_transactions, signed)
+
+    async def send_raw_group(self, raw: bytes) -> str:
+        return await asyncio.to_thread(self.client.send_raw_transaction, base64.b64encode(raw).decode())
+
+
+class PooledAlgod:
+    """
+    The async interface for a process with many concurrent callers
+
+    - at most `concurrency` requests are in flight, on a pool of as many threads
+    - suggested params are reused for `params_ttl` seconds, they only move once a round
+    - identical calls that overlap (the core's application_info for MessageFee, compiling
+      the same program) share one request and all get its result
+
+    send_group and send_raw_group are neither cached nor coalesced.
+    """
+
+    def __init__(self, client: AlgodClient, concurrency: int = 8, params_ttl: float = 2.0):
+        self.client = client
+        self.params_ttl = params_ttl
+        self.executor = ThreadPoolExecutor(concurrency, thread_name_prefix="algod")
+        self.slots = asyncio.Semaphore(concurrency)
+        self.inflight: Dict[tuple, asyncio.Future] = {}
+        self.requests = 0
+        self._params: Optional[transaction.SuggestedParams] = None
+        self._params_at = 0.0
+
+    async def _run(self, fn: Callable, *args) -> Any:
+        async with self.slots:
+            self.requests += 1
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+
+    async def _coalesce(self, key: tuple, make: Callable[[], Awaitable]) -> Any:
+        if key in self.inflight:
+            return await asyncio.shield(self.inflight[key])
+
+        fut = asyncio.ensure_future(make())
+        self.inflight[key] = fut
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            if fut.done():
+                self.inflight.pop(key, None)
+            else:
+                fut.add_done_callback(lambda _: self.inflight.pop(key, None))
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        if self._params is None or time.monotonic() - self._params_at > self.params_ttl:
+            self._params = await self._coalesce(("params",), lambda: self._run(self.client.suggested_params))
+            self._params_at = time.monotonic()
+        # Callers set fees on the params they get, never hand out the cached one
+        return copy.copy(self._params)
+
+    def invalidate_params(self):
+        self._params = None
+
+    async def compile(self, teal: str) -> dict:
+        return await self._coalesce(("compile", teal), lambda: self._run(self.client.compile, teal))
+
+    async def application_info(self, app_id: int) -> dict:
+        return await self._coalesce(("app", app_id), lambda: self._run(self.client.application_info, app_id))
+
+    async def account_application_info(self, address: str, app_id: int) -> dict:
+        return await self._coalesce(
+            ("local", address, app_id), lambda: self._run(self.client.account_application_info, address, app_id))
+
+    async def local_state(self, address: str, app_id: int) -> Optional[Dict[bytes, Union[bytes, int]]]:
+        try:
+            info = await self.account_application_info(address, app_id)
+        except AlgodHTTPError as e:
+            if e.code == 404:
+                return None
+            raise
+        if "app-local-state" not in info:
+            return None
+        return decode_local_state(info["app-local-state"].get("key-value", []))
+
+    async def global_state(self, app_id: int) -> Dict[bytes, Union[bytes, int]]:
+        info = await self.application_info(app_id)
+        return decode_local_state(info["params"].get("global-state", []))
+
+    async def send_group(self, signed: list) -> str:
+        return await self._run(self.client.send_transactions, signed)
+
+    async def send_raw_group(self, raw: bytes) -> str:
+        return await self._run(self.client.send_raw_transaction, base64.b64encode(raw).decode())
+
+    def close(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+"""
+Per asset configuration, without an account lookup per quote
+
+The limits, fees, fee flags and escrow of an asset live in its (asset id, "native")
+storage account and only change through three bridge methods:
+
+    attestToken         asset id in args[1]
+    updateTokenConfig   asset id in args[1]
+    receiveAttest       the storage account in accounts[4]
+
+The cache holds decoded records for the most recently used `size` assets and drops an
+entry whenever one of those calls to the bridge is seen confirmed.
+
+    cache = AssetCache(algod, TmplSig("sig"), bridge_id)
+    cache.warm(index)                       # from a state_index.StateIndex
+    record = await cache.get(asset_id)
+    await cache.sync(IndexerSource(indexer, bridge_id))
+"""
+import base64
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from algosdk.logic import get_application_address
+
+from local_state import AssetRecord, blob_bytes, decode_asset
+from TmplSig import TmplSig
+
+INVALIDATING = (b"attestToken", b"updateTokenConfig", b"receiveAttest")
+
+
+class AssetCache:
+    def __init__(self, algod, tmpl_sig: TmplSig, bridge_id: int, size: int = 4096):
+        self.algod = algod
+        self.tmpl_sig = tmpl_sig
+        self.bridge_id = bridge_id
+        self.bridge_addr = get_application_address(bridge_id)
+        self.size = size
+
+        self.records: "OrderedDict[int, AssetRecord]" = OrderedDict()
+        self.storage: Dict[str, int] = {}           # storage address -> asset id, for whatever was ever cached
+        self.round = 0
+        self.hits = 0
+        self.misses = 0
+
+    def address(self, asset: int) -> str:
+        return self.tmpl_sig.get_sig_address(asset, b"native", self.bridge_id, self.bridge_addr)
+
+    def _put(self, asset: int, record: AssetRecord):
+        self.records[asset] = record
+        self.records.move_to_end(asset)
+        while len(self.records) > self.size:
+            self.records.popitem(last=False)
+
+    async def get(self, asset: int) -> Optional[AssetRecord]:
+        """
+        The record of an asset, None if it was never attested
+        """
+        if asset in self.records:
+            self.hits += 1
+            self.records.move_to_end(asset)
+            return self.records[asset]
+
+        self.misses += 1
+        addr = self.address(asset)
+        self.storage[addr] = asset
+        state = await self.algod.local_state(addr, self.bridge_id)
+        record = decode_asset(blob_bytes(state)) if state is not None else None
+        if record is not None:
+            self._put(asset, record)
+        return record
+
+    def invalidate(self, asset: int):
+        self.records.pop(asset, None)
+
+    def observe(self, txn: dict):
+        """
+        Drop whatever a confirmed transaction (indexer format) may have changed
+        """
+        appl = txn.get("application-transaction", {})
+        if appl.get("application-id") != self.bridge_id:
+            return
+        args = [base64.b64decode(a) for a in appl.get("application-args", [])]
+        if not args or args[0] not in INVALIDATING:
+            return
+
+        if args[0] != b"receiveAttest" and len(args) > 1:
+            self.invalidate(int.from_bytes(args[1], "big"))
+        for addr in appl.get("accounts", []):
+            if addr in self.storage:
+                self.invalidate(self.storage[addr])
+
+    async def sync(self, source) -> int:
+        """
+        Observe every call to the bridge confirmed since the last sync, the new round
+        """
+        rnd, txns = await source.transactions(self.round + 1)
+        for txn in txns:
+            self.observe(txn)
+        self.round = max(self.round, rnd)
+        return self.round
+
+    def warm(self, index, assets: Iterable[int] = None) -> int:
+        """
+        Fill the cache from a state index snapshot, for the given assets or for every
+        record in it that sits at its own asset's storage address
+        """
+        n = 0
+        if assets is not None:
+            for asset in assets:
+                blob = index.blob(self.address(asset))
+                record = decode_asset(blob) if blob is not None else None
+                if record is not None:
+                    self.storage[self.address(asset)] = asset
+                    self._put(asset, record)
+                    n += 1
+        else:
+            for addr, _, blob in index.items():
+                record = decode_asset(blob)
+                if record is None:
+                    continue
+                # Wrapped assets carry their id at 0, native ones at 116.  Replay bitmaps
+                # decode to something too, only keep records at their own asset's address
+                asset = record.asset or record.native
+                if self.address(asset) != addr:
+                    continue
+                self.storage[addr] = asset
+                self._put(asset, record)
+                n += 1
+        self.round = max(self.round, index.round)
+        return n
@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+"""
+Signing encoded groups on a process pool
+
+A group is handed over as its encoded transactions, each with the lsig that signs it
+or None for the relayer account:
+
+    [(raw, vaa_verify.lsig.logic), (raw, None), (raw, None)]
+
+The private key is loaded once per worker and the lsig envelopes are packed once per
+program per worker (the vaa_verify lsig is one program, the TmplSig accounts one per
+populated template), so the per transaction work left is the ed25519 signature.
+Signed groups come back as the bytes send_raw_group takes, in input order.
+
+    with BatchSigner(private_key) as signer:
+        blobs = signer.sign_groups(groups)
+"""
+import asyncio
+import functools
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from algosdk.future.transaction import LogicSigAccount
+
+from group_template import lsig_prefix, sign_raw
+
+Group = List[Tuple[bytes, Optional[bytes]]]
+
+_private_key: Optional[str] = None
+
+
+def _init(private_key: str):
+    global _private_key
+    _private_key = private_key
+
+
+@functools.lru_cache(maxsize=4096)
+def _prefix(program: bytes) -> bytes:
+    return lsig_prefix({"l": program})
+
+
+def sign_group(group: Group, private_key: str = None) -> bytes:
+    key = private_key or _private_key
+    return b"".join(sign_raw(raw, key) if program is None else _prefix(program) + raw for raw, program in group)
+
+
+def _sign_chunk(groups: List[Group]) -> List[bytes]:
+    return [sign_group(g) for g in groups]
+
+
+def program(lsig: LogicSigAccount) -> bytes:
+    """
+    The program to pair with the transactions an lsig signs, only plain (undelegated,
+    argument free) lsigs can be signed this way
+    """
+    if lsig.lsig.args or lsig.lsig.sig or lsig.lsig.msig:
+        raise ValueError("only undelegated logic sigs without arguments")
+    return lsig.lsig.logic
+
+
+class BatchSigner:
+    def __init__(self, private_key: str, processes: int = None, chunk: int = 32):
+        self.chunk = chunk
+        self.pool = ProcessPoolExecutor(processes, initializer=_init, initargs=(private_key,))
+
+    def sign_groups(self, groups: List[Group]) -> List[bytes]:
+        return list(self.pool.map(sign_group, groups, chunksize=self.chunk))
+
+    async def sign_async(self, groups: List[Group]) -> List[bytes]:
+        """
+        Sign from the event loop, one pool task per chunk of groups
+        """
+        loop = asyncio.get_running_loop()
+        chunks = [groups[i:i + self.chunk] for i in range(0, len(groups), self.chunk)]
+        done = await asyncio.gather(*[loop.run_in_executor(self.pool, _sign_chunk, c) for c in chunks])
+        return [blob for c in done for blob in c]
+
+    def close(self):
+        self.pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
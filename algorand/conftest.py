@@ -0,0 +1,43 @@
+import pytest
+
+
+def compile_app(contract, version: int = 6) -> str:
+    from pyteal import Mode, OptimizeOptions, compileTeal
+
+    return compileTeal(contract, mode=Mode.Application, version=version, assembleConstants=True,
+                       optimize=OptimizeOptions(scratch_slots=True))
+
+
+@pytest.fixture(scope="session")
+def bridge_teal() -> str:
+    pytest.importorskip("pyteal")
+    pytest.importorskip("algosdk")
+    from TmplSig import TmplSig
+    from token_bridge import approve_token_bridge
+
+    return compile_app(approve_token_bridge(1002000, TmplSig("sig"), False))
+
+
+@pytest.fixture(scope="session")
+def escrow_teal() -> str:
+    pytest.importorskip("pyteal")
+    pytest.importorskip("algosdk")
+    from escrow import approve_escrow
+
+    return compile_app(approve_escrow())
+
+
+def vaa_bytes(sequence: int = 1, emitter: bytes = (2).to_bytes(2, "big") + b"\xee" * 32, payload: bytes = b"",
+              num_sigs: int = 0, guardian_set: int = 0, version: int = 1, timestamp: int = 0, nonce: int = 0) -> bytes:
+    """
+    A VAA with zeroed signatures, laid out the way the bridge reads it
+    """
+    header = bytes([version]) + guardian_set.to_bytes(4, "big") + bytes([num_sigs]) + bytes(66 * num_sigs)
+    body = timestamp.to_bytes(4, "big") + nonce.to_bytes(4, "big") + emitter + sequence.to_bytes(8, "big") + b"\x0f"
+    return header + body + payload
+
+
+def transfer_payload(amount: int = 10 ** 8, token: bytes = bytes(32), token_chain: int = 8, to: bytes = b"\xdd" * 32,
+                     to_chain: int = 8, fee: int = 0, action: int = 1, extra: bytes = b"") -> bytes:
+    return (bytes([action]) + amount.to_bytes(32, "big") + token + token_chain.to_bytes(2, "big") +
+            to + to_chain.to_bytes(2, "big") + fee.to_bytes(32, "big") + extra)
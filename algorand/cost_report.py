@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+"""
+The bridge's approval program built for several AVM versions, side by side
+
+For every routed method the report adds up the opcode cost of everything reachable
+from its router entry, following branches and subroutine calls.  Every op is counted
+once, so a loop body counts as a single iteration and both arms of an If count.  It
+is not the cost of any one call, but the same walk over two builds of the same
+contract shows where a version makes a method cheaper:
+
+    python3 cost_report.py 6 8
+
+    method                        v6      v8   v8-v6
+    completeTransfer             ...     ...     ...
+
+Programs are only compiled with pyteal.  With an algod the assembled size of each
+build is added on a "bytes" line.
+"""
+import sys
+from base64 import b64decode
+from typing import Dict, List, Set, Tuple
+
+from fees import FeeModel
+from teal_build import match_router
+
+# Opcode costs that are not 1, for the versions we build for
+COSTS = {
+    "sha256": 35,
+    "keccak256": 130,
+    "sha512_256": 45,
+    "sha3_256": 130,
+    "ed25519verify": 1900,
+    "ed25519verify_bare": 1900,
+    "ecdsa_verify": 1700,
+    "ecdsa_pk_decompress": 650,
+    "ecdsa_pk_recover": 2000,
+    "divmodw": 20,
+    "expw": 10,
+    "bsqrt": 40,
+    "b+": 10,
+    "b-": 10,
+    "b*": 20,
+    "b/": 20,
+    "b%": 20,
+    "b|": 6,
+    "b&": 6,
+    "b^": 6,
+    "b~": 4,
+}
+
+
+def _reachable(model: FeeModel, start: int, bounds: Tuple[int, int] = None) -> Set[int]:
+    """
+    Ops reachable from start, staying within bounds outside of subroutine calls
+    """
+    seen: Set[int] = set()
+    todo = [(start, True)]
+    while todo:
+        pc, bounded = todo.pop()
+        if pc in seen or pc >= len(model.ops):
+            continue
+        if bounded and bounds is not None and not bounds[0] <= pc <= bounds[1]:
+            continue
+        seen.add(pc)
+        op, arg = model.ops[pc]
+        if op == "callsub":
+            todo.append((model.labels[arg], False))
+        todo.extend((t, bounded) for t in model._targets(pc))
+    return seen
+
+
+def _cost(model: FeeModel, pcs: Set[int]) -> int:
+    return sum(COSTS.get(model.ops[pc][0], 1) for pc in pcs)
+
+
+def method_costs(model: FeeModel) -> Dict[str, int]:
+    """
+    Cost of the ops reachable from each method's router entry
+    """
+    return {m: _cost(model, _reachable(model, entry)) for m, entry in model.entries.items()}
+
+
+def lap_cost(model: FeeModel, method: str) -> int:
+    """
+    Cost of one lap of the costliest loop of `method` that submits inner transactions
+
+    These are the loops FeeModel.per_item prices, so a call with n items costs about
+    method_costs + (n - 1) * lap_cost.
+    """
+    body = _reachable(model, model.entries[method])
+    laps = []
+    for pc in body:
+        for head in model._targets(pc):
+            if head > pc or head not in body:
+                continue
+            lap = _reachable(model, head, (head, pc))
+            if any(model.ops[x][0] == "itxn_submit" or
+                   (model.ops[x][0] == "callsub" and model._issues_itxn(model.labels[model.ops[x][1]])) for x in lap):
+                laps.append(_cost(model, lap))
+    return max(laps, default=0)
+
+
+def build(version: int, seed_amt: int = 1002000) -> str:
+    from pyteal import Mode, OptimizeOptions, compileTeal
+
+    from TmplSig import TmplSig
+    from token_bridge import approve_token_bridge
+
+    teal = compileTeal(approve_token_bridge(seed_amt, TmplSig("sig"), False, version=version),
+                       mode=Mode.Application, version=version, assembleConstants=True,
+                       optimize=OptimizeOptions(scratch_slots=True))
+    return match_router(teal) if version >= 8 else teal
+
+
+def report(teals: Dict[int, str], client=None) -> str:
+    versions = sorted(teals)
+    costs = {v: method_costs(FeeModel(teals[v])) for v in versions}
+    methods = sorted(set().union(*[c.keys() for c in costs.values()]))
+
+    head = ["{:<24}".format("method")] + ["{:>8}".format("v{}".format(v)) for v in versions]
+    if len(versions) > 1:
+        head.append("{:>8}".format("v{}-v{}".format(versions[-1], versions[0])))
+    lines: List[str] = ["".join(head)]
+
+    def row(name: str, values: List[int]):
+        cols = ["{:<24}".format(name)] + ["{:>8}".format(x) for x in values]
+        if len(values) > 1:
+            cols.append("{:>+8}".format(values[-1] - values[0]))
+        lines.append("".join(cols))
+
+    for m in methods:
+        row(m, [costs[v].get(m, 0) for v in versions])
+
+    if client is not None:
+        row("bytes", [len(b64decode(client.compile(teals[v])["result"])) for v in versions])
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    versions = [int(v) for v in sys.argv[1:]] or [6, 8]
+    print(report({v: build(v) for v in versions}))
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+"""
+The registered token bridge emitters, for dropping foreign VAAs before any real work
+
+registerChain puts "Chain" + chain id (2 bytes) -> emitter address (32 bytes) in the
+bridge's global state and completeTransfer / receiveAttest reject anything else.
+retireBlock appends the emitter's replay low water mark to the address.
+Transfers from chain 8 come from the bridge's own application address, which is
+always accepted.  The registry keeps the same pairs as a set of the raw 34 byte
+chain + address slices, so checking a VAA is one slice and one set lookup:
+
+    registry = EmitterRegistry(bridge_id)
+    await registry.load(algod)
+    if registry.accepts(raw): ...
+    await registry.sync(source)             # picks up registerChain calls
+"""
+import base64
+from typing import Dict, Set
+
+from algosdk.encoding import decode_address
+from algosdk.logic import get_application_address
+
+ALGORAND_CHAIN = 8
+PREFIX = b"Chain"
+
+
+class EmitterRegistry:
+    def __init__(self, bridge_id: int):
+        self.bridge_id = bridge_id
+        self.own = ALGORAND_CHAIN.to_bytes(2, "big") + decode_address(get_application_address(bridge_id))
+        self.chains: Dict[bytes, bytes] = {}        # 2 byte chain id -> emitter address
+        self.emitters: Set[bytes] = {self.own}
+        self.round = 0
+        self.dropped = 0
+
+    def register(self, chain: bytes, address: bytes):
+        old = self.chains.get(chain)
+        if old is not None and chain + old != self.own:
+            self.emitters.discard(chain + old)
+        self.chains[chain] = address
+        self.emitters.add(chain + address)
+
+    async def load(self, algod):
+        state = await algod.global_state(self.bridge_id)
+        self.chains = {}
+        self.emitters = {self.own}
+        for k, v in state.items():
+            if k.startswith(PREFIX) and len(k) == len(PREFIX) + 2 and isinstance(v, bytes):
+                self.register(k[len(PREFIX):], v[:32])
+
+    def observe(self, txn: dict):
+        """
+        Apply a confirmed registerChain (indexer format)
+        """
+        appl = txn.get("application-transaction", {})
+        if appl.get("application-id") != self.bridge_id:
+            return
+        args = [base64.b64decode(a) for a in appl.get("application-args", [])]
+        if len(args) >= 3 and args[0] == b"registerChain":
+            self.register(args[1], args[2])
+
+    async def sync(self, source) -> int:
+        rnd, txns = await source.transactions(self.round + 1)
+        for txn in txns:
+            self.observe(txn)
+        self.round = max(self.round, rnd)
+        return self.round
+
+    def accepts(self, raw: bytes) -> bool:
+        """
+        From a registered emitter and, for transfers, bound for Algorand
+        """
+        if len(raw) < 6:
+            self.dropped += 1
+            return False
+        off = 6 + raw[5] * 66
+        if raw[off + 8:off + 42] not in self.emitters:
+            self.dropped += 1
+            return False
+
+        payload = off + 51
+        if len(raw) > payload and raw[payload] in (1, 3):
+            if int.from_bytes(raw[payload + 99:payload + 101], "big") != ALGORAND_CHAIN:
+                self.dropped += 1
+                return False
+        return True
@@ -24,29 +24,24 @@ from pyteal.compiler import *
 from pyteal.ir import *
 from pyteal.types import *
 
+from algod_async import shared_algod
+from teal_build import fullyCompileContract
+from teal_map import AssertSites
 
-def fullyCompileContract(genTeal, client: AlgodClient, contract: Expr, name, devmode) -> bytes:
-    if devmode:
-        teal = compileTeal(contract, mode=Mode.Application, version=6, assembleConstants=True)
-    else:
-        teal = compileTeal(contract, mode=Mode.Application, version=6, assembleConstants=True, optimize=OptimizeOptions(scratch_slots=True))
+# A transaction can reference at most 4 foreign accounts
+max_payouts = 4
 
-    if genTeal:
-        with open(name, "w") as f:
-            print("Writing " + name)
-            f.write(teal)
-    else:
-        with open(name, "r") as f:
-            print("Reading " + name)
-            teal = f.read()
-
-    response = client.compile(teal)
-    return response
+# Global schema of an escrow: aid, bid, ain, aout and ver are uints, w1 and w2 byte
+# slices.  "ver" came with payout, escrows created with the earlier 4 uint schema
+# have no room for it.  They still create, without "ver", and the bridge keeps paying
+# out of them through transfer and liquidity (see escrowHasPayout)
+global_uints = 5
+global_bytes = 2
 
 def clear_escrow():
     return Int(1)
 
-def approve_escrow():
+def approve_escrow(sites: AssertSites = None):
     tidx = ScratchVar()
     aid = ScratchVar()
 
@@ -56,9 +51,14 @@ def approve_escrow():
         return Seq(maybe, MagicAssert(maybe.hasValue()), maybe.value())
 
     def MagicAssert(a) -> Expr:
+        if sites is not None:
+            return sites.mark(a)
         return Assert(a)
 
+    schema = AppParam.globalNumUint(Global.current_application_id())
+
     on_create = Seq( [
+        schema,
         aid.store(Btoi(Txn.application_args[0])),
         App.globalPut(Bytes("aid"), aid.load()), # ASA ID
         App.globalPut(Bytes("bid"), Btoi(Txn.application_args[1])), # Bridge ID
@@ -66,6 +66,8 @@ def approve_escrow():
         App.globalPut(Bytes("aout"), Int(0)), # Track Amount out
         App.globalPut(Bytes("w1"), Global.creator_address()),
         App.globalPut(Bytes("w2"), Global.creator_address()),
+        If(And(schema.hasValue(), schema.value() >= Int(global_uints)),
+           App.globalPut(Bytes("ver"), Int(1))), # Supports payout
         Return(Int(1))
     ])
 
@@ -149,45 +151,16 @@ def approve_escrow():
 
     def transfer():
         badr = ScratchVar()
-        aid = ScratchVar()
 
         return Seq([
             # The caller must be the token bridge app
             badr.store(getAppAddress(App.globalGet(Bytes("bid")))),
-            aid.store(App.globalGet(Bytes("aid"))),
 
             MagicAssert(And(
                 Txn.sender() == badr.load()
             )),
 
-            InnerTxnBuilder.Begin(),
-            If (aid.load() == Int(0),
-            Seq([
-                # ALGO Transfer
-                InnerTxnBuilder.SetFields(
-                    {
-                        TxnField.sender: Global.current_application_address(),
-                        TxnField.receiver: Txn.accounts[1],
-                        TxnField.type_enum: TxnType.Payment,
-                        TxnField.amount: Btoi(Txn.application_args[1]),
-                        TxnField.fee: Int(0),
-                    }
-                ),
-            ]), 
-            Seq([
-                # ASA Transfer
-                InnerTxnBuilder.SetFields(
-                    {
-                        TxnField.sender: Global.current_application_address(),
-                        TxnField.type_enum: TxnType.AssetTransfer,
-                        TxnField.xfer_asset: aid.load(),
-                        TxnField.asset_amount: Btoi(Txn.application_args[1]),
-                        TxnField.asset_receiver: Txn.accounts[1],
-                        TxnField.fee: Int(0),
-                    }
-                ),
-            ])),
-            InnerTxnBuilder.Submit(),
+            sendFromEscrow(App.globalGet(Bytes("aid")), Txn.accounts[1], Btoi(Txn.application_args[1])),
 
             Approve(),
         ])
@@ -234,6 +207,71 @@ def approve_escrow():
             Approve(),
         ])
 
+    @Subroutine(TealType.none)
+    def sendFromEscrow(aid, receiver, amt):
+        return Seq([
+            InnerTxnBuilder.Begin(),
+            If (aid == Int(0),
+            Seq([
+                # ALGO Transfer
+                InnerTxnBuilder.SetFields(
+                    {
+                        TxnField.sender: Global.current_application_address(),
+                        TxnField.receiver: receiver,
+                        TxnField.type_enum: TxnType.Payment,
+                        TxnField.amount: amt,
+                        TxnField.fee: Int(0),
+                    }
+                ),
+            ]),
+            Seq([
+                # ASA Transfer
+                InnerTxnBuilder.SetFields(
+                    {
+                        TxnField.sender: Global.current_application_address(),
+                        TxnField.type_enum: TxnType.AssetTransfer,
+                        TxnField.xfer_asset: aid,
+                        TxnField.asset_amount: amt,
+                        TxnField.asset_receiver: receiver,
+                        TxnField.fee: Int(0),
+                    }
+                ),
+            ])),
+            InnerTxnBuilder.Submit(),
+        ])
+
+    # transfer + liquidity in a single call
+    #   args:     payout, ain, aout, amount for accounts[1], amount for accounts[2], ...
+    #   accounts: the receivers, zero amounts are skipped
+    def payout():
+        badr = ScratchVar()
+        aid = ScratchVar()
+        amt = ScratchVar()
+
+        def pay(i):
+            return If(Txn.accounts.length() >= Int(i), Seq([
+                amt.store(Btoi(Txn.application_args[i + 2])),
+                If(amt.load() > Int(0), sendFromEscrow(aid.load(), Txn.accounts[i], amt.load())),
+            ]))
+
+        return Seq([
+            badr.store(getAppAddress(App.globalGet(Bytes("bid")))),
+            aid.store(App.globalGet(Bytes("aid"))),
+
+            # Sender should be the bridge, and we have an amount for every receiver
+            MagicAssert(And(
+                Txn.sender() == badr.load(),
+                Txn.application_args.length() == Txn.accounts.length() + Int(3),
+            )),
+
+            App.globalPut(Bytes("ain"), App.globalGet(Bytes("ain")) + Btoi(Txn.application_args[1])),
+            App.globalPut(Bytes("aout"), App.globalGet(Bytes("aout")) + Btoi(Txn.application_args[2])),
+
+            Seq([pay(i) for i in range(1, max_payouts + 1)]),
+
+            Approve(),
+        ])
+
     def deposit():
         amt = ScratchVar()
 
@@ -309,6 +347,7 @@ def approve_escrow():
         [METHOD == Bytes("withdraw"), withdraw()],
         [METHOD == Bytes("transfer"), transfer()],
         [METHOD == Bytes("liquidity"), liquidity()],
+        [METHOD == Bytes("payout"), payout()],
         [METHOD == Bytes("updateBridge"), updateBridge()],
         [METHOD == Bytes("updateWhitelist"), updateWhitelist()],
     )
@@ -332,10 +371,11 @@ def approve_escrow():
         [Txn.on_completion() == OnComplete.NoOp, router]
     )
 
-def getEscrow(genTeal, approve_name, clear_name, client: AlgodClient, devMode: bool) -> Tuple[bytes, bytes]:
+def getEscrow(genTeal, approve_name, clear_name, client: AlgodClient, devMode: bool, version: int = 6) -> Tuple[bytes, bytes]:
     if not devMode:
-        client = AlgodClient("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa", "https://testnet-api.algonode.cloud")
-    APPROVAL_PROGRAM = fullyCompileContract(genTeal, client, approve_escrow(), approve_name, devMode)
-    CLEAR_STATE_PROGRAM = fullyCompileContract(genTeal, client, clear_escrow(), clear_name, devMode)
+        client = shared_algod()
+    sites = AssertSites()
+    APPROVAL_PROGRAM = fullyCompileContract(genTeal, client, approve_escrow(sites), approve_name, devMode, sites, version)
+    CLEAR_STATE_PROGRAM = fullyCompileContract(genTeal, client, clear_escrow(), clear_name, devMode, version=version)
 
     return APPROVAL_PROGRAM, CLEAR_STATE_PROGRAM
@@ -0,0 +1,386 @@
+#!/usr/bin/python3
+"""
+Pooled fee calculation for bridge and escrow transaction groups
+
+Every inner transaction the bridge and the escrows submit carries `TxnField.fee: Int(0)`,
+and the logic sigs (vaa_verify, TmplSig) assert `Txn.fee() == 0`, so the outer group has
+to pay min_fee for each of them through fee pooling.
+
+Rather than keep a table of how many inner transactions each method submits, FeeModel
+walks the compiled TEAL of the approval program.  Starting at the router entry of a
+method it follows every branch and records the inner transactions (type and, for
+application calls, the first application argument) submitted along each path.  Each
+distinct sequence is a Branch.  Application calls to methods of another program (the
+escrow's `transfer` issues an inner payment of its own) are expanded through `callees`.
+Loops that submit inner transactions (one publishMessage per entry of a batch) are
+walked once and priced per item.
+
+    bridge = bridge_fee_model(open("teal/token_approve.teal").read(), open("teal/escrow_approve.teal").read())
+    for b in bridge.branches("completeTransfer"):
+        print(b.calls, b.inner_txns)
+
+    fees = pooled_fees([
+        GroupTxn(lsig=True),                                    # vaa_verify
+        GroupTxn(),                                             # core verifyVAA
+        # escrow payout paying two receivers
+        GroupTxn(bridge, "completeTransfer", where=lambda b: b.count("payout") == 1 and b.inner_txns == 3),
+    ], min_fee=1000)
+
+    bridge.inner_txns("sendTransferBatch", items=5)
+
+"""
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+import sys
+
+TXN_TYPES = {1: "pay", 2: "keyreg", 3: "acfg", 4: "axfer", 5: "afrz", 6: "appl"}
+
+NAMED_INTS = {
+    "unknown": 0, "pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6,
+    "NoOp": 0, "OptIn": 1, "CloseOut": 2, "ClearState": 3, "UpdateApplication": 4, "DeleteApplication": 5,
+}
+
+# (type, first application arg) of one inner transaction
+InnerTxn = Tuple[str, Optional[str]]
+
+
+class Branch(NamedTuple):
+    calls: Tuple[InnerTxn, ...]     # inner transactions submitted directly by the method
+    inner_txns: int                 # including the ones submitted by the apps it calls
+
+    def count(self, method: str) -> int:
+        """
+        Number of inner application calls to `method`
+        """
+        return sum(1 for t, m in self.calls if t == "appl" and m == method)
+
+
+def _strip_comment(line: str) -> str:
+    quoted = False
+    for i, c in enumerate(line):
+        if c == '"' and (i == 0 or line[i - 1] != "\\"):
+            quoted = not quoted
+        elif not quoted and line.startswith("//", i):
+            return line[:i]
+    return line
+
+
+def _parse_bytes(arg: str) -> bytes:
+    if arg.startswith("0x"):
+        return bytes.fromhex(arg[2:])
+    if arg.startswith('"') and arg.endswith('"'):
+        return arg[1:-1].encode().decode("unicode_escape").encode("latin-1")
+    for prefix in ("base64 ", "b64 ", "base64(", "b64("):
+        if arg.startswith(prefix):
+            from base64 import b64decode
+            return b64decode(arg[len(prefix):].rstrip(")"))
+    raise ValueError("cannot decode byte constant {}".format(arg))
+
+
+class FeeModel:
+    def __init__(self, teal: str, callees: Dict[str, "FeeModel"] = None):
+        self.callees = callees if callees is not None else {}
+        self.ops: List[Tuple[str, str]] = []
+        self.labels: Dict[str, int] = {}
+        self.intc: List[int] = []
+        self.bytec: List[bytes] = []
+
+        for line in teal.splitlines():
+            line = _strip_comment(line).strip()
+            if line == "" or line.startswith("#"):
+                continue
+            if line.endswith(":") and " " not in line:
+                self.labels[line[:-1]] = len(self.ops)
+                continue
+            op, _, rest = line.partition(" ")
+            rest = rest.strip()
+            if op == "intcblock":
+                self.intc = [int(v) for v in rest.split()]
+            elif op == "bytecblock":
+                self.bytec = [_parse_bytes(v) for v in rest.split()]
+            self.ops.append((op, rest))
+
+        self.entries = self._find_entries()
+        self.back_targets = {t for pc in range(len(self.ops)) for t in self._targets(pc) if t <= pc}
+        self._sub_itxn: Dict[int, bool] = {}
+        self._branches: Dict[str, List[Branch]] = {}
+        self._per_item: Dict[str, int] = {}
+
+    def _int(self, pc: int) -> Optional[int]:
+        """
+        The value pushed by the instruction at pc, if it is an int constant
+        """
+        if pc < 0:
+            return None
+        op, arg = self.ops[pc]
+        if op in ("int", "pushint"):
+            return NAMED_INTS[arg] if arg in NAMED_INTS else int(arg, 0)
+        if op.startswith("intc_"):
+            return self.intc[int(op[5:])]
+        if op == "intc":
+            return self.intc[int(arg)]
+        return None
+
+    def _bytes(self, pc: int) -> Optional[bytes]:
+        """
+        The value pushed by the instruction at pc, if it is a byte constant
+        """
+        if pc < 0:
+            return None
+        op, arg = self.ops[pc]
+        if op in ("byte", "pushbytes"):
+            return _parse_bytes(arg)
+        if op.startswith("bytec_"):
+            return self.bytec[int(op[6:])]
+        if op == "bytec":
+            return self.bytec[int(arg)]
+        return None
+
+    def _find_entries(self) -> Dict[str, int]:
+        """
+        Locate the router: txna ApplicationArgs 0; <const>; ==; bnz <label>, or from
+        TEAL 8 <const>...; txna ApplicationArgs 0; match <label>...
+        """
+        entries = {}
+        for pc in range(len(self.ops)):
+            if self.ops[pc] != ("txna", "ApplicationArgs 0") or pc + 1 >= len(self.ops):
+                continue
+            op, arg = self.ops[pc + 1]
+            if op == "match":
+                labels = arg.split()
+                for i, label in enumerate(labels):
+                    name = self._bytes(pc - len(labels) + i)
+                    if name is not None:
+                        entries.setdefault(name.decode(), self.labels[label])
+                continue
+            if pc + 3 >= len(self.ops) or self.ops[pc + 2][0] != "==" or self.ops[pc + 3][0] != "bnz":
+                continue
+            name = self._bytes(pc + 1)
+            if name is not None:
+                entries.setdefault(name.decode(), self.labels[self.ops[pc + 3][1]])
+        return entries
+
+    def _targets(self, pc: int) -> List[int]:
+        op, arg = self.ops[pc]
+        if op == "b":
+            return [self.labels[arg]]
+        if op in ("bz", "bnz"):
+            return [self.labels[arg], pc + 1]
+        if op in ("switch", "match"):
+            return [self.labels[l] for l in arg.split()] + [pc + 1]
+        if op in ("return", "retsub", "err"):
+            return []
+        return [pc + 1]
+
+    def _issues_itxn(self, entry: int) -> bool:
+        """
+        Does the subroutine at entry (or anything it calls) touch an inner transaction?
+        """
+        if entry in self._sub_itxn:
+            return self._sub_itxn[entry]
+        # Recursive subroutines (encode_uvarint) see themselves as clean while we look
+        self._sub_itxn[entry] = False
+
+        found = False
+        seen: Set[int] = set()
+        todo = [entry]
+        while todo and not found:
+            pc = todo.pop()
+            if pc in seen or pc >= len(self.ops):
+                continue
+            seen.add(pc)
+            op, arg = self.ops[pc]
+            if op.startswith("itxn_"):
+                found = True
+            elif op == "callsub":
+                found = self._issues_itxn(self.labels[arg])
+            todo.extend(self._targets(pc))
+
+        self._sub_itxn[entry] = found
+        return found
+
+    def _walk(self, entry: int) -> Tuple[Set[Tuple[InnerTxn, ...]], Set[Tuple[InnerTxn, ...]]]:
+        """
+        Every sequence of inner transactions that can be submitted before an approval, and
+        the ones submitted by a single iteration of each loop that submits any
+        """
+        results = set()
+        loops = set()
+        seen = set()
+        # marks: the backward jump targets this path went through, with len(done) at the time
+        todo = [(entry, (), (), None, ())]
+
+        while todo:
+            state = todo.pop()
+            if state in seen:
+                continue
+            seen.add(state)
+            pc, stack, done, cur, marks = state
+
+            if pc >= len(self.ops):
+                results.add(done)
+                continue
+
+            # Targets of backward jumps are either where an If joins up or the head of a
+            # loop.  Arriving again with more inner txns submitted means we went round a
+            # loop, keep that lap and stop there.
+            if pc in self.back_targets:
+                key = (pc, stack)
+                before = next((n for k, n in marks if k == key), None)
+                if before is None:
+                    marks = marks + ((key, len(done)),)
+                elif before < len(done):
+                    loops.add(done[before:])
+                    continue
+
+            op, arg = self.ops[pc]
+
+            if op == "return":
+                if self._int(pc - 1) != 0:
+                    results.add(done)
+                continue
+            if op == "callsub":
+                target = self.labels[arg]
+                if self._issues_itxn(target):
+                    todo.append((target, stack + (pc + 1,), done, cur, marks))
+                else:
+                    todo.append((pc + 1, stack, done, cur, marks))
+                continue
+            if op == "retsub":
+                if stack:
+                    todo.append((stack[-1], stack[:-1], done, cur, marks))
+                continue
+
+            if op == "itxn_begin":
+                cur = ((None, None),)
+            elif op == "itxn_next":
+                cur = cur + ((None, None),)
+            elif op == "itxn_submit":
+                done, cur = done + cur, None
+            elif op == "itxn_field" and cur is not None:
+                ttype, method = cur[-1]
+                if arg == "TypeEnum":
+                    ttype = TXN_TYPES.get(self._int(pc - 1), "?")
+                elif arg == "Type":
+                    value = self._bytes(pc - 1)
+                    ttype = value.decode() if value is not None else "?"
+                elif arg == "ApplicationArgs" and method is None:
+                    value = self._bytes(pc - 1)
+                    method = value.decode() if value is not None else "?"
+                cur = cur[:-1] + ((ttype, method),)
+
+            for target in self._targets(pc):
+                todo.append((target, stack, done, cur, marks))
+
+        return results, loops
+
+    def methods(self) -> List[str]:
+        return list(self.entries.keys())
+
+    def branches(self, method: str) -> List[Branch]:
+        """
+        All the ways `method` can succeed, by the inner transactions it submits
+        """
+        if method in self._branches:
+            return self._branches[method]
+        if method not in self.entries:
+            raise KeyError("{} is not routed by this program".format(method))
+
+        paths, loops = self._walk(self.entries[method])
+
+        branches = set()
+        for calls in paths:
+            for total in self._totals(calls):
+                branches.add(Branch(calls, total))
+
+        self._per_item[method] = max((max(self._totals(body)) for body in loops), default=0)
+        self._branches[method] = sorted(branches, key=lambda b: (b.inner_txns, b.calls))
+        return self._branches[method]
+
+    def _totals(self, calls: Tuple[InnerTxn, ...]) -> Set[int]:
+        totals = {len(calls)}
+        for ttype, m in calls:
+            if ttype == "appl" and m in self.callees:
+                nested = {b.inner_txns for b in self.callees[m].branches(m)}
+                totals = {t + n for t in totals for n in nested}
+        return totals
+
+    def per_item(self, method: str) -> int:
+        """
+        Inner transactions submitted by each iteration of the loops in `method`
+        """
+        self.branches(method)
+        return self._per_item[method]
+
+    def inner_txns(self, method: str, where: Callable[[Branch], bool] = None, items: int = 0) -> int:
+        """
+        Inner transactions to pay for when calling `method`
+
+        With `where` only the matching branches are considered.  If they still disagree
+        the largest count is returned, so the group never under-pays.  `items` is the
+        number of loop iterations, e.g. the number of transfers in a batch.
+        """
+        counts = [b.inner_txns for b in self.branches(method) if where is None or where(b)]
+        if not counts:
+            raise ValueError("no branch of {} matches".format(method))
+        return max(counts) + items * self.per_item(method)
+
+
+def bridge_fee_model(bridge_teal: str, escrow_teal: str) -> FeeModel:
+    """
+    FeeModel of the token bridge, with its inner calls into the escrow expanded
+    """
+    escrow = FeeModel(escrow_teal)
+    return FeeModel(bridge_teal, callees={m: escrow for m in escrow.methods()})
+
+
+class GroupTxn(NamedTuple):
+    model: Optional[FeeModel] = None
+    method: Optional[str] = None
+    where: Optional[Callable[[Branch], bool]] = None
+    lsig: bool = False      # logic sig senders have to carry a zero fee
+    items: int = 0
+
+
+def pooled_fees(group: List[GroupTxn], min_fee: int, payer: int = None) -> List[int]:
+    """
+    The fee to set on each transaction of the group
+
+    Every transaction pays min_fee for itself and for the inner transactions it submits.
+    The share of the logic sig transactions is moved onto `payer`, by default the first
+    transaction that is not a logic sig.  With an explicit payer the whole group fee is
+    put on that one transaction.
+    """
+    shares = []
+    for t in group:
+        inner = t.model.inner_txns(t.method, t.where, t.items) if t.model is not None else 0
+        shares.append(min_fee * (1 + inner))
+
+    if payer is None:
+        payer = next((i for i, t in enumerate(group) if not t.lsig), None)
+        if payer is None:
+            raise ValueError("the group needs at least one transaction that can pay fees")
+        fees = [0 if t.lsig else s for t, s in zip(group, shares)]
+        fees[payer] += sum(s for t, s in zip(group, shares) if t.lsig)
+        return fees
+
+    if group[payer].lsig:
+        raise ValueError("a logic sig transaction cannot pay the group fee")
+    fees = [0] * len(group)
+    fees[payer] = sum(shares)
+    return fees
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("usage: fees.py <bridge approval teal> <escrow approval teal>")
+        sys.exit(1)
+
+    with open(sys.argv[1]) as f:
+        bridge_teal = f.read()
+    with open(sys.argv[2]) as f:
+        escrow_teal = f.read()
+
+    model = bridge_fee_model(bridge_teal, escrow_teal)
+    for method in model.methods():
+        for b in model.branches(method):
+            print("{:20} {:2} {}".format(method, b.inner_txns, " ".join(t if m is None else "{}:{}".format(t, m) for t, m in b.calls)))
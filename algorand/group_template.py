@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+"""
+Transaction groups that are encoded once and patched per use
+
+Like TmplSig.populate does for the lsig bytecode: the group is built once with
+placeholder values in the fields that vary, msgpack encoded, and the byte positions
+of the placeholders recorded.  Filling in a group is then splicing the encoded values
+into those positions, hashing the results for the group id and splicing that in too.
+
+    tmpl = GroupTemplate()
+    sp = SuggestedParams(tmpl.int("fee"), tmpl.int("first"), tmpl.int("last"), gh, flat_fee=True)
+    tmpl.freeze([ApplicationNoOpTxn(sender, sp, app_id, app_args=[b"completeTransfer", tmpl.bytes("vaa")]), ...])
+
+    group = tmpl.fill({"fee": 2000, "first": r, "last": r + 1000, "vaa": raw})
+    signed = sign_raw(group.txns[0], private_key) + ...
+
+The template fixes which fields are present: algosdk leaves out zero and empty
+values, so a slot cannot be filled with either.
+"""
+import base64
+import os
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import msgpack
+from algosdk import encoding
+from algosdk.future import transaction
+from algosdk.future.transaction import LogicSigAccount
+from nacl.signing import SigningKey
+
+
+def _pack(v: Any) -> bytes:
+    return msgpack.packb(v, use_bin_type=True)
+
+
+def _encode(txn: transaction.Transaction) -> bytes:
+    return base64.b64decode(encoding.msgpack_encode(txn))
+
+
+class FilledGroup(NamedTuple):
+    txns: List[bytes]       # the encoded transactions, group id included
+    txids: List[str]
+    group: bytes
+
+
+class _Encoded:
+    """
+    One encoded transaction and where its slots sit in it, sorted by position
+    """
+
+    def __init__(self, raw: bytes, placeholders: Dict[str, bytes]):
+        self.raw = raw
+        self.patches: List[Tuple[int, int, str]] = []
+        for name, p in placeholders.items():
+            pos = raw.find(p)
+            while pos != -1:
+                self.patches.append((pos, len(p), name))
+                pos = raw.find(p, pos + len(p))
+        self.patches.sort()
+
+    def patch(self, values: Dict[str, bytes]) -> bytes:
+        parts = []
+        last = 0
+        for pos, n, name in self.patches:
+            parts.append(self.raw[last:pos])
+            parts.append(values[name])
+            last = pos + n
+        parts.append(self.raw[last:])
+        return b"".join(parts)
+
+
+class GroupTemplate:
+    def __init__(self):
+        self.kinds: Dict[str, str] = {}
+        self.placeholders: Dict[str, Any] = {}
+        self.bare: List[_Encoded] = []
+        self.grouped: List[_Encoded] = []
+
+    def _slot(self, name: str, kind: str, value: Any) -> Any:
+        if name in self.kinds:
+            if self.kinds[name] != kind:
+                raise ValueError("slot {} is already a {}".format(name, self.kinds[name]))
+            return self.placeholders[name]
+        self.kinds[name] = kind
+        self.placeholders[name] = value
+        return value
+
+    def bytes(self, name: str) -> bytes:
+        return self._slot(name, "bytes", os.urandom(32))
+
+    def address(self, name: str) -> str:
+        return self._slot(name, "address", encoding.encode_address(os.urandom(32)))
+
+    def int(self, name: str) -> int:
+        # Top bit set so every placeholder packs as a full uint64
+        return self._slot(name, "int", int.from_bytes(os.urandom(8), "big") | (1 << 63))
+
+    def _packed(self, name: str, value: Any) -> bytes:
+        kind = self.kinds[name]
+        if kind == "address":
+            value = encoding.decode_address(value)
+        if not value:
+            raise ValueError("slot {} cannot be zero or empty".format(name))
+        return _pack(value)
+
+    def freeze(self, txns: List[transaction.Transaction]):
+        """
+        Encode the group built from the slot placeholders, with and without a group id
+        """
+        placeholders = {n: self._packed(n, v) for n, v in self.placeholders.items()}
+        grp = os.urandom(32)
+        placeholders["grp"] = _pack(grp)
+
+        self.bare = []
+        self.grouped = []
+        for txn in txns:
+            txn.group = None
+            self.bare.append(_Encoded(_encode(txn), placeholders))
+            txn.group = grp
+            self.grouped.append(_Encoded(_encode(txn), placeholders))
+
+        used = {name for e in self.bare for _, _, name in e.patches}
+        missing = set(self.kinds) - used
+        if missing:
+            raise ValueError("slots not found in the group: {}".format(", ".join(sorted(missing))))
+
+    def fill(self, values: Dict[str, Any]) -> FilledGroup:
+        packed = {n: self._packed(n, values[n]) for n in self.kinds}
+
+        # The group id hashes the txids of the transactions without one, as assign_group_id does
+        txids = [encoding.checksum(b"TX" + e.patch(packed)) for e in self.bare]
+        group = encoding.checksum(b"TG" + _pack({"txlist": txids}))
+        packed["grp"] = _pack(group)
+
+        txns = [e.patch(packed) for e in self.grouped]
+        return FilledGroup(txns, [txid(t) for t in txns], group)
+
+
+def txid(raw: bytes) -> str:
+    return base64.b32encode(encoding.checksum(b"TX" + raw)).decode().strip("=")
+
+
+def sign_raw(raw: bytes, private_key: str) -> bytes:
+    """
+    The encoded SignedTransaction for an encoded transaction
+    """
+    sig = SigningKey(base64.b64decode(private_key)[:32]).sign(b"TX" + raw).signature
+    return b"\x82" + _pack("sig") + _pack(sig) + _pack("txn") + raw
+
+
+def lsig_prefix(lsig: dict) -> bytes:
+    """
+    Everything of an encoded LogicSigTransaction up to the transaction itself
+    """
+    return b"\x82" + _pack("lsig") + _pack(lsig) + _pack("txn")
+
+
+class LsigSigner:
+    """
+    Encoded LogicSigTransactions, with the lsig part packed once
+    """
+
+    def __init__(self, lsig: LogicSigAccount):
+        self.prefix = lsig_prefix(lsig.lsig.dictify())
+
+    def sign(self, raw: bytes) -> bytes:
+        return self.prefix + raw
+
@@ -1,35 +1,179 @@
 #!/usr/bin/python3
+from typing import List, Union
+
 from pyteal import *
 
+# opcode: (min_version, immediates, stack inputs, stack outputs)
+#
+# Only the opcodes we hand write are listed here.  None means the count depends on
+# an immediate (cover, popn, ...) and is not checked.  Anything not in this table is
+# still accepted, it just gets no validation beyond the min_version the caller gives us.
+OPCODES = {
+    "load":                 (1, ("uint8",), 0, 1),
+    "store":                (1, ("uint8",), 1, 0),
+    "dup":                  (1, (), 1, 2),
+    "dup2":                 (2, (), 2, 4),
+    "swap":                 (3, (), 2, 2),
+    "dig":                  (3, ("uint8",), None, None),
+    "cover":                (5, ("uint8",), None, None),
+    "uncover":              (5, ("uint8",), None, None),
+    "extract":              (5, ("uint8", "uint8"), 1, 1),
+    "extract3":             (5, (), 3, 1),
+    "extract_uint16":       (5, (), 2, 1),
+    "extract_uint32":       (5, (), 2, 1),
+    "extract_uint64":       (5, (), 2, 1),
+    "ecdsa_verify":         (5, ("curve",), 5, 1),
+    "ecdsa_pk_decompress":  (5, ("curve",), 1, 2),
+    "ecdsa_pk_recover":     (5, ("curve",), 4, 2),
+    "replace2":             (7, ("uint8",), 2, 1),
+    "replace3":             (7, (), 3, 1),
+    "bury":                 (8, ("uint8",), 1, 0),
+    "popn":                 (8, ("uint8",), None, 0),
+    "dupn":                 (8, ("uint8",), 1, None),
+    "frame_dig":            (8, ("int8",), 0, 1),
+    "frame_bury":           (8, ("int8",), 1, 0),
+    "box_create":           (8, (), 2, 1),
+    "box_extract":          (8, (), 3, 1),
+    "box_replace":          (8, (), 3, 0),
+    "box_del":              (8, (), 1, 1),
+    "box_len":              (8, (), 1, 2),
+    "box_get":              (8, (), 1, 2),
+    "box_put":              (8, (), 2, 0),
+}
+
+# Which version introduced each curve.  ecdsa_pk_recover only ever takes Secp256k1.
+CURVES = {
+    "Secp256k1": 5,
+    "Secp256r1": 7,
+}
+
+APP_ONLY = {"box_create", "box_extract", "box_replace", "box_del", "box_len", "box_get", "box_put"}
+
 
 class CustomOp():
-    def __init__(self, opcode):
+    def __init__(self, opcode, min_version = 2, mode = Mode.Signature | Mode.Application):
         self.opcode = opcode
-        self.mode = Mode.Signature | Mode.Application
-        self.min_version = 2
+        self.mode = mode
+        self.min_version = min_version
 
 
     def __str__(self) -> str:
         return self.opcode
 
 
+def _immediate_version(opcode: str, kind: str, value: Union[int, str]) -> int:
+    """
+    Check a single immediate against its kind and return the version it needs
+    """
+    if kind == "curve":
+        if value not in CURVES:
+            raise TealInputError("{}: unknown curve {}".format(opcode, value))
+        if opcode == "ecdsa_pk_recover" and value != "Secp256k1":
+            raise TealInputError("{}: only Secp256k1 is supported".format(opcode))
+        return CURVES[value]
+
+    if not isinstance(value, int):
+        raise TealInputError("{}: immediate {} must be an int".format(opcode, value))
+    if kind == "uint8" and not 0 <= value <= 255:
+        raise TealInputError("{}: immediate {} out of range 0-255".format(opcode, value))
+    if kind == "int8" and not -128 <= value <= 127:
+        raise TealInputError("{}: immediate {} out of range -128-127".format(opcode, value))
+    return 0
+
+
 class InlineAssembly(LeafExpr):
-    def __init__(self, opcode: str, *args: "Expr", type: TealType = TealType.none) -> None:
+    """
+    Emit a single hand written opcode
+
+    The immediates can either be passed in the opcode string ("extract 5 1") or with
+    `immediates`.  Known opcodes get their immediates, argument count and output count
+    checked, and the minimum TEAL version is worked out from the opcode and immediates so
+    compileTeal refuses to build them for an older target.
+
+    `type` is the type of the single value the opcode leaves on the stack.  Opcodes that
+    push more than one value must declare `outputs`; the values are then moved into
+    compiler allocated scratch slots (in stack order) and read back with `output(i)` or
+    `outputReducer`.  Because these are ordinary slots the scratch slot optimizer can
+    collapse the store/load pairs back into plain stack use.  Pass `slots` to store them
+    in particular slots instead, e.g. ones with a fixed id.
+    """
+
+    def __init__(self, opcode: str, *args: "Expr", type: TealType = TealType.none,
+                 outputs: List[TealType] = None, immediates: List[Union[int, str]] = None,
+                 min_version: int = None, slots: List[ScratchSlot] = None) -> None:
         super().__init__()
         opcode_with_args = opcode.split(" ")
-        self.op = CustomOp(opcode_with_args[0])
-        self.type = type
-        self.opcode_args = opcode_with_args[1:]
+        self.opcode = opcode_with_args[0]
         self.args = args
 
+        if immediates is None:
+            immediates = [int(i) if i.lstrip("-").isdigit() else i for i in opcode_with_args[1:]]
+        self.opcode_args = list(immediates)
+
+        if outputs is None:
+            outputs = [] if type == TealType.none else [type]
+        self.outputs = list(outputs)
+
+        version = 2
+        if self.opcode in OPCODES:
+            version, kinds, pops, pushes = OPCODES[self.opcode]
+            if len(self.opcode_args) != len(kinds):
+                raise TealInputError("{} expects {} immediates, got {}".format(self.opcode, len(kinds), len(self.opcode_args)))
+            for kind, value in zip(kinds, self.opcode_args):
+                version = max(version, _immediate_version(self.opcode, kind, value))
+            if pops is not None and len(self.args) != pops:
+                raise TealInputError("{} expects {} arguments, got {}".format(self.opcode, pops, len(self.args)))
+            if pushes is not None and len(self.outputs) != pushes:
+                raise TealInputError("{} pushes {} values, got {} outputs".format(self.opcode, pushes, len(self.outputs)))
+        if min_version is not None:
+            version = max(version, min_version)
+
+        mode = Mode.Application if self.opcode in APP_ONLY else Mode.Signature | Mode.Application
+        self.op = CustomOp(self.opcode, version, mode)
+
+        if slots is not None and len(slots) != len(self.outputs):
+            raise TealInputError("{} has {} outputs, got {} slots".format(self.opcode, len(self.outputs), len(slots)))
+        if len(self.outputs) > 1:
+            self.type = TealType.none
+            self.output_slots = list(slots) if slots is not None else [ScratchSlot() for _ in self.outputs]
+        else:
+            self.type = self.outputs[0] if self.outputs else TealType.none
+            self.output_slots = []
+
 
     def __teal__(self, options: "CompileOptions"):
+        if options.version < self.op.min_version:
+            raise TealInputError("{} needs TEAL version {}, compiling for {}".format(
+                self, self.op.min_version, options.version))
+
         op = TealOp(self, self.op, *self.opcode_args)
-        return TealBlock.FromOp(options, op, *self.args[::1])
+        start, end = TealBlock.FromOp(options, op, *self.args[::1])
+
+        # The last output is on top of the stack
+        for slot in reversed(self.output_slots):
+            storeStart, storeEnd = slot.store().__teal__(options)
+            end.setNextBlock(storeStart)
+            end = storeEnd
+
+        return start, end
+
+
+    def output(self, i: int) -> ScratchLoad:
+        """
+        Load the i-th output of a multi output opcode (0 is deepest on the stack)
+        """
+        return self.output_slots[i].load(self.outputs[i])
+
+
+    def outputReducer(self, reducer) -> Expr:
+        """
+        Run the opcode and hand its outputs to reducer, same as MultiValue.outputReducer
+        """
+        return Seq(self, reducer(*[self.output(i) for i in range(len(self.output_slots))]))
 
 
     def __str__(self):
-        return "(InlineAssembly: {})".format(self.opcode)
+        return "(InlineAssembly: {})".format(" ".join([self.opcode] + [str(a) for a in self.opcode_args]))
 
 
     def type_of(self):
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+"""
+In memory stand-in for algod, for running the host tooling offline
+
+It implements the same async interface the relayer uses against a real node:
+
+    suggested_params()                  -> SuggestedParams
+    local_state(address, app_id)        -> decoded local state, None if not opted in
+    global_state(app_id)                -> decoded global state
+    send_group(signed)                  -> txid of the first transaction
+    send_raw_group(raw)                 -> the same for already encoded signed transactions
+
+Submitted groups are recorded in `sent` and nothing is executed.  Tests set up the
+state they need with `opt_in`, `set_local` and `set_global`, and record confirmed app
+calls for the indexer side with `confirm`.
+"""
+import asyncio
+import base64
+import io
+from typing import Dict, List, Optional, Union
+
+import msgpack
+from algosdk.future import transaction
+
+from group_template import txid
+from local_state import max_keys, page_size
+
+
+class LocalAlgod:
+    def __init__(self, min_fee: int = 1000, round: int = 1000, latency: float = 0.0):
+        self.min_fee = min_fee
+        self.round = round
+        self.latency = latency
+        self.locals: Dict[tuple, Dict[bytes, Union[bytes, int]]] = {}
+        self.updated: Dict[tuple, int] = {}         # (address, app_id) -> round of the last change
+        self.globals: Dict[int, Dict[bytes, Union[bytes, int]]] = {}
+        self.sent: List[list] = []
+        self.confirmed: List[dict] = []             # app calls, the way the indexer returns them
+        self.calls: Dict[str, int] = {}
+
+    async def _call(self, name: str):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def opt_in(self, address: str, app_id: int):
+        """
+        Opt an account in with a zeroed blob, as the bridge's optin does
+        """
+        self.locals[(address, app_id)] = {bytes([i]): bytes(page_size) for i in range(max_keys)}
+        self.updated[(address, app_id)] = self.round
+
+    def set_local(self, address: str, app_id: int, key: bytes, value: Union[bytes, int]):
+        self.locals.setdefault((address, app_id), {})[key] = value
+        self.updated[(address, app_id)] = self.round
+
+    def set_global(self, app_id: int, key: bytes, value: Union[bytes, int]):
+        self.globals.setdefault(app_id, {})[key] = value
+
+    def confirm(self, sender: str, app_id: int, args: List[bytes], accounts: List[str] = ()):
+        """
+        Record an app call as confirmed in the current round
+        """
+        self.confirmed.append({
+            "sender": sender,
+            "confirmed-round": self.round,
+            "application-transaction": {
+                "application-id": app_id,
+                "application-args": [base64.b64encode(a).decode() for a in args],
+                "accounts": list(accounts),
+            },
+        })
+
+    async def suggested_params(self) -> transaction.SuggestedParams:
+        await self._call("suggested_params")
+        return transaction.SuggestedParams(
+            fee=self.min_fee, first=self.round, last=self.round + 1000,
+            gh="SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI=", gen="sandnet-v1",
+            flat_fee=True, min_fee=self.min_fee,
+        )
+
+    async def local_state(self, address: str, app_id: int) -> Optional[Dict[bytes, Union[bytes, int]]]:
+        await self._call("local_state")
+        state = self.locals.get((address, app_id))
+        return dict(state) if state is not None else None
+
+    async def global_state(self, app_id: int) -> Dict[bytes, Union[bytes, int]]:
+        await self._call("global_state")
+        return dict(self.globals.get(app_id, {}))
+
+    async def send_group(self, signed: list) -> str:
+        await self._call("send_group")
+        self.sent.append(signed)
+        return signed[0].get_txid()
+
+    async def send_raw_group(self, raw: bytes) -> str:
+        await self._call("send_raw_group")
+        signed = list(msgpack.Unpacker(io.BytesIO(raw), raw=False))
+        self.sent.append(signed)
+        return txid(msgpack.packb(signed[0]["txn"], use_bin_type=True))
@@ -24,6 +24,8 @@ from pyteal import (
     TealType,
 )
 
+from inlineasm import InlineAssembly
+
 _max_keys = 15
 _page_size = 128 - 1  # need 1 byte for key
 _max_bytes = _max_keys * _page_size
@@ -51,6 +53,13 @@ class LocalBlob:
     The `zero` method must be called on an account on opt in and the schema of the local storage should be 16 bytes
     """
 
+    def __init__(self, version: int = 6):
+        # From TEAL 7 a partial page is written with replace3 rather than cut up and
+        # concatenated, and a read within one page is a single extract3
+        if version >= 7:
+            self.write = write_replace
+            self.read = read_extract
+
     @staticmethod
     @Subroutine(TealType.none)
     def zero(acct: Expr) -> Expr:
@@ -153,60 +162,94 @@ class LocalBlob:
         """
         write bytes between bstart and len(buff) to local storage of an account
         """
+        return _write(
+            acct,
+            bstart,
+            buff,
+            lambda page, start, stop, chunk: Concat(
+                Substring(page, Int(0), start),
+                chunk,
+                Substring(page, stop, page_size),
+            ),
+        )
 
-        start_key, start_offset = _key_and_offset(bstart)
-        stop_key, stop_offset = _key_and_offset(bstart + Len(buff))
 
-        key = ScratchVar()
-        start = ScratchVar()
-        stop = ScratchVar()
-        written = ScratchVar()
-
-        init = key.store(start_key)
-        cond = key.load() <= stop_key
-        incr = key.store(key.load() + Int(1))
+@Subroutine(TealType.uint64)
+def write_replace(acct: Expr, bstart: Expr, buff: Expr) -> Expr:
+    """
+    LocalBlob.write for TEAL 7 and up
+    """
+    return _write(
+        acct,
+        bstart,
+        buff,
+        lambda page, start, stop, chunk: InlineAssembly(
+            "replace3", page, start, chunk, type=TealType.bytes
+        ),
+    )
 
-        delta = ScratchVar()
 
-        return Seq(
-            written.store(Int(0)),
-            For(init, cond, incr).Do(
-                Seq(
-                    start.store(If(key.load() == start_key, start_offset, Int(0))),
-                    stop.store(If(key.load() == stop_key, stop_offset, page_size)),
-                    App.localPut(
-                        acct,
-                        intkey(key.load()),
-                        If(
-                            Or(stop.load() != page_size, start.load() != Int(0))
-                        )  # Its a partial write
-                        .Then(
-                            Seq(
-                                delta.store(stop.load() - start.load()),
-                                Concat(
-                                    Substring(
-                                        App.localGet(acct, intkey(key.load())),
-                                        Int(0),
-                                        start.load(),
-                                    ),
-                                    Extract(buff, written.load(), delta.load()),
-                                    Substring(
-                                        App.localGet(acct, intkey(key.load())),
-                                        stop.load(),
-                                        page_size,
-                                    ),
-                                ),
-                            )
+@Subroutine(TealType.bytes)
+def read_extract(acct: Expr, bstart: Expr, bend: Expr) -> Expr:
+    """
+    LocalBlob.read for TEAL 7 and up
+    """
+    start_key, start_offset = _key_and_offset(bstart)
+    return If(
+        start_key == (bend - Int(1)) / page_size,
+        Extract(App.localGet(acct, intkey(start_key)), start_offset, bend - bstart),
+        LocalBlob.read(acct, bstart, bend),
+    )
+
+
+def _write(acct: Expr, bstart: Expr, buff: Expr, splice) -> Expr:
+    # splice(page, start, stop, chunk) puts chunk over page[start:stop]
+    start_key, start_offset = _key_and_offset(bstart)
+    stop_key, stop_offset = _key_and_offset(bstart + Len(buff))
+
+    key = ScratchVar()
+    start = ScratchVar()
+    stop = ScratchVar()
+    written = ScratchVar()
+
+    init = key.store(start_key)
+    cond = key.load() <= stop_key
+    incr = key.store(key.load() + Int(1))
+
+    delta = ScratchVar()
+
+    return Seq(
+        written.store(Int(0)),
+        For(init, cond, incr).Do(
+            Seq(
+                start.store(If(key.load() == start_key, start_offset, Int(0))),
+                stop.store(If(key.load() == stop_key, stop_offset, page_size)),
+                App.localPut(
+                    acct,
+                    intkey(key.load()),
+                    If(
+                        Or(stop.load() != page_size, start.load() != Int(0))
+                    )  # Its a partial write
+                    .Then(
+                        Seq(
+                            delta.store(stop.load() - start.load()),
+                            splice(
+                                App.localGet(acct, intkey(key.load())),
+                                start.load(),
+                                stop.load(),
+                                Extract(buff, written.load(), delta.load()),
+                            ),
+                        )
+                    )
+                    .Else(
+                        Seq(
+                            delta.store(page_size),
+                            Extract(buff, written.load(), page_size),
                         )
-                        .Else(
-                            Seq(
-                                delta.store(page_size),
-                                Extract(buff, written.load(), page_size),
-                            )
-                        ),
                     ),
-                    written.store(written.load() + delta.load()),
-                )
-            ),
-            written.load(),
-        )
+                ),
+                written.store(written.load() + delta.load()),
+            )
+        ),
+        written.load(),
+    )
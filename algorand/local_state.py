@@ -0,0 +1,128 @@
+#!/usr/bin/python3
+"""
+Host side view of the LocalBlob layout
+
+The blob is 15 keys (the single bytes 0x00-0x0e) of 127 bytes each, read as one
+1905 byte string.  The token bridge keeps two kinds of blobs:
+
+    replay bitmaps, one per (emitter, sequence / max_bits), bit n set once sequence n is redeemed
+    asset records, keyed on (asset id, "native")
+
+receiveAttest also writes (origin chain, origin address) blobs, which only hold the
+wrapped asa id at 0-8 followed by the attestation body, or with the bridge built
+without full_attest the keccak256 of the body at 8-40 and the origin address and chain
+at 60-94, where they are in the body.
+"""
+from base64 import b64decode
+from typing import Dict, List, NamedTuple, Optional
+
+max_keys = 15
+page_size = 127
+max_bytes = max_keys * page_size
+max_bits = max_bytes * 8
+
+# Bridge global state key prefix of a registered emitter, "Chain" + chain id (2 bytes).
+# The value is the emitter address, followed by the emitter's replay low water mark
+# (8 bytes, the first block that has not been retired) once a block was retired
+chain_prefix = b"Chain"
+
+
+def decode_local_state(key_value: List[dict]) -> Dict[bytes, bytes]:
+    """
+    The key-value list algod returns for an account's local state, with the keys and
+    byte values decoded (uint values are kept as ints)
+    """
+    state = {}
+    for kv in key_value:
+        v = kv["value"]
+        state[b64decode(kv["key"])] = b64decode(v["bytes"]) if v["type"] == 1 else v["uint"]
+    return state
+
+
+def blob_bytes(state: Dict[bytes, bytes]) -> bytes:
+    """
+    Join the pages back together, missing pages read as zero like after LocalBlob.zero
+    """
+    return b"".join(state.get(bytes([i]), bytes(page_size)) for i in range(max_keys))
+
+
+def low_marks(state: Dict[bytes, bytes]) -> Dict[bytes, int]:
+    """
+    The replay low water marks in the bridge's decoded global state, by registered
+    emitter (0 until a block of it is retired)
+    """
+    return {k[len(chain_prefix):] + v[:32]: int.from_bytes(v[32:], "big") for k, v in state.items()
+            if k.startswith(chain_prefix) and len(k) == len(chain_prefix) + 2 and isinstance(v, bytes) and len(v) in (32, 40)}
+
+
+def chain_value(address: bytes, low: int = 0) -> bytes:
+    """
+    The "Chain" global of a registered emitter address with low water mark `low`
+    """
+    return address + low.to_bytes(8, "big") if low else address
+
+
+def replay_block(sequence: int) -> int:
+    """
+    acct_seq_start of the bitmap account holding `sequence`
+    """
+    return sequence // max_bits
+
+
+def is_redeemed(blob: bytes, sequence: int) -> bool:
+    """
+    checkForDuplicate's bit for `sequence` (GetBit on the byte as a uint64, so bit 0 is the lsb)
+    """
+    return (blob[(sequence // 8) % max_bytes] >> (sequence % 8)) & 1 == 1
+
+
+class AssetRecord(NamedTuple):
+    asset: int              # 0-8   asa id (foreign records point at the wrapped asa)
+    native: int             # 116-124  the asa id if the asset is native to Algorand, else 0
+    max_amount: int         # 124-132
+    min_amount: int         # 132-140
+    origin_address: bytes   # 140-172  foreign assets only
+    origin_chain: int       # 172-174  foreign assets only
+    transfer_fee: int       # 174-182
+    redeem_fee: int         # 182-190
+    escrow: int             # 190-198  escrow app id
+    source_fee: int         # 198-199
+    dest_fee: int           # 199-200
+    scale_decimals: int     # 200      the asa's decimals + 1, 0 in records from before it was stored
+    scale: int              # 201-209  10^|decimals - 8|
+    version: int            # 2 if the bridge reads the packed copy at 254-356, else 1
+
+
+def _u(blob: bytes, start: int, end: int) -> int:
+    return int.from_bytes(blob[start:end], "big")
+
+
+def decode_asset(blob: bytes) -> Optional[AssetRecord]:
+    """
+    The asset record in a blob, None for a blob nothing has been written to
+
+    Version 2 records also keep a packed copy of 116-209 and 0-8 at 255-356 behind a
+    version byte at 254.  That copy is what the bridge reads, so it is decoded instead.
+    """
+    version = 1
+    if blob[254] == 2:
+        version = 2
+        blob = blob[348:356] + bytes(108) + blob[255:348]
+    if not any(blob[:200]):
+        return None
+    return AssetRecord(
+        asset=_u(blob, 0, 8),
+        native=_u(blob, 116, 124),
+        max_amount=_u(blob, 124, 132),
+        min_amount=_u(blob, 132, 140),
+        origin_address=blob[140:172],
+        origin_chain=_u(blob, 172, 174),
+        transfer_fee=_u(blob, 174, 182),
+        redeem_fee=_u(blob, 182, 190),
+        escrow=_u(blob, 190, 198),
+        source_fee=_u(blob, 198, 199),
+        dest_fee=_u(blob, 199, 200),
+        scale_decimals=_u(blob, 200, 201),
+        scale=_u(blob, 201, 209),
+        version=version,
+    )
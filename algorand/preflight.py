@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+"""
+completeTransfer's checks, on the host, for a whole batch of VAAs at once
+
+Every check the contract makes on the VAA and the bridge's state is replayed here in
+the contract's order, so a VAA that fails gets the name of the first rule it breaks:
+
+    paused          onPaused is set
+    length          too short to hold a transfer
+    version         VM version byte != 1 (checkForDuplicate)
+    retired         the sequence's block is below the emitter's low water mark
+    duplicate       the replay bit is already set
+    emitter         not the registered emitter of its chain (us, for chain 8)
+    action          not a transfer (1) or transfer with payload (3)
+    amount_high     top 24 bytes of the uint256 amount not zero
+    fee_high        top 24 bytes of the uint256 fee not zero
+    dest_chain      DestChain != 8
+    fee             Fee > Amount
+    asset           no storage record for the asset, or a foreign asset never attested
+    decimals        more than 19 decimals
+    normalize       scaling to the asa's decimals overflows a uint64
+    token_max       above the asset's max (checkTokenMax)
+    bridge_fee      amount * fee rate overflows, or the fee is more than the amount
+
+The receiving app call of a payload 3 transfer is part of the group and not checked.
+
+The batch is decoded into columns once and each rule is one pass over the columns
+still alive, the same shape numpy would give without making it a dependency.
+"""
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from local_state import AssetRecord, is_redeemed, replay_block
+
+ALGORAND_CHAIN = 8
+MAX_UINT64 = (1 << 64) - 1
+FEE_SCALE = 10000000000
+
+
+class BridgeState(NamedTuple):
+    paused: bool
+    bridge_address: bytes                           # 32 bytes, the emitter for chain 8
+    emitters: Set[bytes]                            # registered 34 byte chain + address
+    redeemed: Callable[[bytes, int], bool]          # (emitter, sequence) -> replay bit
+    assets: Dict[int, AssetRecord]                  # asa id -> record in its (asa, "native") storage
+    wrapped: Dict[Tuple[int, bytes], int]           # (origin chain, origin address) -> wrapped asa
+    decimals: Dict[int, int]                        # asa id -> decimals, algo is 6, for records without them
+    lows: Dict[bytes, int] = {}                     # emitter -> replay low water mark, missing is 0
+
+
+class Verdict(NamedTuple):
+    ok: bool
+    rule: Optional[str]         # the first rule broken
+    asset: int = 0
+    amount: int = 0             # what the destination gets, in the asa's units
+    fee: int = 0                # the relayer fee, in the asa's units
+    bridge_fee: int = 0
+
+
+def _u(raw: bytes, start: int, n: int) -> int:
+    return int.from_bytes(raw[start:start + n], "big")
+
+
+def normalized(dec: int, amount: int, fee: int) -> Tuple[int, int]:
+    """
+    normalizedAmount, the 8 decimal wormhole amount in the asa's decimals
+    """
+    if dec < 9:
+        d = 10 ** (8 - dec)
+        return amount // d, fee // d
+    d = 10 ** (dec - 8)
+    return amount * d, fee * d
+
+
+def bridge_fee_rate(record: AssetRecord) -> int:
+    """
+    calculateBridgeFee's rate for a redeem, in 1e-10 units
+    """
+    if record.dest_fee == 1 or (record.source_fee == 0 and record.dest_fee == 0):
+        return record.redeem_fee
+    return 0
+
+
+def check(raws: List[bytes], state: BridgeState) -> List[Verdict]:
+    n = len(raws)
+    failed: List[Optional[str]] = [None] * n
+    alive = list(range(n))
+
+    def rule(name: str, bad: Callable[[int], bool]):
+        nonlocal alive
+        keep = []
+        for i in alive:
+            if bad(i):
+                failed[i] = name
+            else:
+                keep.append(i)
+        alive = keep
+
+    if state.paused:
+        return [Verdict(False, "paused")] * n
+
+    body = [6 + r[5] * 66 if len(r) > 5 else 0 for r in raws]
+    rule("length", lambda i: body[i] == 0 or len(raws[i]) < body[i] + 51 + 133)
+    rule("version", lambda i: raws[i][0] != 1)
+
+    emitter = {i: raws[i][body[i] + 8:body[i] + 42] for i in alive}
+    sequence = {i: _u(raws[i], body[i] + 42, 8) for i in alive}
+    p = {i: body[i] + 51 for i in alive}
+
+    rule("retired", lambda i: replay_block(sequence[i]) < state.lows.get(emitter[i], 0))
+    rule("duplicate", lambda i: state.redeemed(emitter[i], sequence[i]))
+    rule("emitter", lambda i: emitter[i] != ALGORAND_CHAIN.to_bytes(2, "big") + state.bridge_address
+         if emitter[i][:2] == ALGORAND_CHAIN.to_bytes(2, "big") else emitter[i] not in state.emitters)
+    rule("action", lambda i: raws[i][p[i]] not in (1, 3))
+    rule("amount_high", lambda i: any(raws[i][p[i] + 1:p[i] + 25]))
+    rule("fee_high", lambda i: any(raws[i][p[i] + 101:p[i] + 125]))
+    rule("dest_chain", lambda i: _u(raws[i], p[i] + 99, 2) != ALGORAND_CHAIN)
+
+    amount = {i: _u(raws[i], p[i] + 25, 8) for i in alive}
+    fee = {i: _u(raws[i], p[i] + 125, 8) for i in alive}
+    rule("fee", lambda i: fee[i] > amount[i])
+
+    asset = {}
+    for i in alive:
+        origin_chain = _u(raws[i], p[i] + 65, 2)
+        if origin_chain == ALGORAND_CHAIN:
+            asset[i] = _u(raws[i], p[i] + 57, 8)
+        else:
+            asset[i] = state.wrapped.get((origin_chain, raws[i][p[i] + 33:p[i] + 65]), 0)
+            if asset[i] == 0:
+                asset[i] = None
+    rule("asset", lambda i: asset[i] is None or asset[i] not in state.assets)
+
+    # The record's stored decimals first, like loadScale
+    dec = {i: state.assets[asset[i]].scale_decimals - 1 if state.assets[asset[i]].scale_decimals else
+           6 if asset[i] == 0 else state.decimals.get(asset[i], 0) for i in alive}
+    rule("decimals", lambda i: dec[i] > 19)
+
+    for i in alive:
+        amount[i], fee[i] = normalized(dec[i], amount[i], fee[i])
+    rule("normalize", lambda i: amount[i] > MAX_UINT64 or fee[i] > MAX_UINT64)
+
+    record = {i: state.assets[asset[i]] for i in alive}
+    rule("token_max", lambda i: record[i].max_amount > 0 and amount[i] > record[i].max_amount)
+
+    bfee = {i: amount[i] * bridge_fee_rate(record[i]) for i in alive}
+    rule("bridge_fee", lambda i: bfee[i] > MAX_UINT64 or bfee[i] // FEE_SCALE > amount[i])
+
+    out = [Verdict(False, failed[i]) for i in range(n)]
+    for i in alive:
+        b = bfee[i] // FEE_SCALE
+        out[i] = Verdict(True, None, asset[i], amount[i] - b, fee[i], b)
+    return out
+
+
+def index_redeemed(index, tmpl_sig, bridge_id: int, bridge_address: str) -> Callable[[bytes, int], bool]:
+    """
+    A `redeemed` lookup over a state_index.StateIndex snapshot
+    """
+    blobs: Dict[Tuple[bytes, int], Optional[bytes]] = {}
+
+    def redeemed(emitter: bytes, sequence: int) -> bool:
+        key = (emitter, replay_block(sequence))
+        if key not in blobs:
+            blobs[key] = index.blob(tmpl_sig.get_sig_address(key[1], emitter, bridge_id, bridge_address))
+        blob = blobs[key]
+        return blob is not None and is_redeemed(blob, sequence)
+
+    return redeemed
@@ -0,0 +1,147 @@
+#!/usr/bin/python3
+"""
+Opting in replay bitmap accounts before they are needed
+
+checkForDuplicate wants the lsig for (sequence / max_bits, emitter) in accounts[1], so
+the first VAA of every max_bits block has to wait for a seed payment + optin group
+first.  The provisioner watches the sequences each emitter produces, estimates its
+rate, and opts in the next block account once the boundary is less than `horizon`
+seconds (or `margin` sequences) away.  Blocks below an emitter's low water mark are
+retired and never funded.
+
+    prov = ReplayProvisioner(algod, TmplSig("sig"), bridge_id, sender, key, seed_amt, emitters)
+    asyncio.create_task(prov.run(stop))
+    ...
+    prov.observe(vaa.emitter, vaa.sequence)
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+from algosdk.future import transaction
+from algosdk.future.transaction import LogicSigAccount
+from algosdk.logic import get_application_address
+
+from local_state import low_marks, max_bits, replay_block
+from TmplSig import TmplSig
+
+log = logging.getLogger("provision")
+
+
+def optin_group(sp: transaction.SuggestedParams, sender: str, lsig: LogicSigAccount, bridge_id: int, seed_amt: int) -> List[transaction.Transaction]:
+    """
+    Fund and opt in a storage account, the seed payment pays for the lsig's fee
+    """
+    pay = transaction.PaymentTxn(sender, sp, lsig.address(), seed_amt)
+    pay.fee = 2 * sp.min_fee
+    optin = transaction.ApplicationOptInTxn(lsig.address(), sp, bridge_id, rekey_to=get_application_address(bridge_id))
+    optin.fee = 0
+    txns = [pay, optin]
+    transaction.assign_group_id(txns)
+    return txns
+
+
+class Rate(NamedTuple):
+    sequence: int
+    at: float
+    per_second: float       # 0 until two sequences have been seen
+
+
+class ReplayProvisioner:
+    def __init__(self, algod, tmpl_sig: TmplSig, bridge_id: int, sender: str, private_key: str, seed_amt: int,
+                 emitters: Iterable[bytes] = (), horizon: float = 600.0, margin: int = 64, interval: float = 10.0,
+                 smoothing: float = 0.2):
+        self.algod = algod
+        self.tmpl_sig = tmpl_sig
+        self.bridge_id = bridge_id
+        self.bridge_addr = get_application_address(bridge_id)
+        self.sender = sender
+        self.private_key = private_key
+        self.seed_amt = seed_amt
+        self.horizon = horizon
+        self.margin = margin
+        self.interval = interval
+        self.smoothing = smoothing
+
+        self.rates: Dict[bytes, Optional[Rate]] = {e: None for e in emitters}
+        # (emitter, block) that are known to be opted in, or have an optin on the way
+        self.ready: Set[Tuple[bytes, int]] = set()
+
+    def observe(self, emitter: bytes, sequence: int, at: float = None):
+        """
+        Record a sequence seen for an emitter, out of order sequences only count if new
+        """
+        at = time.monotonic() if at is None else at
+        prev = self.rates.get(emitter)
+        if prev is None:
+            self.rates[emitter] = Rate(sequence, at, 0.0)
+            return
+        if sequence <= prev.sequence:
+            return
+        if at <= prev.at:
+            self.rates[emitter] = Rate(sequence, prev.at, prev.per_second)
+            return
+
+        inst = (sequence - prev.sequence) / (at - prev.at)
+        rate = inst if prev.per_second == 0 else self.smoothing * inst + (1 - self.smoothing) * prev.per_second
+        self.rates[emitter] = Rate(sequence, at, rate)
+
+    def due(self, now: float = None, lows: Dict[bytes, int] = None) -> List[Tuple[bytes, int]]:
+        """
+        The (emitter, block) accounts that should exist by now, none below the low water marks
+        """
+        now = time.monotonic() if now is None else now
+        lows = lows or {}
+        out = []
+        for emitter, r in self.rates.items():
+            if r is None:
+                continue
+            # Where the emitter probably is by now
+            seq = r.sequence + int(r.per_second * max(0.0, now - r.at))
+            block = replay_block(seq)
+            out.append((emitter, block))
+
+            left = (block + 1) * max_bits - seq
+            if left <= self.margin or (r.per_second > 0 and left / r.per_second <= self.horizon):
+                out.append((emitter, block + 1))
+        return [d for d in out if d not in self.ready and d[1] >= lows.get(d[0], 0)]
+
+    async def provision(self, emitter: bytes, block: int) -> Optional[str]:
+        """
+        Opt in the account for (emitter, block) unless it already is, the txid if one was sent
+        """
+        lsig = self.tmpl_sig.get_sig_account(block, emitter, self.bridge_id, self.bridge_addr)
+        if await self.algod.local_state(lsig.address(), self.bridge_id) is not None:
+            self.ready.add((emitter, block))
+            return None
+
+        sp = await self.algod.suggested_params()
+        sp.flat_fee = True
+        pay, optin = optin_group(sp, self.sender, lsig, self.bridge_id, self.seed_amt)
+        txid = await self.algod.send_group([pay.sign(self.private_key), transaction.LogicSigTransaction(optin, lsig)])
+        self.ready.add((emitter, block))
+        log.info("opted in block %d of %s: %s", block, emitter.hex(), txid)
+        return txid
+
+    async def tick(self, now: float = None) -> List[str]:
+        txids = []
+        lows = low_marks(await self.algod.global_state(self.bridge_id))
+        for emitter, block in self.due(now, lows):
+            try:
+                txid = await self.provision(emitter, block)
+            except Exception:
+                # Left out of ready, so the next tick tries again
+                log.exception("provisioning block %d of %s", block, emitter.hex())
+                continue
+            if txid is not None:
+                txids.append(txid)
+        return txids
+
+    async def run(self, stop: asyncio.Event):
+        while not stop.is_set():
+            await self.tick()
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,549 @@
+#!/usr/bin/python3
+"""
+Streaming relayer: raw VAAs in, submitted completeTransfer groups out
+
+    decode -> duplicate -> verify -> derive -> assemble -> sign -> submit
+
+Every stage runs `workers` tasks pulling from a bounded queue and pushing into the next
+one, so a slow stage (submission, signature checks) holds back the stages in front of
+it rather than letting work pile up in memory.  A stage drops an item by returning None.
+CPU bound work (ecrecover) goes to an executor so it doesn't stall the event loop.
+ecrecover needs coincurve and pycryptodomex, see requirements.txt.
+
+The algod only needs the async interface of algod_async, local_algod.LocalAlgod is the
+offline stand-in:
+
+    algod = LocalAlgod()
+    redeemer = BridgeRedeemer(algod, TmplSig("sig"), bridge_id, core_id, sender, key, vaa_verify, seed_amt, fee_model)
+    stats = asyncio.run(Pipeline(redeemer.stages()).run(vaas))
+
+A stage with `batch` set gets a list of up to that many queued items at once and
+returns one result per item.
+
+Plain transfers are assembled from a group_template.GroupTemplate per group shape
+(verification steps, asset or algo), payload 3 transfers from transaction objects
+since the receiving app's call is built by the caller.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from algosdk.encoding import encode_address
+from algosdk.future import transaction
+from algosdk.future.transaction import LogicSigAccount
+from algosdk.logic import get_application_address
+
+from batch_sign import BatchSigner, program
+from emitter_registry import EmitterRegistry
+from fees import Branch, FeeModel, GroupTxn, pooled_fees
+from globals import MAX_SIGNATURES_PER_VERIFICATION_STEP
+from group_template import FilledGroup, GroupTemplate, LsigSigner, sign_raw
+from local_state import blob_bytes, decode_asset, is_redeemed, low_marks, replay_block
+from preflight import BridgeState, bridge_fee_rate, check
+from provision import ReplayProvisioner, optin_group
+from TmplSig import TmplSig
+from vaa import VAA, Transfer, parse_transfer, parse_vaa
+
+log = logging.getLogger("relayer")
+
+ALGORAND_CHAIN = 8
+
+
+class Stage(NamedTuple):
+    name: str
+    fn: Callable[[Any], Awaitable[Any]]     # returns None to drop the item
+    workers: int = 1
+    batch: int = 0                          # fn takes a list of items and returns a list of results
+
+
+class Pipeline:
+    def __init__(self, stages: List[Stage], queue_size: int = 256):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    async def _worker(self, stage: Stage, inq: asyncio.Queue, outq: Optional[asyncio.Queue]):
+        stats = self.stats[stage.name]
+        while True:
+            items = [await inq.get()]
+            while len(items) < stage.batch and not inq.empty():
+                items.append(inq.get_nowait())
+            stats["in"] += len(items)
+            try:
+                outs = await stage.fn(items) if stage.batch else [await stage.fn(items[0])]
+            except Exception:
+                log.exception("%s failed", stage.name)
+                stats["failed"] += len(items)
+                outs = [None] * len(items)
+            for out in outs:
+                if out is None:
+                    stats["dropped"] += 1
+                else:
+                    stats["out"] += 1
+                    if outq is not None:
+                        await outq.put(out)
+            for _ in items:
+                inq.task_done()
+
+    async def run(self, source: Iterable) -> Dict[str, Dict[str, int]]:
+        """
+        Push everything from source (iterable or async iterable) through the stages and
+        return the per stage counters once the last item has left the last stage
+        """
+        self.stats = {s.name: {"in": 0, "out": 0, "dropped": 0, "failed": 0} for s in self.stages}
+        queues = [asyncio.Queue(self.queue_size) for _ in self.stages]
+
+        workers = []
+        for i, stage in enumerate(self.stages):
+            outq = queues[i + 1] if i + 1 < len(queues) else None
+            workers += [asyncio.create_task(self._worker(stage, queues[i], outq)) for _ in range(stage.workers)]
+
+        try:
+            if hasattr(source, "__aiter__"):
+                async for item in source:
+                    await queues[0].put(item)
+            else:
+                for item in source:
+                    await queues[0].put(item)
+
+            # Each queue is only drained once everything before it is
+            for q in queues:
+                await q.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        return self.stats
+
+
+def recover_guardian(digest: bytes, sig: bytes) -> bytes:
+    """
+    The ethereum style address (last 20 bytes of keccak(pubkey)) that produced the 65 byte r/s/v signature
+    """
+    from coincurve import PublicKey
+    from Cryptodome.Hash import keccak
+
+    pub = PublicKey.from_signature_and_message(sig, digest, hasher=None).format(compressed=False)[1:]
+    return keccak.new(digest_bits=256, data=pub).digest()[12:]
+
+
+def check_signatures(vaa: VAA, keys: List[bytes], recover: Callable[[bytes, bytes], bytes] = recover_guardian) -> bool:
+    """
+    Quorum, ascending guardian indexes and every signature matching its guardian key
+    """
+    if vaa.num_sigs < len(keys) * 2 // 3 + 1:
+        return False
+
+    digest = vaa.digest()
+    sigs = vaa.signatures
+    last = -1
+    for i in range(vaa.num_sigs):
+        sig = sigs[i * 66:(i + 1) * 66]
+        index = sig[0]
+        if index <= last or index >= len(keys):
+            return False
+        if recover(digest, sig[1:66]) != keys[index]:
+            return False
+        last = index
+    return True
+
+
+def completion_where(payout: bool, bfee: bool, fee: bool) -> Callable[[Branch], bool]:
+    """
+    The completeTransfer branch that runs: one payout call paying the treasury, the
+    receiver and the relayer what is not zero, or for escrows without payout a
+    transfer per payment and a liquidity call.  Payload 3 pays the receiving app the
+    same way.
+    """
+    if payout:
+        return lambda b: b.count("payout") == 1 and b.inner_txns == 2 + bfee + fee
+    return lambda b: b.count("payout") == 0 and b.count("transfer") == 1 + bfee + fee
+
+
+class Redeem:
+    """
+    One VAA on its way through the pipeline, every stage fills in a bit more
+    """
+
+    def __init__(self, vaa: VAA, transfer: Transfer):
+        self.vaa = vaa
+        self.transfer = transfer
+        self.replay: LogicSigAccount = None
+        self.needs_optin = False
+        self.keys: List[bytes] = []
+        self.asset = 0
+        self.storage = None
+        self.escrow = 0
+        self.payout = False         # the escrow pays out in one call
+        self.bridge_fee = False     # the asset takes a redeem fee
+        self.destination = None
+        self.groups: List[Union[List[transaction.Transaction], FilledGroup]] = []
+        self.signed: List[Union[list, bytes]] = []
+        self.txids: List[str] = []
+
+
+class BridgeRedeemer:
+    """
+    The stages that turn transfer VAAs into completeTransfer groups
+
+    Payload 3 transfers need a call into the receiving app right after completeTransfer,
+    pass `receiver_call(redeem, sp)` to build it, otherwise they are dropped.
+
+    With a batch_sign.BatchSigner the templated groups are signed on its process pool.
+    A provision.ReplayProvisioner is fed every sequence seen, and its opt ins are not
+    repeated here.  An emitter_registry.EmitterRegistry drops VAAs from unregistered
+    emitters before they are even parsed.  `preflight()` returning the cached
+    preflight.BridgeState adds a first stage that checks the raw VAAs in batches of up
+    to `preflight_batch`, one state per batch, and drops anything completeTransfer
+    would reject.
+    """
+
+    def __init__(self, algod, tmpl_sig: TmplSig, bridge_id: int, core_id: int, sender: str, private_key: str,
+                 vaa_verify: LogicSigAccount, seed_amt: int, fee_model: FeeModel,
+                 recover: Callable[[bytes, bytes], bytes] = recover_guardian, executor: Executor = None,
+                 receiver_call: Callable[[Redeem, transaction.SuggestedParams], transaction.Transaction] = None,
+                 signer: BatchSigner = None, provisioner: ReplayProvisioner = None,
+                 registry: EmitterRegistry = None, preflight: Callable[[], BridgeState] = None,
+                 preflight_batch: int = 256):
+        self.algod = algod
+        self.tmpl_sig = tmpl_sig
+        self.bridge_id = bridge_id
+        self.bridge_addr = get_application_address(bridge_id)
+        self.core_id = core_id
+        self.core_addr = get_application_address(core_id)
+        self.sender = sender
+        self.private_key = private_key
+        self.vaa_verify = vaa_verify
+        self.seed_amt = seed_amt
+        self.fee_model = fee_model
+        self.recover = recover
+        self.executor = executor
+        self.receiver_call = receiver_call
+        self.signer = signer
+        self.provisioner = provisioner
+        self.registry = registry
+        self.preflight = preflight
+        self.preflight_batch = preflight_batch
+
+        self._guardians: Dict[int, List[bytes]] = {}
+        self._treasury: Optional[str] = None
+        self._lows: Optional[Dict[bytes, int]] = None
+        self._payout: Dict[int, bool] = {}
+        self._opting_in = set()
+        self._templates: Dict[tuple, Tuple[GroupTemplate, List[GroupTxn]]] = {}
+        self._verify_signer = LsigSigner(vaa_verify)
+        self._verify_program = program(vaa_verify)
+
+    def stages(self, workers: Dict[str, int] = None) -> List[Stage]:
+        n = {
+            "decode": 1,
+            "duplicate": 16,
+            "verify": os.cpu_count() or 1,
+            "derive": 16,
+            "assemble": 4,
+            "sign": (os.cpu_count() or 1) if self.signer is not None else 2,
+            "submit": 8,
+        }
+        n.update(workers or {})
+        stages = [
+            Stage("decode", self.decode, n["decode"]),
+            Stage("duplicate", self.check_duplicate, n["duplicate"]),
+            Stage("verify", self.verify_signatures, n["verify"]),
+            Stage("derive", self.derive_accounts, n["derive"]),
+            Stage("assemble", self.assemble, n["assemble"]),
+            Stage("sign", self.sign, n["sign"]),
+            Stage("submit", self.submit, n["submit"]),
+        ]
+        if self.preflight is not None:
+            stages.insert(0, Stage("preflight", self.check_preflight, 1, self.preflight_batch))
+        return stages
+
+    async def guardian_keys(self, index: int) -> List[bytes]:
+        """
+        The keys of a guardian set, from the core's storage for (index, "guardian"):
+        a count byte followed by the 20 byte keys
+        """
+        if index not in self._guardians:
+            addr = self.tmpl_sig.get_sig_address(index, b"guardian", self.core_id, self.core_addr)
+            state = await self.algod.local_state(addr, self.core_id)
+            if state is None:
+                raise ValueError("unknown guardian set {}".format(index))
+            blob = blob_bytes(state)
+            self._guardians[index] = [blob[1 + i * 20:21 + i * 20] for i in range(blob[0])]
+        return self._guardians[index]
+
+    async def treasury(self) -> str:
+        if self._treasury is None:
+            state = await self.algod.global_state(self.bridge_id)
+            self._treasury = encode_address(state[b"Treasury"])
+        return self._treasury
+
+    async def escrow_payout(self, escrow: int) -> bool:
+        """
+        Does the escrow have payout, the token bridge checks its "ver" the same way
+        """
+        if escrow not in self._payout:
+            state = await self.algod.global_state(escrow)
+            self._payout[escrow] = state.get(b"ver", 0) >= 1
+        return self._payout[escrow]
+
+    async def low(self, emitter: bytes, refresh: bool = False) -> int:
+        """
+        The emitter's replay low water mark, the marks only ever move up
+        """
+        if refresh or self._lows is None:
+            self._lows = low_marks(await self.algod.global_state(self.bridge_id))
+        return self._lows.get(emitter, 0)
+
+    async def decode(self, raw: bytes) -> Optional[Redeem]:
+        if self.registry is not None and not self.registry.accepts(raw):
+            return None
+        try:
+            v = parse_vaa(raw)
+            t = parse_transfer(v.payload)
+        except ValueError:
+            return None
+        if v.version != 1 or t.action not in (1, 3) or t.dest_chain != ALGORAND_CHAIN:
+            return None
+        return Redeem(v, t)
+
+    async def check_duplicate(self, r: Redeem) -> Optional[Redeem]:
+        v = r.vaa
+        block = replay_block(v.sequence)
+        if self.provisioner is not None:
+            self.provisioner.observe(v.emitter, v.sequence)
+
+        # Blocks below the mark were full when retired
+        if block < await self.low(v.emitter):
+            return None
+
+        r.replay = self.tmpl_sig.get_sig_account(block, v.emitter, self.bridge_id, self.bridge_addr)
+        state = await self.algod.local_state(r.replay.address(), self.bridge_id)
+        if state is None:
+            # A retired block's account is closed, don't opt it in again
+            if block < await self.low(v.emitter, refresh=True):
+                return None
+            provisioned = self.provisioner is not None and (v.emitter, block) in self.provisioner.ready
+            r.needs_optin = not provisioned
+            return r
+        if is_redeemed(blob_bytes(state), v.sequence):
+            return None
+        return r
+
+    async def verify_signatures(self, r: Redeem) -> Optional[Redeem]:
+        r.keys = await self.guardian_keys(r.vaa.guardian_set_index)
+        loop = asyncio.get_running_loop()
+        ok = await loop.run_in_executor(self.executor, check_signatures, r.vaa, r.keys, self.recover)
+        return r if ok else None
+
+    async def check_preflight(self, raws: List[bytes]) -> List[Optional[bytes]]:
+        verdicts = check(raws, self.preflight())
+        failed: Dict[str, int] = {}
+        for v in verdicts:
+            if not v.ok:
+                failed[v.rule] = failed.get(v.rule, 0) + 1
+        if failed:
+            log.info("preflight drops %s", ", ".join("{} {}".format(n, rule) for rule, n in sorted(failed.items())))
+        return [raw if v.ok else None for raw, v in zip(raws, verdicts)]
+
+    async def derive_accounts(self, r: Redeem) -> Optional[Redeem]:
+        t = r.transfer
+        if t.action == 3 and self.receiver_call is None:
+            return None
+
+        if t.origin_chain == ALGORAND_CHAIN:
+            r.asset = int.from_bytes(t.origin[24:], "big")
+        else:
+            # The wrapped asa is recorded under (origin chain, origin address) by receiveAttest
+            foreign = self.tmpl_sig.get_sig_address(t.origin_chain, t.origin, self.bridge_id, self.bridge_addr)
+            state = await self.algod.local_state(foreign, self.bridge_id)
+            if state is None:
+                return None
+            r.asset = int.from_bytes(blob_bytes(state)[0:8], "big")
+
+        r.storage = self.tmpl_sig.get_sig_address(r.asset, b"native", self.bridge_id, self.bridge_addr)
+        state = await self.algod.local_state(r.storage, self.bridge_id)
+        record = decode_asset(blob_bytes(state)) if state is not None else None
+        if record is None:
+            return None
+        r.escrow = record.escrow
+        r.payout = await self.escrow_payout(r.escrow)
+        r.bridge_fee = bridge_fee_rate(record) > 0
+
+        if t.action == 3:
+            r.destination = get_application_address(int.from_bytes(t.destination[24:], "big"))
+        else:
+            r.destination = encode_address(t.destination)
+        return r
+
+    def completion(self, r: Redeem) -> Callable[[Branch], bool]:
+        # A fee that normalizes to nothing is still paid for, overpaying is harmless
+        return completion_where(r.payout, r.bridge_fee, r.transfer.fee > 0)
+
+    async def redeem_group(self, sp: transaction.SuggestedParams, r: Redeem) -> List[transaction.Transaction]:
+        v = r.vaa
+        guardians = self.tmpl_sig.get_sig_address(v.guardian_set_index, b"guardian", self.core_id, self.core_addr)
+        accts = [r.replay.address(), guardians]
+        digest = v.digest()
+
+        txns = []
+        plan = []
+        step = MAX_SIGNATURES_PER_VERIFICATION_STEP
+        for i in range(0, v.num_sigs, step):
+            sigs = v.signatures[i * 66:(i + step) * 66]
+            keys = b"".join(r.keys[sigs[j * 66]] for j in range(len(sigs) // 66))
+            txns.append(transaction.ApplicationNoOpTxn(
+                self.vaa_verify.address(), sp, self.core_id,
+                app_args=[b"verifySigs", sigs, keys, digest], accounts=accts))
+            plan.append(GroupTxn(lsig=True))
+
+        txns.append(transaction.ApplicationNoOpTxn(self.sender, sp, self.core_id, app_args=[b"verifyVAA", v.raw], accounts=accts))
+        plan.append(GroupTxn())
+
+        apps = [self.core_id, r.escrow]
+        if r.transfer.action == 3:
+            apps.append(int.from_bytes(r.transfer.destination[24:], "big"))
+        txns.append(transaction.ApplicationNoOpTxn(
+            self.sender, sp, self.bridge_id,
+            app_args=[b"completeTransfer", v.raw],
+            accounts=[r.replay.address(), r.destination, r.storage, await self.treasury()],
+            foreign_apps=apps,
+            foreign_assets=[r.asset] if r.asset != 0 else []))
+        plan.append(GroupTxn(self.fee_model, "completeTransfer", self.completion(r)))
+
+        if r.transfer.action == 3:
+            txns.append(self.receiver_call(r, sp))
+            plan.append(GroupTxn())
+
+        for txn, fee in zip(txns, pooled_fees(plan, sp.min_fee)):
+            txn.fee = fee
+        transaction.assign_group_id(txns)
+        return txns
+
+    async def redeem_template(self, steps: int, has_asset: bool, sp: transaction.SuggestedParams) -> Tuple[GroupTemplate, List[GroupTxn]]:
+        """
+        The encoded completeTransfer group for a shape, built on first use
+        """
+        key = (steps, has_asset, sp.gh)
+        if key in self._templates:
+            return self._templates[key]
+
+        t = GroupTemplate()
+        accts = [t.address("replay"), t.address("guardians")]
+        tsp = transaction.SuggestedParams(0, t.int("first"), t.int("last"), sp.gh, sp.gen, flat_fee=True)
+
+        txns = []
+        plan = []
+        for i in range(steps):
+            txn = transaction.ApplicationNoOpTxn(
+                self.vaa_verify.address(), tsp, self.core_id,
+                app_args=[b"verifySigs", t.bytes("sigs{}".format(i)), t.bytes("keys{}".format(i)), t.bytes("digest")],
+                accounts=accts)
+            txn.fee = 0
+            txns.append(txn)
+            plan.append(GroupTxn(lsig=True))
+
+        txn = transaction.ApplicationNoOpTxn(self.sender, tsp, self.core_id, app_args=[b"verifyVAA", t.bytes("vaa")], accounts=accts)
+        txn.fee = t.int("fee{}".format(len(txns)))
+        txns.append(txn)
+        plan.append(GroupTxn())
+
+        txn = transaction.ApplicationNoOpTxn(
+            self.sender, tsp, self.bridge_id,
+            app_args=[b"completeTransfer", t.bytes("vaa")],
+            accounts=[t.address("replay"), t.address("destination"), t.address("storage"), await self.treasury()],
+            foreign_apps=[self.core_id, t.int("escrow")],
+            foreign_assets=[t.int("asset")] if has_asset else [])
+        txn.fee = t.int("fee{}".format(len(txns)))
+        txns.append(txn)
+        plan.append(GroupTxn(self.fee_model, "completeTransfer"))
+
+        t.freeze(txns)
+        self._templates[key] = (t, plan)
+        return t, plan
+
+    async def redeem_filled(self, sp: transaction.SuggestedParams, r: Redeem) -> FilledGroup:
+        v = r.vaa
+        step = MAX_SIGNATURES_PER_VERIFICATION_STEP
+        steps = (v.num_sigs + step - 1) // step
+        t, plan = await self.redeem_template(steps, r.asset != 0, sp)
+        plan = plan[:-1] + [plan[-1]._replace(where=self.completion(r))]
+
+        values = {
+            "first": sp.first,
+            "last": sp.last,
+            "replay": r.replay.address(),
+            "guardians": self.tmpl_sig.get_sig_address(v.guardian_set_index, b"guardian", self.core_id, self.core_addr),
+            "digest": v.digest(),
+            "vaa": v.raw,
+            "destination": r.destination,
+            "storage": r.storage,
+            "escrow": r.escrow,
+        }
+        if r.asset != 0:
+            values["asset"] = r.asset
+        for i in range(steps):
+            sigs = v.signatures[i * step * 66:(i + 1) * step * 66]
+            values["sigs{}".format(i)] = sigs
+            values["keys{}".format(i)] = b"".join(r.keys[sigs[j * 66]] for j in range(len(sigs) // 66))
+        for i, fee in enumerate(pooled_fees(plan, sp.min_fee)):
+            if fee:
+                values["fee{}".format(i)] = fee
+        return t.fill(values)
+
+    def optins(self, sp: transaction.SuggestedParams, r: Redeem) -> List[List[transaction.Transaction]]:
+        addr = r.replay.address()
+        if not r.needs_optin or addr in self._opting_in:
+            return []
+        # Redeems for the same new block ride on the first one's opt in
+        self._opting_in.add(addr)
+        return [optin_group(sp, self.sender, r.replay, self.bridge_id, self.seed_amt)]
+
+    async def assemble(self, r: Redeem) -> Redeem:
+        sp = await self.algod.suggested_params()
+        sp.flat_fee = True
+
+        r.groups = self.optins(sp, r)
+        if r.transfer.action == 3:
+            r.groups.append(await self.redeem_group(sp, r))
+        else:
+            r.groups.append(await self.redeem_filled(sp, r))
+        return r
+
+    async def sign(self, r: Redeem) -> Redeem:
+        r.signed = []
+        for group in r.groups:
+            if isinstance(group, FilledGroup):
+                # The verifySigs steps come first, the rest is ours
+                steps = len(group.txns) - 2
+                if self.signer is not None:
+                    spec = [(raw, self._verify_program if i < steps else None) for i, raw in enumerate(group.txns)]
+                    r.signed += await self.signer.sign_async([spec])
+                    continue
+                r.signed.append(b"".join(
+                    self._verify_signer.sign(raw) if i < steps else sign_raw(raw, self.private_key)
+                    for i, raw in enumerate(group.txns)))
+                continue
+
+            signed = []
+            for txn in group:
+                if txn.sender == self.sender:
+                    signed.append(txn.sign(self.private_key))
+                elif txn.sender == self.vaa_verify.address():
+                    signed.append(transaction.LogicSigTransaction(txn, self.vaa_verify))
+                else:
+                    signed.append(transaction.LogicSigTransaction(txn, r.replay))
+            r.signed.append(signed)
+        return r
+
+    async def submit(self, r: Redeem) -> Redeem:
+        r.txids = []
+        for signed in r.signed:
+            if isinstance(signed, bytes):
+                r.txids.append(await self.algod.send_raw_group(signed))
+            else:
+                r.txids.append(await self.algod.send_group(signed))
+        return r
@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+"""
+Closing replay bitmap accounts that can never be written again
+
+The bridge keeps a low water mark per registered emitter, a block number stored
+after the emitter address in its "Chain" + chain id global.  retireBlock checks on
+chain that every bit of the bitmap at the mark is set, moves the mark up by one and
+rekeys that account to the Treasury.  checkForDuplicate refuses blocks below the
+mark, so the Treasury can then clear the account's local state and close its balance
+out to itself.
+
+The marks take no global state of their own, so any bridge, whatever its schema, can
+retire the blocks of every registered emitter.  Unregistered emitters (governance,
+the bridge's own chain 8 transfers) have nowhere to keep a mark and are left alone.
+
+The compactor does both steps, one block per emitter per tick:
+
+    comp = ReplayCompactor(algod, TmplSig("sig"), bridge_id, sender, key, treasury_key, emitters)
+    asyncio.create_task(comp.run(stop))
+
+A block only fills once every sequence in it was redeemed here, so emitters that also
+send to other chains keep their accounts.
+"""
+import asyncio
+import logging
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from algosdk import account
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+
+from local_state import blob_bytes, low_marks
+from replay_scan import FULL, bitmap
+from TmplSig import TmplSig
+
+log = logging.getLogger("replay_compactor")
+
+
+def retire_txn(sp: transaction.SuggestedParams, sender: str, bridge_id: int, emitter: bytes, storage: str) -> transaction.Transaction:
+    """
+    retireBlock for the block at the emitter's low water mark, paying for the rekey
+    """
+    txn = transaction.ApplicationNoOpTxn(sender, sp, bridge_id, app_args=[b"retireBlock", emitter], accounts=[storage])
+    txn.fee = 2 * sp.min_fee
+    return txn
+
+
+def reclaim_group(sp: transaction.SuggestedParams, storage: str, bridge_id: int, treasury: str) -> List[transaction.Transaction]:
+    """
+    Clear a retired account's local state and close its balance to the Treasury
+    """
+    clear = transaction.ApplicationClearStateTxn(storage, sp, bridge_id)
+    close = transaction.PaymentTxn(storage, sp, treasury, 0, close_remainder_to=treasury)
+    txns = [clear, close]
+    transaction.assign_group_id(txns)
+    return txns
+
+
+class ReplayCompactor:
+    def __init__(self, algod, tmpl_sig: TmplSig, bridge_id: int, sender: str, private_key: str, treasury_key: str,
+                 emitters: Iterable[bytes] = (), interval: float = 60.0):
+        self.algod = algod
+        self.tmpl_sig = tmpl_sig
+        self.bridge_id = bridge_id
+        self.bridge_addr = get_application_address(bridge_id)
+        self.sender = sender
+        self.private_key = private_key
+        self.treasury_key = treasury_key
+        self.treasury = account.address_from_private_key(treasury_key)
+        self.emitters = list(emitters)
+        self.interval = interval
+
+        # (emitter, block) retireBlock was sent for, until the account is closed
+        self.retired: Set[Tuple[bytes, int]] = set()
+
+    def storage(self, emitter: bytes, block: int) -> str:
+        return self.tmpl_sig.get_sig_address(block, emitter, self.bridge_id, self.bridge_addr)
+
+    async def lows(self) -> Dict[bytes, int]:
+        # retireBlock refuses emitters that are not registered
+        marks = low_marks(await self.algod.global_state(self.bridge_id))
+        return {e: marks[e] for e in self.emitters if e in marks}
+
+    async def retire(self, emitter: bytes, block: int) -> Optional[str]:
+        """
+        Send retireBlock if the bitmap at block is full, the txid if one was sent
+        """
+        if (emitter, block) in self.retired:
+            return None
+        addr = self.storage(emitter, block)
+        state = await self.algod.local_state(addr, self.bridge_id)
+        if state is None or bitmap(blob_bytes(state)) != FULL:
+            return None
+
+        sp = await self.algod.suggested_params()
+        sp.flat_fee = True
+        txid = await self.algod.send_group([retire_txn(sp, self.sender, self.bridge_id, emitter, addr).sign(self.private_key)])
+        self.retired.add((emitter, block))
+        log.info("retired block %d of %s: %s", block, emitter.hex(), txid)
+        return txid
+
+    async def reclaim(self, emitter: bytes, block: int) -> Optional[str]:
+        """
+        Close a retired account once retireBlock is confirmed, the txid if one was sent
+        """
+        addr = self.storage(emitter, block)
+        state = await self.algod.local_state(addr, self.bridge_id)
+        if state is None:
+            self.retired.discard((emitter, block))
+            return None
+        if state.get(b"meta") != b"retired":
+            return None
+
+        sp = await self.algod.suggested_params()
+        sp.flat_fee = True
+        clear, close = reclaim_group(sp, addr, self.bridge_id, self.treasury)
+        clear.fee = 2 * sp.min_fee
+        close.fee = 0
+        # The Treasury is the auth address of the rekeyed account
+        txid = await self.algod.send_group([clear.sign(self.treasury_key), close.sign(self.treasury_key)])
+        self.retired.discard((emitter, block))
+        log.info("closed block %d of %s: %s", block, emitter.hex(), txid)
+        return txid
+
+    async def tick(self) -> List[str]:
+        txids = []
+        for emitter, block in sorted(self.retired):
+            try:
+                txid = await self.reclaim(emitter, block)
+            except Exception:
+                log.exception("closing block %d of %s", block, emitter.hex())
+                continue
+            if txid is not None:
+                txids.append(txid)
+
+        for emitter, low in (await self.lows()).items():
+            try:
+                txid = await self.retire(emitter, low)
+            except Exception:
+                log.exception("retiring block %d of %s", low, emitter.hex())
+                continue
+            if txid is not None:
+                txids.append(txid)
+        return txids
+
+    async def run(self, stop: asyncio.Event):
+        while not stop.is_set():
+            await self.tick()
+            try:
+                await asyncio.wait_for(stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,166 @@
+#!/usr/bin/python3
+"""
+Which sequences of an emitter have not been redeemed, and for how long
+
+checkForDuplicate keeps one max_bits bitmap per (emitter, sequence / max_bits) account,
+bit sequence % max_bits set once redeemed.  Read as a little endian integer a blob is
+exactly that bitmap, so runs are found with whole-integer shifts and masks instead of
+walking bits:
+
+    starts = x & ~(x << 1)      first bit of every run of ones
+    ends   = x & ~(x >> 1)      last bit of every run of ones
+
+Bits are never cleared, so a block that was full on an earlier scan is not fetched
+again, and gaps keep the time they were first seen across scans.  Blocks below an
+emitter's low water mark were full when retired and count as full.
+
+    scanner = ReplayScanner(algod, TmplSig("sig"), bridge_id)
+    reports = await scanner.scan({emitter: latest_sequence, ...})
+"""
+import asyncio
+import bisect
+import time
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from algosdk.logic import get_application_address
+
+from local_state import blob_bytes, low_marks, max_bits, replay_block
+from TmplSig import TmplSig
+
+FULL = (1 << max_bits) - 1
+
+
+class Gap(NamedTuple):
+    start: int
+    end: int                # inclusive
+    since: float            # when the first of these was seen unredeemed
+
+
+class EmitterReport(NamedTuple):
+    emitter: bytes
+    latest: int
+    redeemed: List[Tuple[int, int]]     # inclusive ranges
+    gaps: List[Gap]                     # unredeemed ranges up to latest
+    unredeemed: int
+    lag: int                            # latest - the oldest unredeemed sequence, 0 without gaps
+    oldest: float                       # seconds the oldest gap has been open
+
+    @property
+    def chain(self) -> int:
+        return int.from_bytes(self.emitter[:2], "big")
+
+
+def bitmap(blob: bytes) -> int:
+    """
+    The replay blob as an int with bit sequence % max_bits at position sequence % max_bits
+    """
+    return int.from_bytes(blob, "little")
+
+
+def _bits(x: int) -> List[int]:
+    out = []
+    while x:
+        low = x & -x
+        out.append(low.bit_length() - 1)
+        x ^= low
+    return out
+
+
+def runs(x: int, nbits: int = max_bits) -> List[Tuple[int, int]]:
+    """
+    The inclusive (start, end) runs of set bits in the low nbits of x
+    """
+    mask = (1 << nbits) - 1
+    x &= mask
+    return list(zip(_bits(x & ~(x << 1)), _bits(x & ~(x >> 1) & mask)))
+
+
+def _merge(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    out = []
+    for s, e in ranges:
+        if out and out[-1][1] + 1 == s:
+            out[-1] = (out[-1][0], e)
+        else:
+            out.append((s, e))
+    return out
+
+
+class ReplayScanner:
+    def __init__(self, algod, tmpl_sig: TmplSig, bridge_id: int, concurrency: int = 32):
+        self.algod = algod
+        self.tmpl_sig = tmpl_sig
+        self.bridge_id = bridge_id
+        self.bridge_addr = get_application_address(bridge_id)
+        self.slots = asyncio.Semaphore(concurrency)
+
+        self.bitmaps: Dict[Tuple[bytes, int], int] = {}
+        self.full: Set[Tuple[bytes, int]] = set()
+        self.gaps: Dict[bytes, List[Gap]] = {}
+
+    async def _fetch(self, emitter: bytes, block: int) -> int:
+        addr = self.tmpl_sig.get_sig_address(block, emitter, self.bridge_id, self.bridge_addr)
+        async with self.slots:
+            state = await self.algod.local_state(addr, self.bridge_id)
+        return bitmap(blob_bytes(state)) if state is not None else 0
+
+    async def refresh(self, emitter: bytes, latest: int, low: int = 0):
+        """
+        Fetch every block from the low water mark up to latest that wasn't full last time
+        """
+        self.full.update((emitter, b) for b in range(low))
+        blocks = [b for b in range(low, replay_block(latest) + 1) if (emitter, b) not in self.full]
+        maps = await asyncio.gather(*[self._fetch(emitter, b) for b in blocks])
+        for b, x in zip(blocks, maps):
+            self.bitmaps[(emitter, b)] = x
+            if x == FULL:
+                self.full.add((emitter, b))
+
+    def redeemed(self, emitter: bytes, latest: int) -> List[Tuple[int, int]]:
+        ranges = []
+        for b in range(replay_block(latest) + 1):
+            x = FULL if (emitter, b) in self.full else self.bitmaps.get((emitter, b), 0)
+            base = b * max_bits
+            ranges += [(base + s, base + e) for s, e in runs(x)]
+        return [(s, min(e, latest)) for s, e in _merge(ranges) if s <= latest]
+
+    @staticmethod
+    def _since(prev: List[Gap], starts: List[int], start: int, end: int, now: float) -> float:
+        # Gaps only shrink or split, a gap inherits the age of the one it came out of
+        i = bisect.bisect_right(starts, end)
+        since = now
+        while i > 0 and prev[i - 1].end >= start:
+            since = min(since, prev[i - 1].since)
+            i -= 1
+        return since
+
+    def report(self, emitter: bytes, latest: int, now: float = None) -> EmitterReport:
+        now = time.time() if now is None else now
+        redeemed = self.redeemed(emitter, latest)
+
+        prev = self.gaps.get(emitter, [])
+        starts = [g.start for g in prev]
+        gaps = []
+        nxt = 0
+        for s, e in redeemed + [(latest + 1, latest + 1)]:
+            if s > nxt:
+                gaps.append(Gap(nxt, s - 1, self._since(prev, starts, nxt, s - 1, now)))
+            nxt = e + 1
+        self.gaps[emitter] = gaps
+
+        return EmitterReport(
+            emitter=emitter,
+            latest=latest,
+            redeemed=redeemed,
+            gaps=gaps,
+            unredeemed=sum(g.end - g.start + 1 for g in gaps),
+            lag=latest - gaps[0].start if gaps else 0,
+            oldest=now - min(g.since for g in gaps) if gaps else 0.0,
+        )
+
+    async def scan(self, latest: Dict[bytes, int], now: Optional[float] = None) -> List[EmitterReport]:
+        """
+        Refresh and report every emitter, keyed by the 34 byte chain + address
+        """
+        lows = low_marks(await self.algod.global_state(self.bridge_id))
+        await asyncio.gather(*[self.refresh(e, seq, lows.get(e, 0)) for e, seq in latest.items()])
+        return [self.report(e, seq, now) for e, seq in latest.items()]
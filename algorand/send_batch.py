@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+"""
+Host side group builder for sendTransferBatch
+
+    [mfee payment to the bridge for all the messages]
+    one payment / asset transfer per transfer, to the escrow
+    bridge sendTransferBatch
+    [bridge nop calls, if the batch needs more inner transactions or opcode budget]
+
+Every transfer of a batch has to be of the same asset, use one batch per asset.  Each
+transfer is published as a message of its own, the receiving chains only redeem
+payloads of one transfer.
+
+Each app call of the group lets the batch submit 16 more inner transactions and adds
+700 to the opcode budget.  With a FeeModel of the bridge the nop calls a batch needs
+are worked out from the compiled program.  send_where narrows the model down to the
+branch that runs, otherwise the costliest branch is paid for:
+
+    where = send_where(payout=True, bfee=False)
+    nops = batch_nops(model, len(transfers), where=where)
+    largest = max_batch(model)
+"""
+from typing import Callable, List, NamedTuple, Optional
+
+from algosdk.encoding import decode_address
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+
+from cost_report import lap_cost, method_costs
+from fees import Branch, FeeModel, GroupTxn, pooled_fees
+from TmplSig import TmplSig
+
+MAX_GROUP = 16
+INNER_PER_CALL = 16
+BUDGET_PER_CALL = 700
+
+
+class Outbound(NamedTuple):
+    amount: int         # in units of the asset, bridge fees come off this
+    receiver: bytes     # address on the receiving chain, up to 32 bytes
+    chain: int
+    fee: int = 0        # relayer fee, in units of the asset
+
+
+def send_where(payout: bool, bfee: bool) -> Callable[[Branch], bool]:
+    """
+    The sendTransferBatch branch that runs: one payout call to the escrow that pays the
+    treasury its bridge fee, if there is one, or for escrows without payout a transfer
+    for the fee and a liquidity call.  sendTransfer takes the same branches.
+    """
+    if payout:
+        return lambda b: b.count("payout") == 1 and b.inner_txns == len(b.calls) + bfee
+    return lambda b: b.count("payout") == 0 and b.count("transfer") == bfee
+
+
+def batch_nops(model: FeeModel, items: int, mfee: bool = True, where: Callable[[Branch], bool] = None) -> int:
+    """
+    Fewest nop calls that give a batch of `items` transfers enough inner transactions
+    and opcode budget, ValueError if the group cannot hold them
+
+    The opcode cost is the static walk of cost_report, it errs on the high side.
+    """
+    inner = model.inner_txns("sendTransferBatch", where, items)
+    costs = method_costs(model)
+    ops = costs["sendTransferBatch"] + (items - 1) * lap_cost(model, "sendTransferBatch")
+    # A nop spends some of the budget it brings
+    nop_budget = BUDGET_PER_CALL - costs["nop"]
+
+    nops = max(-(-inner // INNER_PER_CALL) - 1, -(-max(ops - BUDGET_PER_CALL, 0) // nop_budget))
+    if int(mfee) + items + 1 + nops > MAX_GROUP:
+        raise ValueError("{} transfers need {} nop calls, more than a group holds".format(items, nops))
+    return nops
+
+
+def max_batch(model: FeeModel, mfee: bool = True) -> int:
+    """
+    The most transfers one sendTransferBatch group can carry
+    """
+    n = 0
+    while n + 1 + int(mfee) + 1 <= MAX_GROUP:
+        try:
+            batch_nops(model, n + 1, mfee)
+        except ValueError:
+            break
+        n += 1
+    return n
+
+
+def build_send_batch(sender: str, sp: transaction.SuggestedParams, tmpl_sig: TmplSig,
+                     bridge_id: int, core_id: int, escrow_id: int, aid: int,
+                     transfers: List[Outbound], message_fee: int,
+                     model: FeeModel = None, nops: Optional[int] = None, where: Callable[[Branch], bool] = None,
+                     treasury: Optional[str] = None) -> List[transaction.Transaction]:
+    """
+    Build the unsigned group, with the group id assigned
+
+    With a FeeModel of the bridge the nop calls default to what batch_nops asks for and
+    the pooled fee for the inner transactions is put on the sendTransferBatch call,
+    otherwise every transaction keeps the fee in sp.  `where` (see send_where) picks
+    the branch to pay for.  The treasury has to be passed when the asset takes a
+    bridge fee, the escrow pays it.
+    """
+    if not transfers:
+        raise ValueError("a batch holds at least one transfer")
+    if model is not None:
+        need = batch_nops(model, len(transfers), message_fee > 0, where)
+        if nops is None:
+            nops = need
+        elif nops < need:
+            raise ValueError("{} transfers need at least {} nop calls".format(len(transfers), need))
+    elif nops is None:
+        nops = 0
+    if int(message_fee > 0) + len(transfers) + 1 + nops > MAX_GROUP:
+        raise ValueError("{} transfers and {} nop calls do not fit in a group".format(len(transfers), nops))
+    for t in transfers:
+        if len(t.receiver) > 32:
+            raise ValueError("receiver longer than 32 bytes")
+
+    bridge_addr = get_application_address(bridge_id)
+    escrow_addr = get_application_address(escrow_id)
+
+    # The bridge publishes through its emitter account on the core
+    emitter = tmpl_sig.get_sig_address(0, decode_address(bridge_addr), core_id, get_application_address(core_id))
+    storage = tmpl_sig.get_sig_address(aid, b"native", bridge_id, bridge_addr)
+
+    txns = []
+    if message_fee > 0:
+        txns.append(transaction.PaymentTxn(sender, sp, bridge_addr, message_fee * len(transfers)))
+
+    for t in transfers:
+        if aid == 0:
+            txns.append(transaction.PaymentTxn(sender, sp, escrow_addr, t.amount))
+        else:
+            txns.append(transaction.AssetTransferTxn(sender, sp, escrow_addr, t.amount, aid))
+
+    call = transaction.ApplicationNoOpTxn(
+        sender, sp, bridge_id,
+        app_args=[
+            b"sendTransferBatch",
+            aid.to_bytes(8, "big"),
+            b"".join(t.receiver.rjust(32, b"\0") for t in transfers),
+            b"".join(t.chain.to_bytes(2, "big") for t in transfers),
+            b"".join(t.fee.to_bytes(8, "big") for t in transfers),
+        ],
+        accounts=[emitter, storage] + ([treasury] if treasury is not None else []),
+        foreign_apps=[core_id, escrow_id],
+        foreign_assets=[aid] if aid != 0 else [],
+    )
+    txns.append(call)
+
+    for i in range(nops):
+        txns.append(transaction.ApplicationNoOpTxn(sender, sp, bridge_id, app_args=[b"nop", bytes([i])]))
+
+    if model is not None:
+        plan = [GroupTxn() for _ in txns]
+        plan[txns.index(call)] = GroupTxn(model, "sendTransferBatch", where, items=len(transfers))
+        for txn, fee in zip(txns, pooled_fees(plan, sp.min_fee)):
+            txn.fee = fee
+
+    transaction.assign_group_id(txns)
+    return txns
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+"""
+A local copy of the LocalBlob of every account opted into the bridge
+
+The snapshot is one file of fixed size records that is memory mapped, so readers
+look a blob up without parsing anything:
+
+    header   magic(8) app_id(8) round(8) count(8)
+    record   address(32) round(8) blob(max_bytes)
+
+A refresh asks the source which accounts changed since the snapshot's round, fetches
+their local state with bounded concurrency and rewrites only those records.  The
+first refresh takes every opted in account.  Closed out accounts keep their record
+with a zeroed blob.
+
+    index = StateIndex("bridge.idx", bridge_id)
+    await index.refresh(algod, IndexerSource(IndexerClient(...), bridge_id))
+    asset = decode_asset(index.blob(storage_address))
+
+Sources:
+
+    async accounts()                -> (round, every opted in address)
+    async touched(min_round)        -> (round, addresses whose local state may have changed)
+"""
+import asyncio
+import mmap
+import os
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from algosdk.encoding import decode_address, encode_address
+from algosdk.v2client.indexer import IndexerClient
+
+from local_state import blob_bytes, max_bytes
+
+MAGIC = b"LBLOBIDX"
+HEADER = 32
+RECORD = 32 + 8 + max_bytes
+
+
+class IndexerSource:
+    """
+    Accounts from an indexer: the opted in accounts once, after that the senders and
+    referenced accounts of every call to the app
+    """
+
+    def __init__(self, indexer: IndexerClient, app_id: int, page: int = 1000):
+        self.indexer = indexer
+        self.app_id = app_id
+        self.page = page
+
+    async def accounts(self) -> Tuple[int, List[str]]:
+        out = []
+        rnd = 0
+        nxt = None
+        while True:
+            res = await asyncio.to_thread(
+                self.indexer.accounts, limit=self.page, next_page=nxt, application_id=self.app_id, exclude="all")
+            rnd = max(rnd, res["current-round"])
+            out += [a["address"] for a in res["accounts"]]
+            nxt = res.get("next-token")
+            if not nxt or not res["accounts"]:
+                return rnd, out
+
+    async def transactions(self, min_round: int) -> Tuple[int, List[dict]]:
+        """
+        Every confirmed call to the app from min_round on
+        """
+        out = []
+        rnd = min_round
+        nxt = None
+        while True:
+            res = await asyncio.to_thread(
+                self.indexer.search_transactions, limit=self.page, next_page=nxt,
+                application_id=self.app_id, min_round=min_round)
+            rnd = max(rnd, res["current-round"])
+            out += res["transactions"]
+            nxt = res.get("next-token")
+            if not nxt or not res["transactions"]:
+                return rnd, out
+
+    async def touched(self, min_round: int) -> Tuple[int, List[str]]:
+        rnd, txns = await self.transactions(min_round)
+        out: Set[str] = set()
+        for txn in txns:
+            out.add(txn["sender"])
+            out.update(txn.get("application-transaction", {}).get("accounts", []))
+        return rnd, sorted(out)
+
+
+class LocalSource:
+    """
+    Accounts from a local_algod.LocalAlgod
+    """
+
+    def __init__(self, algod, app_id: int):
+        self.algod = algod
+        self.app_id = app_id
+
+    async def accounts(self) -> Tuple[int, List[str]]:
+        return self.algod.round, [a for (a, app) in self.algod.locals if app == self.app_id]
+
+    async def transactions(self, min_round: int) -> Tuple[int, List[dict]]:
+        return self.algod.round, [t for t in self.algod.confirmed
+                                  if t["confirmed-round"] >= min_round and t["application-transaction"]["application-id"] == self.app_id]
+
+    async def touched(self, min_round: int) -> Tuple[int, List[str]]:
+        return self.algod.round, [a for (a, app), r in self.algod.updated.items() if app == self.app_id and r >= min_round]
+
+
+class StateIndex:
+    def __init__(self, path: str, app_id: int):
+        self.path = path
+        self.app_id = app_id
+
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(MAGIC + app_id.to_bytes(8, "big") + bytes(16))
+
+        self.f = open(path, "r+b")
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+        if self.mm[0:8] != MAGIC:
+            raise ValueError("{} is not a state index".format(path))
+        if int.from_bytes(self.mm[8:16], "big") != app_id:
+            raise ValueError("{} indexes app {}".format(path, int.from_bytes(self.mm[8:16], "big")))
+
+        self.slots: Dict[bytes, int] = {}
+        for i in range(self.count):
+            off = HEADER + i * RECORD
+            self.slots[bytes(self.mm[off:off + 32])] = i
+
+    @property
+    def round(self) -> int:
+        return int.from_bytes(self.mm[16:24], "big")
+
+    @property
+    def count(self) -> int:
+        return int.from_bytes(self.mm[24:32], "big")
+
+    def _grow(self, count: int):
+        self.mm.close()
+        self.f.truncate(HEADER + count * RECORD)
+        self.mm = mmap.mmap(self.f.fileno(), 0)
+
+    def write(self, updates: Dict[str, Optional[bytes]], rnd: int):
+        """
+        Store the blobs (None for closed out accounts) and move the snapshot to rnd
+        """
+        # Touched accounts that were never opted in (receivers, the Treasury) are left out
+        updates = {a: b for a, b in updates.items() if b is not None or decode_address(a) in self.slots}
+        new = [a for a in (decode_address(addr) for addr in updates) if a not in self.slots]
+        if new:
+            self._grow(self.count + len(new))
+            for a in new:
+                self.slots[a] = len(self.slots)
+
+        for addr, blob in updates.items():
+            off = HEADER + self.slots[decode_address(addr)] * RECORD
+            self.mm[off:off + RECORD] = decode_address(addr) + rnd.to_bytes(8, "big") + (blob or bytes(max_bytes))
+
+        self.mm[16:32] = rnd.to_bytes(8, "big") + len(self.slots).to_bytes(8, "big")
+        self.mm.flush()
+
+    # Copies rather than views into the map, which is replaced when the file grows
+
+    def blob(self, address: str) -> Optional[bytes]:
+        i = self.slots.get(decode_address(address))
+        if i is None:
+            return None
+        off = HEADER + i * RECORD + 40
+        return self.mm[off:off + max_bytes]
+
+    def items(self) -> Iterator[Tuple[str, int, bytes]]:
+        for i in range(self.count):
+            off = HEADER + i * RECORD
+            yield encode_address(self.mm[off:off + 32]), int.from_bytes(self.mm[off + 32:off + 40], "big"), self.mm[off + 40:off + RECORD]
+
+    async def refresh(self, algod, source, concurrency: int = 32) -> int:
+        """
+        Bring the snapshot up to the source's round, the number of accounts fetched
+        """
+        if self.round == 0:
+            rnd, addrs = await source.accounts()
+        else:
+            rnd, addrs = await source.touched(self.round + 1)
+
+        slots = asyncio.Semaphore(concurrency)
+
+        async def fetch(addr: str) -> Optional[bytes]:
+            async with slots:
+                state = await algod.local_state(addr, self.app_id)
+            return blob_bytes(state) if state is not None else None
+
+        blobs = await asyncio.gather(*[fetch(a) for a in addrs])
+        self.write(dict(zip(addrs, blobs)), max(rnd, self.round))
+        return len(addrs)
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
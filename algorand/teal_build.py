@@ -0,0 +1,98 @@
+#!/usr/bin/python3
+"""
+Building the TEAL of the bridge's programs
+
+fullyCompileContract compiles a contract, writes (or reads back) its TEAL and has algod
+assemble it.  Given the AssertSites the contract was built with, the contract is the
+marked build of teal_map: the deployed TEAL is that build with the marks stripped, and
+the assert map is written next to it.  Reading the TEAL back instead of writing it
+still maps it, as long as it has the same asserts.
+
+pyteal routes with a Cond, one `txna ApplicationArgs 0; <bytes>; ==; bnz <label>` per
+method, so the last method routed pays four ops for every one in front of it.  From
+TEAL 8 match_router turns every such run into one match:
+
+    <bytes> <bytes> ... txna ApplicationArgs 0; match <label> <label> ...
+
+The asserts and their order are untouched, so the assert map of teal_map still lines
+up with the rewritten program.
+"""
+import re
+from typing import List, Optional, Tuple
+
+_CONST = re.compile(r"(bytec_\d+|bytec \d+|byte .+|pushbytes .+)")
+
+
+def _op(line: str) -> Optional[str]:
+    # The op and immediates of a line, "" for labels, None for nothing at all
+    line = line.split("//")[0].strip()
+    if not line or line.startswith("#"):
+        return None
+    if line.endswith(":") and " " not in line:
+        return ""
+    return line
+
+
+def match_router(teal: str) -> str:
+    lines = teal.splitlines()
+    code: List[Tuple[int, str]] = [(n, op) for n, op in ((n, _op(l)) for n, l in enumerate(lines)) if op is not None]
+
+    def entry(k: int) -> Optional[str]:
+        # The label of the router entry whose four ops start at code[k]
+        if k + 3 >= len(code):
+            return None
+        ops = [op for _, op in code[k:k + 4]]
+        if ops[0] == "txna ApplicationArgs 0" and _CONST.fullmatch(ops[1]) and ops[2] == "==" and ops[3].startswith("bnz "):
+            return ops[3][4:]
+        return None
+
+    out = list(lines)
+    drop = set()
+    k = 0
+    while k < len(code):
+        run = []
+        while entry(k + 4 * len(run)) is not None:
+            run.append(k + 4 * len(run))
+        if len(run) < 2:
+            k += 1
+            continue
+
+        first = code[run[0]][0]
+        consts = [lines[code[r + 1][0]].strip() for r in run]
+        labels = [entry(r) for r in run]
+        out[first] = "\n".join(consts + ["txna ApplicationArgs 0", "match " + " ".join(labels)])
+        for r in run:
+            drop.update(code[r + i][0] for i in range(4))
+        drop.discard(first)
+        k = run[-1] + 4
+
+    return "\n".join(l for n, l in enumerate(out) if n not in drop) + ("\n" if teal.endswith("\n") else "")
+
+
+def fullyCompileContract(genTeal, client, contract, name, devmode, sites=None, version: int = 6) -> dict:
+    from pyteal import Mode, OptimizeOptions, compileTeal
+
+    from teal_map import AssertMap, strip_marks
+
+    optimize = None if devmode else OptimizeOptions(scratch_slots=True)
+    marked = compileTeal(contract, mode=Mode.Application, version=version, assembleConstants=True, optimize=optimize)
+    teal = strip_marks(marked, sites) if sites is not None else marked
+    if version >= 8:
+        teal = match_router(teal)
+
+    if genTeal:
+        with open(name, "w") as f:
+            print("Writing " + name)
+            f.write(teal)
+    else:
+        with open(name, "r") as f:
+            print("Reading " + name)
+            teal = f.read()
+
+    if sites is None:
+        return client.compile(teal)
+
+    response = client.compile(teal, source_map=True)
+    print("Writing " + name + ".map.json")
+    AssertMap.build(marked, teal, sites, response["sourcemap"]).save(name + ".map.json")
+    return response
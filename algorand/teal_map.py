@@ -0,0 +1,152 @@
+#!/usr/bin/python3
+"""
+Which MagicAssert a rejected transaction failed on, at no cost on chain
+
+The contract is built once, with every MagicAssert turned into
+
+    Assert(And(cond, Int(MARK + k)))
+
+where k indexes the Python call site.  strip_marks takes the `int; &&` pairs back out
+of that TEAL, which leaves the program that is deployed with the same asserts in the
+same order, so the n-th `assert` of the marked TEAL is the n-th of the deployed TEAL.
+algod's source map then takes a pc to a TEAL line:
+
+    pc -> deployed TEAL line -> n-th assert -> marked TEAL -> k -> file:line
+
+teal_build.fullyCompileContract writes the result next to the TEAL as <name>.map.json, and
+
+    AssertMap.load("approve.teal.map.json").explain("... assert failed pc=1234")
+
+names the check.
+"""
+import inspect
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from pyteal import And, Assert, Expr, Int
+
+MARK = 0x7A5E0000
+
+Site = Tuple[str, int]
+
+
+class AssertSites:
+    """
+    The MagicAssert call sites of one marked build
+    """
+
+    def __init__(self):
+        self.sites: List[Site] = []
+
+    def mark(self, cond: Expr, depth: int = 2) -> Expr:
+        """
+        The marked Assert, attributed to the frame `depth` levels up (MagicAssert's caller)
+        """
+        frame = inspect.currentframe()
+        for _ in range(depth):
+            frame = frame.f_back
+        self.sites.append((os.path.basename(frame.f_code.co_filename), frame.f_lineno))
+        return Assert(And(cond, Int(MARK + len(self.sites) - 1)))
+
+
+def _ops(teal: str) -> List[Tuple[int, str]]:
+    # (1 based line, op and immediates) with comments and labels left out
+    out = []
+    for n, line in enumerate(teal.splitlines(), 1):
+        line = line.split("//")[0].strip()
+        if line and not line.endswith(":"):
+            out.append((n, line))
+    return out
+
+
+def _marks(ops: List[Tuple[int, str]], count: int) -> Dict[int, int]:
+    # index in ops of each marked `assert` -> k, the int may be a constant block entry
+    intc: List[int] = []
+    for _, op in ops:
+        if op.startswith("intcblock"):
+            intc = [int(v) for v in op.split()[1:]]
+
+    def value(op: str) -> Optional[int]:
+        m = re.fullmatch(r"(?:push)?int (\d+)|intc[_ ](\d+)", op)
+        if m is None:
+            return None
+        if m.group(1) is not None:
+            return int(m.group(1))
+        return intc[int(m.group(2))] if int(m.group(2)) < len(intc) else None
+
+    out = {}
+    for i, (_, op) in enumerate(ops):
+        if op == "assert" and i >= 2 and ops[i - 1][1] == "&&":
+            v = value(ops[i - 2][1])
+            if v is not None and 0 <= v - MARK < count:
+                out[i] = v - MARK
+    return out
+
+
+def strip_marks(marked_teal: str, sites: AssertSites) -> str:
+    """
+    The TEAL of the marked build with the marks taken out, what Assert(cond) compiles to
+    """
+    ops = _ops(marked_teal)
+    drop = set()
+    for i in _marks(ops, len(sites.sites)):
+        drop.update((ops[i - 2][0], ops[i - 1][0]))
+    lines = marked_teal.splitlines()
+    return "\n".join(l for n, l in enumerate(lines, 1) if n not in drop) + ("\n" if marked_teal.endswith("\n") else "")
+
+
+def assert_lines(marked_teal: str, teal: str, sites: AssertSites) -> Dict[int, Optional[Site]]:
+    """
+    The call site of every `assert` line of teal, None for asserts that are not MagicAsserts
+    """
+    ops = _ops(marked_teal)
+    marks = _marks(ops, len(sites.sites))
+    marked = [sites.sites[marks[i]] if i in marks else None for i, (_, op) in enumerate(ops) if op == "assert"]
+
+    lines = [n for n, op in _ops(teal) if op == "assert"]
+    if len(lines) != len(marked):
+        raise ValueError("the marked build has {} asserts, the program {}".format(len(marked), len(lines)))
+    return dict(zip(lines, marked))
+
+
+class AssertMap:
+    def __init__(self, pcs: Dict[int, Site]):
+        self.pcs = pcs
+
+    @classmethod
+    def build(cls, marked_teal: str, teal: str, sites: AssertSites, sourcemap: dict) -> "AssertMap":
+        """
+        From the two builds and the "sourcemap" of algod's compile response for teal
+        """
+        from algosdk.source_map import SourceMap
+
+        lines = assert_lines(marked_teal, teal, sites)
+        pcs = {}
+        # algod's lines are 0 based
+        for pc, line in SourceMap(sourcemap).pc_to_line.items():
+            site = lines.get(line + 1)
+            if site is not None:
+                pcs[pc] = site
+        return cls(pcs)
+
+    def site(self, pc: int) -> Optional[Site]:
+        return self.pcs.get(pc)
+
+    def explain(self, error: str) -> Optional[str]:
+        """
+        file:line of the check in a "logic eval error: ... pc=N" message
+        """
+        m = re.search(r"pc=(\d+)", error)
+        site = self.site(int(m.group(1))) if m else None
+        return "{}:{}".format(*site) if site else None
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({str(pc): list(site) for pc, site in sorted(self.pcs.items())}, f)
+
+    @classmethod
+    def load(cls, path: str) -> "AssertMap":
+        with open(path) as f:
+            return cls({int(pc): (site[0], site[1]) for pc, site in json.load(f).items()})
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from base64 import b64encode
+
+import pytest
+
+pytest.importorskip("algosdk")
+
+from algosdk.error import AlgodHTTPError
+from algosdk.v2client.algod import AlgodClient
+
+from algod_async import PooledAlgod, ThreadedAlgod, shared_algod
+
+OPTED = "A" * 58
+
+
+class RecordingClient(AlgodClient):
+    """
+    AlgodClient answering from a table instead of the network, `delay` holds every
+    request until released so overlapping calls can be lined up
+    """
+
+    def __init__(self):
+        super().__init__("a" * 64, "http://localhost:4001")
+        self.requests = []
+        self.delay = threading.Event()
+        self.delay.set()
+
+    def algod_request(self, method, requrl, params=None, data=None, headers=None, response_format="json"):
+        self.requests.append(requrl)
+        self.delay.wait()
+        if requrl == "/transactions/params":
+            return {"fee": 0, "last-round": 10 + len(self.requests), "genesis-hash": "A" * 44,
+                    "genesis-id": "sandnet-v1", "consensus-version": "future", "min-fee": 1000}
+        if requrl == "/applications/7":
+            return {"params": {"global-state": [
+                {"key": b64encode(b"coreid").decode(), "value": {"type": 2, "uint": 5}},
+                {"key": b64encode(b"Treasury").decode(), "value": {"type": 1, "bytes": b64encode(b"\x01" * 32).decode()}},
+            ]}}
+        if requrl == "/accounts/{}/applications/7".format(OPTED):
+            return {"app-local-state": {"key-value": [
+                {"key": b64encode(b"\x00").decode(), "value": {"type": 1, "bytes": b64encode(b"\x02" * 127).decode()}},
+            ]}}
+        raise AlgodHTTPError("not found", code=404)
+
+
+def test_shared_algod():
+    assert shared_algod() is shared_algod()
+    assert shared_algod("b" * 64, "http://localhost:4001") is not shared_algod()
+
+
+@pytest.mark.parametrize("cls", [ThreadedAlgod, PooledAlgod])
+def test_decoded_state(cls):
+    algod = cls(RecordingClient())
+
+    async def go():
+        return (await algod.global_state(7), await algod.local_state(OPTED, 7),
+                await algod.local_state("B" * 58, 7))
+
+    glob, local, missing = asyncio.run(go())
+    assert glob == {b"coreid": 5, b"Treasury": b"\x01" * 32}
+    assert local == {b"\x00": b"\x02" * 127}
+    assert missing is None
+
+
+def test_params_are_cached_and_copied():
+    client = RecordingClient()
+    algod = PooledAlgod(client, params_ttl=60)
+
+    async def go():
+        a = await algod.suggested_params()
+        a.fee = 5000
+        b = await algod.suggested_params()
+        algod.invalidate_params()
+        c = await algod.suggested_params()
+        return a, b, c
+
+    a, b, c = asyncio.run(go())
+    assert b.fee == 0 and b.first == a.first
+    assert c.first == a.first + 1
+    assert client.requests == ["/transactions/params"] * 2
+
+
+def test_overlapping_calls_share_one_request():
+    client = RecordingClient()
+    algod = PooledAlgod(client, concurrency=4)
+
+    async def go():
+        client.delay.clear()
+        calls = [asyncio.ensure_future(algod.application_info(7)) for _ in range(10)]
+        calls.append(asyncio.ensure_future(algod.local_state(OPTED, 7)))
+        await asyncio.sleep(0.05)
+        client.delay.set()
+        out = await asyncio.gather(*calls)
+        # Once done the next call goes to the node again
+        await algod.application_info(7)
+        return out
+
+    out = asyncio.run(go())
+    algod.close()
+    assert all(o is out[0] for o in out[:10])
+    assert sorted(client.requests) == sorted(["/applications/7", "/accounts/{}/applications/7".format(OPTED), "/applications/7"])
+    assert algod.requests == 3
+    assert not algod.inflight
@@ -0,0 +1,96 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("algosdk")
+pytest.importorskip("msgpack")
+pytest.importorskip("pyteal")
+
+from asset_cache import AssetCache
+from local_algod import LocalAlgod
+from local_state import max_bytes, max_keys, page_size
+from state_index import LocalSource
+from TmplSig import TmplSig
+
+BRIDGE = 7
+SENDER = "A" * 58
+
+
+def record_blob(asset: int, max_amount: int) -> bytes:
+    blob = bytearray(max_bytes)
+    blob[0:8] = asset.to_bytes(8, "big")
+    blob[124:132] = max_amount.to_bytes(8, "big")
+    return bytes(blob)
+
+
+def store(algod: LocalAlgod, cache: AssetCache, asset: int, max_amount: int):
+    blob = record_blob(asset, max_amount)
+    for i in range(max_keys):
+        algod.set_local(cache.address(asset), BRIDGE, bytes([i]), blob[i * page_size:(i + 1) * page_size])
+
+
+@pytest.fixture
+def setup():
+    algod = LocalAlgod()
+    return algod, AssetCache(algod, TmplSig("sig"), BRIDGE, size=2)
+
+
+def test_hit_and_miss(setup):
+    algod, cache = setup
+    store(algod, cache, 10, 500)
+
+    assert asyncio.run(cache.get(10)).max_amount == 500
+    assert asyncio.run(cache.get(10)).max_amount == 500
+    assert asyncio.run(cache.get(11)) is None
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert algod.calls["local_state"] == 2
+
+
+def test_lru_eviction(setup):
+    algod, cache = setup
+    for asset in (1, 2, 3):
+        store(algod, cache, asset, asset)
+    for asset in (1, 2, 1, 3):
+        asyncio.run(cache.get(asset))
+    assert list(cache.records) == [1, 3]
+
+
+def test_update_token_config_invalidates(setup):
+    algod, cache = setup
+    store(algod, cache, 10, 500)
+    store(algod, cache, 11, 700)
+    asyncio.run(cache.get(10))
+    asyncio.run(cache.get(11))
+
+    store(algod, cache, 10, 900)
+    algod.round += 1
+    algod.confirm(SENDER, BRIDGE, [b"updateTokenConfig", (10).to_bytes(8, "big")])
+    assert asyncio.run(cache.sync(LocalSource(algod, BRIDGE))) == algod.round
+
+    assert list(cache.records) == [11]
+    assert asyncio.run(cache.get(10)).max_amount == 900
+
+
+def test_other_calls_keep_entries(setup):
+    algod, cache = setup
+    store(algod, cache, 10, 500)
+    asyncio.run(cache.get(10))
+
+    algod.round += 1
+    algod.confirm(SENDER, BRIDGE, [b"completeTransfer", (10).to_bytes(8, "big")])
+    algod.confirm(SENDER, BRIDGE + 1, [b"updateTokenConfig", (10).to_bytes(8, "big")])
+    asyncio.run(cache.sync(LocalSource(algod, BRIDGE)))
+
+    assert list(cache.records) == [10]
+
+
+def test_receive_attest_invalidates_by_account(setup):
+    algod, cache = setup
+    store(algod, cache, 10, 500)
+    asyncio.run(cache.get(10))
+
+    algod.round += 1
+    algod.confirm(SENDER, BRIDGE, [b"receiveAttest", b"vaa"], accounts=[SENDER, cache.address(10)])
+    asyncio.run(cache.sync(LocalSource(algod, BRIDGE)))
+
+    assert 10 not in cache.records
@@ -0,0 +1,59 @@
+import asyncio
+from base64 import b64decode
+
+import pytest
+
+pytest.importorskip("algosdk")
+pytest.importorskip("msgpack")
+
+from algosdk import account, encoding
+from algosdk.future import transaction
+from algosdk.future.transaction import LogicSigAccount
+
+from batch_sign import BatchSigner, program, sign_group
+
+GH = "SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI="
+LSIG = LogicSigAccount(b"\x06\x81\x01")
+
+
+@pytest.fixture(scope="module")
+def key():
+    return account.generate_account()
+
+
+def group(sender: str, n: int) -> list:
+    sp = transaction.SuggestedParams(1000, 100 + n, 1100, GH, "sandnet-v1", flat_fee=True)
+    txns = [transaction.ApplicationNoOpTxn(LSIG.address(), sp, 5, app_args=[b"verifySigs", bytes([n])]),
+            transaction.ApplicationNoOpTxn(sender, sp, 7, app_args=[b"completeTransfer", bytes([n])])]
+    transaction.assign_group_id(txns)
+    return txns
+
+
+def encoded(txns: list) -> list:
+    return [(b64decode(encoding.msgpack_encode(t)), program(LSIG) if t.sender == LSIG.address() else None) for t in txns]
+
+
+def expected(txns: list, sk: str) -> bytes:
+    signed = [transaction.LogicSigTransaction(t, LSIG) if t.sender == LSIG.address() else t.sign(sk) for t in txns]
+    return b"".join(b64decode(encoding.msgpack_encode(s)) for s in signed)
+
+
+def test_sign_group_matches_algosdk(key):
+    sk, sender = key
+    txns = group(sender, 0)
+    assert sign_group(encoded(txns), sk) == expected(txns, sk)
+
+
+def test_program_takes_plain_lsigs_only():
+    assert program(LSIG) == b"\x06\x81\x01"
+    with pytest.raises(ValueError):
+        program(LogicSigAccount(b"\x06\x81\x01", [b"arg"]))
+
+
+def test_pool_keeps_order(key):
+    sk, sender = key
+    groups = [group(sender, n) for n in range(10)]
+    with BatchSigner(sk, processes=2, chunk=3) as signer:
+        blobs = signer.sign_groups([encoded(g) for g in groups])
+        again = asyncio.run(signer.sign_async([encoded(g) for g in groups]))
+    assert blobs == again == [expected(g, sk) for g in groups]
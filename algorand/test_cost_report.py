@@ -0,0 +1,95 @@
+import pytest
+
+from cost_report import lap_cost, method_costs, report
+from fees import FeeModel
+
+TEAL = """#pragma version 6
+txna ApplicationArgs 0
+byte "hash"
+==
+bnz hash
+txna ApplicationArgs 0
+byte "cheap"
+==
+bnz cheap
+err
+hash:
+txna ApplicationArgs 1
+callsub digest
+pop
+int 1
+return
+digest:
+keccak256
+retsub
+cheap:
+int 1
+return
+"""
+
+
+LOOP = """#pragma version 6
+txna ApplicationArgs 0
+byte "batch"
+==
+bnz batch
+err
+batch:
+int 0
+store 0
+loop:
+load 0
+int 3
+<
+bz done
+itxn_begin
+int pay
+itxn_field TypeEnum
+itxn_submit
+load 0
+int 1
++
+store 0
+b loop
+done:
+int 1
+return
+"""
+
+
+def test_method_costs():
+    # Everything reachable from the entry, the subroutine included
+    assert method_costs(FeeModel(TEAL)) == {"hash": 5 + 130 + 1, "cheap": 2}
+
+
+def test_lap_cost():
+    model = FeeModel(LOOP)
+    # load, int, <, bz, the four itxn ops, load, int, +, store, b
+    assert lap_cost(model, "batch") == 13
+    assert method_costs(model)["batch"] == 2 + 13 + 2
+    assert lap_cost(FeeModel(TEAL), "hash") == 0
+
+
+def test_report():
+    lines = report({6: TEAL, 8: TEAL.replace("keccak256", "sha256")}).splitlines()
+    assert lines[0].split() == ["method", "v6", "v8", "v8-v6"]
+    assert lines[1].split() == ["cheap", "2", "2", "+0"]
+    assert lines[2].split() == ["hash", "136", "41", "-95"]
+
+
+def test_versions():
+    pytest.importorskip("algosdk")
+    pytest.importorskip("pyteal")
+    from cost_report import build
+
+    v6, v8 = build(6), build(8)
+    assert v6.startswith("#pragma version 6") and v8.startswith("#pragma version 8")
+    # Partial page writes use replace3 from TEAL 7 on
+    assert "replace3" not in v6 and "replace3" in v8
+    costs = {v: method_costs(FeeModel(t)) for v, t in ((6, v6), (8, v8))}
+    assert costs[6].keys() == costs[8].keys()
+    # Methods that touch no blob are lowered the same.  The others gain a one page fast
+    # path next to the general one, so their reachable cost is an upper bound that grows
+    for method in ("changeOwner", "registerChain", "retireBlock"):
+        assert costs[8][method] == costs[6][method]
+    assert "extract3" in v8 and "setbyte" in v8
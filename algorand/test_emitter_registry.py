@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("algosdk")
+
+from algosdk import account
+from algosdk.encoding import decode_address
+from algosdk.logic import get_application_address
+
+from conftest import transfer_payload, vaa_bytes
+from emitter_registry import EmitterRegistry
+from local_algod import LocalAlgod
+from state_index import LocalSource
+
+BRIDGE = 7
+ETH = (2).to_bytes(2, "big")
+ETH_EMITTER = b"\xee" * 32
+OWN = (8).to_bytes(2, "big") + decode_address(get_application_address(BRIDGE))
+
+
+@pytest.fixture
+def setup():
+    algod = LocalAlgod()
+    algod.set_global(BRIDGE, b"Chain" + ETH, ETH_EMITTER)
+    algod.set_global(BRIDGE, b"coreid", 5)
+    registry = EmitterRegistry(BRIDGE)
+    asyncio.run(registry.load(algod))
+    return algod, registry
+
+
+def test_load(setup):
+    algod, registry = setup
+    assert registry.emitters == {ETH + ETH_EMITTER, OWN}
+    assert registry.chains == {ETH: ETH_EMITTER}
+
+
+def test_load_with_low_mark():
+    algod = LocalAlgod()
+    # retireBlock appends the low water mark to the address
+    algod.set_global(BRIDGE, b"Chain" + ETH, ETH_EMITTER + (4).to_bytes(8, "big"))
+    registry = EmitterRegistry(BRIDGE)
+    asyncio.run(registry.load(algod))
+    assert registry.chains == {ETH: ETH_EMITTER}
+
+
+def test_accepts(setup):
+    algod, registry = setup
+    assert registry.accepts(vaa_bytes(1, ETH + ETH_EMITTER, transfer_payload(), num_sigs=2))
+    # Algorand transfers come from the bridge itself
+    assert registry.accepts(vaa_bytes(1, OWN, transfer_payload()))
+    # Attestations don't have a destination
+    assert registry.accepts(vaa_bytes(1, ETH + ETH_EMITTER, bytes([2]) + bytes(99)))
+
+    assert not registry.accepts(vaa_bytes(1, ETH + b"\xef" * 32, transfer_payload()))
+    assert not registry.accepts(vaa_bytes(1, ETH + ETH_EMITTER, transfer_payload(to_chain=2)))
+    assert not registry.accepts(b"\x01")
+    assert registry.dropped == 3
+
+
+def test_sync_picks_up_registrations(setup):
+    algod, registry = setup
+    sender = account.generate_account()[1]
+    algod.round = 1001
+    algod.confirm(sender, BRIDGE, [b"registerChain", ETH, b"\xef" * 32])
+    algod.confirm(sender, BRIDGE, [b"registerChain", (4).to_bytes(2, "big"), b"\xbb" * 32])
+    algod.confirm(sender, BRIDGE + 1, [b"registerChain", (5).to_bytes(2, "big"), b"\xcc" * 32])
+
+    assert asyncio.run(registry.sync(LocalSource(algod, BRIDGE))) == 1001
+    assert registry.emitters == {ETH + b"\xef" * 32, (4).to_bytes(2, "big") + b"\xbb" * 32, OWN}
+
+    # Registering chain 8 doesn't drop the bridge's own address
+    registry.register((8).to_bytes(2, "big"), b"\x01" * 32)
+    registry.register((8).to_bytes(2, "big"), b"\x02" * 32)
+    assert OWN in registry.emitters and (8).to_bytes(2, "big") + b"\x01" * 32 not in registry.emitters
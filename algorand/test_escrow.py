@@ -0,0 +1,51 @@
+import re
+
+from fees import FeeModel
+
+
+def on_create(teal: str):
+    # The ops of the branch the router takes for Txn.application_id() == 0, up to the
+    # first return
+    lines = [l.split("//")[0].strip() for l in teal.splitlines()]
+    label = next(l for l in lines if l.startswith("bnz ")).split()[1]
+    start = lines.index(label + ":")
+    return lines[start:lines.index("return", start)]
+
+
+def test_create_marks_payout(escrow_teal):
+    from escrow import global_uints
+
+    # The bridge only calls payout on escrows that have "ver", and only escrows created
+    # with room for it get one
+    ops = on_create(escrow_teal)
+    assert ops[1:3] == ["global CurrentApplicationID", "app_params_get AppGlobalNumUint"]
+    assert "pushint {}".format(global_uints) in ops
+    target = next(op for op in ops if op.startswith("bnz ")).split()[1]
+    lines = [l.split("//")[0].strip() for l in escrow_teal.splitlines()]
+    at = lines.index(target + ":")
+    assert lines[at + 1:at + 4] == ["pushbytes 0x766572", "intc_1", "app_global_put"]
+
+
+def test_payout_pays_each_receiver_once(escrow_teal):
+    from escrow import max_payouts
+
+    model = FeeModel(escrow_teal)
+    counts = {b.inner_txns for b in model.branches("payout")}
+    assert counts == set(range(max_payouts + 1))
+    # One payment per receiver, algo or the escrow's asset
+    assert all(set(b.calls) <= {("pay", None), ("axfer", None)} for b in model.branches("payout"))
+    # transfer and liquidity are still there for bridges that don't know payout
+    assert {b.inner_txns for b in model.branches("transfer")} == {1}
+    assert {b.inner_txns for b in model.branches("liquidity")} == {0}
+
+
+def test_send_from_escrow(escrow_teal):
+    from escrow import max_payouts
+
+    # transfer and every payout receiver go through the one sendFromEscrow, which pays
+    # algo or axfers the escrow's asset
+    assert len(re.findall(r"^callsub sendFromEscrow_\d+$", escrow_teal, re.M)) == 1 + max_payouts
+    model = FeeModel(escrow_teal)
+    assert {b.calls for b in model.branches("transfer")} == {(("pay", None),), (("axfer", None),)}
+    # A payout with no receivers, or only zero amounts, only books ain and aout
+    assert min(b.inner_txns for b in model.branches("payout")) == 0
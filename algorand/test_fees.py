@@ -0,0 +1,169 @@
+import pytest
+
+from fees import Branch, FeeModel, GroupTxn, bridge_fee_model, pooled_fees
+
+# redeem: one payment, then on two args an escrow payout
+BRIDGE = """#pragma version 6
+txn ApplicationID
+int 0
+==
+bnz create
+txna ApplicationArgs 0
+byte "redeem"
+==
+bnz redeem
+txna ApplicationArgs 0
+byte "idle"
+==
+bnz idle
+err
+create:
+int 1
+return
+redeem:
+itxn_begin
+int pay
+itxn_field TypeEnum
+itxn_submit
+txn NumAppArgs
+int 2
+==
+bz redeem_done
+callsub payout
+redeem_done:
+int 1
+return
+payout:
+itxn_begin
+int appl
+itxn_field TypeEnum
+byte "payout"
+itxn_field ApplicationArgs
+itxn_submit
+retsub
+idle:
+int 1
+return
+"""
+
+ESCROW = """#pragma version 6
+txna ApplicationArgs 0
+byte "payout"
+==
+bnz payout
+err
+payout:
+itxn_begin
+int pay
+itxn_field TypeEnum
+itxn_next
+int pay
+itxn_field TypeEnum
+itxn_submit
+int 1
+return
+"""
+
+PAY = ("pay", None)
+PAYOUT = ("appl", "payout")
+
+
+@pytest.fixture
+def bridge():
+    return FeeModel(BRIDGE, callees={"payout": FeeModel(ESCROW)})
+
+
+def test_branches(bridge):
+    assert bridge.methods() == ["redeem", "idle"]
+    assert bridge.branches("redeem") == [Branch((PAY,), 1), Branch((PAY, PAYOUT), 4)]
+    assert bridge.branches("idle") == [Branch((), 0)]
+    assert [b.count("payout") for b in bridge.branches("redeem")] == [0, 1]
+    with pytest.raises(KeyError):
+        bridge.branches("nope")
+
+
+def test_inner_txns(bridge):
+    assert bridge.inner_txns("redeem") == 4
+    assert bridge.inner_txns("redeem", lambda b: b.count("payout") == 0) == 1
+    with pytest.raises(ValueError):
+        bridge.inner_txns("redeem", lambda b: b.inner_txns == 2)
+
+
+def test_pooled_fees(bridge):
+    group = [
+        GroupTxn(lsig=True),
+        GroupTxn(),
+        GroupTxn(bridge, "redeem", where=lambda b: b.count("payout") == 1),
+        GroupTxn(bridge, "idle"),
+    ]
+    assert pooled_fees(group, 1000) == [0, 2000, 5000, 1000]
+    assert pooled_fees(group, 1000, payer=2) == [0, 0, 8000, 0]
+
+
+def test_pooled_fees_needs_a_payer():
+    with pytest.raises(ValueError):
+        pooled_fees([GroupTxn(lsig=True)], 1000)
+    with pytest.raises(ValueError):
+        pooled_fees([GroupTxn(lsig=True), GroupTxn()], 1000, payer=0)
+
+
+def test_compiled_bridge(bridge_teal, escrow_teal):
+    model = bridge_fee_model(bridge_teal, escrow_teal)
+    # Escrows without payout: transfer pays with an inner transaction of its own
+    legacy = {b.inner_txns for b in model.branches("completeTransfer") if b.count("payout") == 0}
+    assert legacy == {3, 5, 7}
+    assert model.inner_txns("completeTransfer", lambda b: b.count("transfer") == 1) == 3
+    # payout pays the treasury, the receiver and the relayer from a single call
+    assert model.inner_txns("completeTransfer", lambda b: b.count("payout") == 1) == 1 + 4
+    assert model.inner_txns("registerChain") == 0
+
+    # vaa_verify, core verifyVAA, completeTransfer with a bridge and a relayer fee
+    group = [GroupTxn(lsig=True), GroupTxn(), GroupTxn(model, "completeTransfer", lambda b: b.count("payout") == 0)]
+    assert pooled_fees(group, 1000) == [0, 2000, 8000]
+
+
+# batch: one payment per iteration of a loop over the first argument
+BATCH = """#pragma version 6
+txna ApplicationArgs 0
+byte "batch"
+==
+bnz batch
+err
+batch:
+int 0
+store 0
+loop:
+load 0
+txna ApplicationArgs 1
+btoi
+<
+bz done
+itxn_begin
+int pay
+itxn_field TypeEnum
+itxn_submit
+load 0
+int 1
++
+store 0
+b loop
+done:
+int 1
+return
+"""
+
+
+def test_loop_is_priced_per_item():
+    model = FeeModel(BATCH)
+    assert model.per_item("batch") == 1
+    assert model.inner_txns("batch") == 0
+    assert model.inner_txns("batch", items=5) == 5
+    assert pooled_fees([GroupTxn(model, "batch", items=3)], 1000) == [4000]
+
+
+def test_compiled_batch(bridge_teal, escrow_teal):
+    model = bridge_fee_model(bridge_teal, escrow_teal)
+    # each transfer pays the message fee and publishes its message
+    assert model.per_item("sendTransferBatch") == 2
+    assert model.per_item("sendTransfer") == 0
+    assert model.inner_txns("sendTransferBatch", items=3) == model.inner_txns("sendTransferBatch") + 6
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("algosdk")
+pytest.importorskip("msgpack")
+
+from algosdk import account
+from algosdk.future import transaction
+
+from group_template import GroupTemplate, sign_raw
+from local_algod import LocalAlgod
+
+GH = "SGO1GKSzyE7IEPItTxCByw9x8FmnrCDexi9/cOUJOiI="
+
+
+def build(t: GroupTemplate, sender: str, sp: transaction.SuggestedParams, vaa: bytes, fee: int, dest: str):
+    a = transaction.ApplicationNoOpTxn(sender, sp, 5, app_args=[b"verifyVAA", vaa], accounts=[dest])
+    a.fee = fee
+    b = transaction.ApplicationNoOpTxn(sender, sp, 7, app_args=[b"completeTransfer", vaa], accounts=[dest])
+    b.fee = fee
+    return [a, b]
+
+
+@pytest.fixture
+def key():
+    return account.generate_account()
+
+
+def template(sender: str):
+    t = GroupTemplate()
+    sp = transaction.SuggestedParams(0, t.int("first"), t.int("last"), GH, "sandnet-v1", flat_fee=True)
+    t.freeze(build(t, sender, sp, t.bytes("vaa"), t.int("fee"), t.address("dest")))
+    return t
+
+
+def test_fill_matches_algosdk(key):
+    sk, sender = key
+    dest = account.generate_account()[1]
+    values = {"first": 100, "last": 1100, "vaa": b"\x01" * 200, "fee": 3000, "dest": dest}
+    filled = template(sender).fill(values)
+
+    sp = transaction.SuggestedParams(0, 100, 1100, GH, "sandnet-v1", flat_fee=True)
+    txns = build(None, sender, sp, values["vaa"], 3000, dest)
+    transaction.assign_group_id(txns)
+
+    assert filled.group == txns[0].group
+    assert filled.txids == [t.get_txid() for t in txns]
+
+
+def test_fill_rejects_empty(key):
+    t = template(key[1])
+    with pytest.raises(ValueError):
+        t.fill({"first": 100, "last": 1100, "vaa": b"", "fee": 3000, "dest": key[1]})
+
+
+def test_send_raw_group(key):
+    sk, sender = key
+    dest = account.generate_account()[1]
+    filled = template(sender).fill({"first": 100, "last": 1100, "vaa": b"\x02" * 90, "fee": 2000, "dest": dest})
+
+    algod = LocalAlgod()
+    txid = asyncio.run(algod.send_raw_group(b"".join(sign_raw(raw, sk) for raw in filled.txns)))
+
+    assert txid == filled.txids[0]
+    sent = algod.sent[-1]
+    assert len(sent) == 2
+    assert [s["txn"]["apid"] for s in sent] == [5, 7]
+    assert all(s["txn"]["apaa"][1] == b"\x02" * 90 for s in sent)
+    assert all(s["txn"]["grp"] == filled.group for s in sent)
@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("pyteal")
+
+from pyteal import Bytes, Int, Mode, Pop, ScratchSlot, Seq, TealInputError, TealType, compileTeal
+
+from inlineasm import InlineAssembly
+
+
+def compile_app(expr, version: int, mode: Mode = Mode.Application) -> str:
+    return compileTeal(Seq(expr, Int(1)), mode=mode, version=version)
+
+
+def test_immediates_from_string():
+    op = InlineAssembly("extract 5 1", Bytes("abcdefgh"), type=TealType.bytes)
+    assert op.opcode_args == [5, 1]
+    assert op.op.min_version == 5
+    assert "extract 5 1" in compile_app(Pop(op), 5)
+
+
+def test_version_check():
+    with pytest.raises(TealInputError):
+        compile_app(Pop(InlineAssembly("extract 5 1", Bytes("abcdefgh"), type=TealType.bytes)), 4)
+    op = InlineAssembly("ecdsa_pk_decompress", Bytes("k"), immediates=["Secp256r1"],
+                        outputs=[TealType.bytes, TealType.bytes])
+    assert op.op.min_version == 7
+    with pytest.raises(TealInputError):
+        compile_app(op, 6)
+
+
+def test_min_version_raises_known_opcodes():
+    assert InlineAssembly("dup", Int(1), outputs=[TealType.uint64, TealType.uint64], min_version=6).op.min_version == 6
+
+
+def test_unknown_opcode():
+    op = InlineAssembly("bitlen", Int(5), type=TealType.uint64, min_version=4)
+    assert op.op.min_version == 4
+    assert "bitlen" in compile_app(Pop(op), 4)
+
+
+@pytest.mark.parametrize("make", [
+    # immediate count
+    lambda: InlineAssembly("extract 5", Bytes("ab"), type=TealType.bytes),
+    # immediate kinds and ranges
+    lambda: InlineAssembly("load 256", type=TealType.uint64),
+    lambda: InlineAssembly("load x", type=TealType.uint64),
+    lambda: InlineAssembly("frame_dig 128", type=TealType.uint64),
+    lambda: InlineAssembly("ecdsa_verify", *[Bytes("a")] * 5, immediates=["Ed25519"], type=TealType.uint64),
+    lambda: InlineAssembly("ecdsa_pk_recover", *[Bytes("a")] * 4, immediates=["Secp256r1"],
+                           outputs=[TealType.bytes, TealType.bytes]),
+    # argument and output counts
+    lambda: InlineAssembly("extract3", Bytes("ab"), Int(0), type=TealType.bytes),
+    lambda: InlineAssembly("ecdsa_pk_decompress Secp256k1", Bytes("k"), type=TealType.bytes),
+])
+def test_rejected(make):
+    with pytest.raises(TealInputError):
+        make()
+
+
+def test_accepted_ranges():
+    assert InlineAssembly("frame_dig -128", type=TealType.uint64).opcode_args == [-128]
+    assert InlineAssembly("load 255", type=TealType.uint64).op.min_version == 1
+
+
+def test_app_only_opcodes():
+    op = InlineAssembly("box_len", Bytes("b"), outputs=[TealType.uint64, TealType.uint64])
+    assert op.op.mode == Mode.Application
+    compile_app(op, 8)
+    with pytest.raises(TealInputError):
+        compile_app(op, 8, Mode.Signature)
+
+
+def test_outputs():
+    op = InlineAssembly("ecdsa_pk_decompress Secp256k1", Bytes("k"), outputs=[TealType.bytes, TealType.bytes])
+    assert op.type_of() == TealType.none
+    teal = compile_app(op.outputReducer(lambda x, y: Pop(Bytes("") == y)), 5).splitlines()
+    at = teal.index("ecdsa_pk_decompress Secp256k1")
+    # The top of the stack (y) is stored first
+    assert teal[at + 1].startswith("store ") and teal[at + 2].startswith("store ")
+    y = teal[at + 1].split()[1]
+    assert "load " + y in teal[at + 3:]
+
+
+def test_fixed_slots():
+    x, y = ScratchSlot(240), ScratchSlot(241)
+    op = InlineAssembly("ecdsa_pk_decompress Secp256k1", Bytes("k"), outputs=[TealType.bytes, TealType.bytes],
+                        slots=[x, y])
+    teal = compile_app(op.outputReducer(lambda a, b: Pop(a == b)), 5).splitlines()
+    at = teal.index("ecdsa_pk_decompress Secp256k1")
+    assert teal[at + 1:at + 3] == ["store 241", "store 240"]
+    with pytest.raises(TealInputError):
+        InlineAssembly("ecdsa_pk_decompress Secp256k1", Bytes("k"), outputs=[TealType.bytes, TealType.bytes],
+                       slots=[x])
+
+
+def test_vaa_verify_slots():
+    from vaa_verify import vaa_verify_program
+
+    teal = compileTeal(vaa_verify_program(), mode=Mode.Signature, version=6).splitlines()
+    # The recovered key goes through the slots the deployed program uses
+    at = next(i for i, l in enumerate(teal) if l.startswith("ecdsa_pk_recover"))
+    assert teal[at + 1:at + 3] == ["store 241", "store 240"]
@@ -0,0 +1,67 @@
+from base64 import b64encode
+
+from local_state import (blob_bytes, chain_prefix, chain_value, decode_asset, decode_local_state, is_redeemed,
+                         low_marks, max_bits, max_bytes, max_keys, page_size, replay_block)
+
+
+def record_blob() -> bytes:
+    blob = bytearray(max_bytes)
+    blob[0:8] = (31).to_bytes(8, "big")
+    blob[116:124] = (31).to_bytes(8, "big")
+    blob[124:132] = (10 ** 12).to_bytes(8, "big")
+    blob[174:182] = (5).to_bytes(8, "big")
+    blob[190:198] = (99).to_bytes(8, "big")
+    blob[200] = 11
+    blob[201:209] = (100).to_bytes(8, "big")
+    return bytes(blob)
+
+
+def test_decode_local_state():
+    kv = [{"key": b64encode(b"\x00").decode(), "value": {"type": 1, "bytes": b64encode(b"\x01" * 127).decode()}},
+          {"key": b64encode(b"Lows").decode(), "value": {"type": 2, "uint": 3}}]
+    assert decode_local_state(kv) == {b"\x00": b"\x01" * 127, b"Lows": 3}
+
+
+def test_low_marks():
+    eth, sol = (2).to_bytes(2, "big"), (1).to_bytes(2, "big")
+    assert chain_value(b"\xee" * 32) == b"\xee" * 32
+    state = {
+        chain_prefix + eth: chain_value(b"\xee" * 32, 3),
+        chain_prefix + sol: chain_value(b"\x01" * 32),          # nothing retired yet
+        b"coreid": 5,
+    }
+    assert low_marks(state) == {eth + b"\xee" * 32: 3, sol + b"\x01" * 32: 0}
+
+
+def test_blob_bytes():
+    state = {bytes([i]): bytes([i]) * page_size for i in range(1, max_keys)}
+    blob = blob_bytes(state)
+    assert len(blob) == max_bytes
+    assert blob[:page_size] == bytes(page_size) and blob[-1] == max_keys - 1
+
+
+def test_replay_bits():
+    blob = (1 << 10 | 1 << 800).to_bytes(max_bytes, "little")
+    assert [is_redeemed(blob, s) for s in (9, 10, 800, max_bits + 10)] == [False, True, True, True]
+    assert [replay_block(s) for s in (0, max_bits - 1, max_bits)] == [0, 0, 1]
+
+
+def test_decode_asset():
+    assert decode_asset(bytes(max_bytes)) is None
+    r = decode_asset(record_blob())
+    assert (r.asset, r.native, r.max_amount, r.transfer_fee, r.escrow) == (31, 31, 10 ** 12, 5, 99)
+    assert (r.scale_decimals, r.scale) == (11, 100)
+    assert r.version == 1
+
+
+def test_decode_packed_asset():
+    old = record_blob()
+    blob = bytearray(old)
+    # The bridge reads the packed copy, leave the original offsets stale
+    blob[124:132] = bytes(8)
+    blob[254] = 2
+    blob[255:348] = old[116:209]
+    blob[348:356] = old[0:8]
+    r = decode_asset(bytes(blob))
+    assert r.version == 2
+    assert r == decode_asset(old)._replace(version=2)
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from preflight import ALGORAND_CHAIN, BridgeState, FEE_SCALE, check, index_redeemed
+from local_state import AssetRecord, max_bits, max_bytes, max_keys, page_size
+
+BRIDGE = b"\xbb" * 32
+EMITTER = (2).to_bytes(2, "big") + b"\xee" * 32
+
+
+def vaa(sequence: int = 1, amount: int = 10 ** 8, fee: int = 0, asset: int = 0, emitter: bytes = EMITTER,
+        action: int = 1, version: int = 1, origin_chain: int = ALGORAND_CHAIN, dest_chain: int = ALGORAND_CHAIN) -> bytes:
+    header = bytes([version]) + (0).to_bytes(4, "big") + bytes([1]) + bytes(66)
+    body = bytes(8) + emitter + sequence.to_bytes(8, "big") + b"\x0f"
+    token = asset.to_bytes(32, "big") if origin_chain == ALGORAND_CHAIN else b"\x77" * 32
+    payload = (bytes([action]) + amount.to_bytes(32, "big") + token + origin_chain.to_bytes(2, "big") +
+               b"\xdd" * 32 + dest_chain.to_bytes(2, "big") + fee.to_bytes(32, "big"))
+    return header + body + payload
+
+
+def record(asset: int = 0, max_amount: int = 0, redeem_fee: int = 0, scale_decimals: int = 0) -> AssetRecord:
+    return AssetRecord(asset=asset, native=asset, max_amount=max_amount, min_amount=0, origin_address=bytes(32),
+                       origin_chain=ALGORAND_CHAIN, transfer_fee=0, redeem_fee=redeem_fee, escrow=0,
+                       source_fee=0, dest_fee=0, scale_decimals=scale_decimals, scale=0, version=1)
+
+
+def state(**kw) -> BridgeState:
+    args = dict(paused=False, bridge_address=BRIDGE, emitters={EMITTER}, redeemed=lambda e, s: False,
+                assets={0: record()}, wrapped={}, decimals={})
+    args.update(kw)
+    return BridgeState(**args)
+
+
+def rules(raws, st=None):
+    return [v.rule for v in check(raws, st or state())]
+
+
+def test_transfer():
+    [v] = check([vaa(amount=5 * 10 ** 8, fee=10 ** 8)], state())
+    # algo has 6 decimals, the 8 decimal amounts are divided by 100
+    assert v == (True, None, 0, 5 * 10 ** 6, 10 ** 6, 0)
+
+
+def test_decimals():
+    st = state(assets={0: record(), 31: record(31), 32: record(32)}, decimals={31: 10, 32: 20})
+    [v] = check([vaa(asset=31, amount=3)], st)
+    assert (v.ok, v.asset, v.amount) == (True, 31, 300)
+    assert rules([vaa(asset=32)], st) == ["decimals"]
+    assert rules([vaa(asset=31, amount=1 << 63)], st) == ["normalize"]
+
+
+def test_stored_decimals():
+    # The record's decimals win over the asa lookup
+    st = state(assets={0: record(), 31: record(31, scale_decimals=11)}, decimals={31: 2})
+    [v] = check([vaa(asset=31, amount=3)], st)
+    assert (v.ok, v.asset, v.amount) == (True, 31, 300)
+
+
+def test_paused():
+    assert rules([vaa(), vaa()], state(paused=True)) == ["paused", "paused"]
+
+
+def test_header_rules():
+    assert rules([vaa()[:200], vaa(version=2)]) == ["length", "version"]
+
+
+def test_replay_rules():
+    st = state(redeemed=lambda e, s: s == 7, lows={EMITTER: 1})
+    assert rules([vaa(sequence=3), vaa(sequence=7), vaa(sequence=max_bits + 7), vaa(sequence=max_bits)], st) == \
+        ["retired", "retired", None, None]
+    st = st._replace(lows={})
+    assert rules([vaa(sequence=7), vaa(sequence=8), vaa(sequence=max_bits + 7)], st) == ["duplicate", None, None]
+
+
+def test_emitter():
+    own = ALGORAND_CHAIN.to_bytes(2, "big") + BRIDGE
+    other = ALGORAND_CHAIN.to_bytes(2, "big") + b"\x01" * 32
+    unknown = (4).to_bytes(2, "big") + b"\xee" * 32
+    assert rules([vaa(emitter=own), vaa(emitter=other), vaa(emitter=unknown)]) == [None, "emitter", "emitter"]
+
+
+def test_payload_rules():
+    raws = [vaa(action=2), vaa(amount=1 << 64), vaa(fee=1 << 64), vaa(dest_chain=2), vaa(amount=5, fee=6)]
+    assert rules(raws) == ["action", "amount_high", "fee_high", "dest_chain", "fee"]
+
+
+def test_asset_rules():
+    st = state(assets={0: record(max_amount=10 ** 6)}, wrapped={(2, b"\x66" * 32): 40})
+    raws = [vaa(asset=9), vaa(origin_chain=2), vaa(amount=2 * 10 ** 8), vaa(amount=10 ** 8)]
+    assert rules(raws, st) == ["asset", "asset", "token_max", None]
+
+
+def test_bridge_fee():
+    st = state(assets={0: record(redeem_fee=FEE_SCALE // 100)})
+    [v] = check([vaa(amount=10 ** 8)], st)
+    assert (v.amount, v.bridge_fee) == (99 * 10 ** 4, 10 ** 4)
+
+    st = state(assets={0: record(redeem_fee=2 * FEE_SCALE)})
+    assert rules([vaa(amount=10 ** 8)], st) == ["bridge_fee"]
+
+
+def test_index_redeemed(tmp_path):
+    pytest.importorskip("algosdk")
+    pytest.importorskip("pyteal")
+    from algosdk.logic import get_application_address
+    from local_algod import LocalAlgod
+    from state_index import LocalSource, StateIndex
+    from TmplSig import TmplSig
+
+    tmpl = TmplSig("sig")
+    algod = LocalAlgod()
+    blob = (1 << 7).to_bytes(max_bytes, "little")
+    addr = tmpl.get_sig_address(0, EMITTER, 7, get_application_address(7))
+    for i in range(max_keys):
+        algod.set_local(addr, 7, bytes([i]), blob[i * page_size:(i + 1) * page_size])
+    index = StateIndex(str(tmp_path / "idx"), 7)
+    asyncio.run(index.refresh(algod, LocalSource(algod, 7)))
+
+    redeemed = index_redeemed(index, tmpl, 7, get_application_address(7))
+    assert [redeemed(EMITTER, s) for s in (6, 7, max_bits + 7)] == [False, True, False]
+    index.close()
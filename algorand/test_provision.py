@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("algosdk")
+pytest.importorskip("pyteal")
+
+from algosdk import account
+from algosdk.logic import get_application_address
+
+from local_algod import LocalAlgod
+from local_state import max_bits
+from provision import ReplayProvisioner, optin_group
+from TmplSig import TmplSig
+
+BRIDGE = 7
+EMITTER = (2).to_bytes(2, "big") + b"\xee" * 32
+
+
+@pytest.fixture
+def prov():
+    sk, sender = account.generate_account()
+    return ReplayProvisioner(LocalAlgod(), TmplSig("sig"), BRIDGE, sender, sk, 1002000, [EMITTER],
+                             horizon=100.0, margin=10)
+
+
+def test_rate(prov):
+    assert prov.rates[EMITTER] is None
+    prov.observe(EMITTER, 100, at=0.0)
+    assert prov.rates[EMITTER].per_second == 0
+    prov.observe(EMITTER, 200, at=10.0)
+    assert prov.rates[EMITTER].per_second == 10
+    # Smoothed towards the new rate, old sequences don't count
+    prov.observe(EMITTER, 400, at=20.0)
+    assert prov.rates[EMITTER].per_second == pytest.approx(0.2 * 20 + 0.8 * 10)
+    prov.observe(EMITTER, 300, at=30.0)
+    assert prov.rates[EMITTER].sequence == 400
+
+
+def test_due(prov):
+    assert prov.due(0.0) == []
+    prov.observe(EMITTER, 5, at=0.0)
+    assert prov.due(0.0) == [(EMITTER, 0)]
+
+    # Within margin of the boundary
+    prov.observe(EMITTER, max_bits - 5, at=1.0)
+    assert prov.due(1.0) == [(EMITTER, 0), (EMITTER, 1)]
+
+    # Far from the boundary, but close enough in time at 10 a second
+    prov = ReplayProvisioner(prov.algod, prov.tmpl_sig, BRIDGE, prov.sender, prov.private_key, 1002000, horizon=50.0, margin=10)
+    prov.observe(EMITTER, max_bits - 2000, at=0.0)
+    prov.observe(EMITTER, max_bits - 1000, at=100.0)
+    assert prov.due(100.0) == [(EMITTER, 0)]
+    # Where the emitter should be 60 seconds on
+    assert prov.due(160.0) == [(EMITTER, 0), (EMITTER, 1)]
+
+
+def test_tick_opts_in_once(prov):
+    algod = prov.algod
+    tmpl = prov.tmpl_sig
+    current = tmpl.get_sig_address(0, EMITTER, BRIDGE, get_application_address(BRIDGE))
+    algod.opt_in(current, BRIDGE)
+
+    prov.observe(EMITTER, max_bits - 3, at=0.0)
+    txids = asyncio.run(prov.tick(0.0))
+
+    assert len(txids) == 1 and len(algod.sent) == 1
+    pay, optin = algod.sent[0]
+    lsig = tmpl.get_sig_account(1, EMITTER, BRIDGE, get_application_address(BRIDGE))
+    assert pay.transaction.receiver == lsig.address() and pay.transaction.amt == 1002000
+    assert optin.transaction.sender == lsig.address() and optin.lsig.logic == lsig.lsig.logic
+    assert prov.ready == {(EMITTER, 0), (EMITTER, 1)}
+
+    assert asyncio.run(prov.tick(0.0)) == []
+    assert len(algod.sent) == 1
+
+
+def test_failed_optin_is_retried(prov):
+    async def down(signed):
+        raise ConnectionError()
+
+    send = prov.algod.send_group
+    prov.algod.send_group = down
+    prov.observe(EMITTER, 3, at=0.0)
+    assert asyncio.run(prov.tick(0.0)) == []
+    assert prov.ready == set()
+
+    prov.algod.send_group = send
+    assert len(asyncio.run(prov.tick(0.0))) == 1
+
+
+def test_optin_group():
+    sp = asyncio.run(LocalAlgod().suggested_params())
+    lsig = TmplSig("sig").get_sig_account(0, EMITTER, BRIDGE, get_application_address(BRIDGE))
+    pay, optin = optin_group(sp, account.generate_account()[1], lsig, BRIDGE, 1002000)
+    assert (pay.fee, optin.fee) == (2000, 0)
+    assert optin.rekey_to == get_application_address(BRIDGE)
+    assert pay.group == optin.group
@@ -0,0 +1,210 @@
+import asyncio
+from base64 import b64decode, b64encode
+
+import pytest
+
+pytest.importorskip("algosdk")
+msgpack = pytest.importorskip("msgpack")
+pytest.importorskip("pyteal")
+coincurve = pytest.importorskip("coincurve")
+keccak = pytest.importorskip("Cryptodome.Hash.keccak")
+
+from algosdk import account
+from algosdk.encoding import decode_address, future_msgpack_decode, msgpack_encode
+from algosdk.future.transaction import LogicSigAccount, LogicSigTransaction, SignedTransaction
+from algosdk.logic import get_application_address
+
+from nacl.signing import VerifyKey
+
+from batch_sign import BatchSigner
+from conftest import transfer_payload, vaa_bytes
+from emitter_registry import EmitterRegistry
+from fees import bridge_fee_model
+from local_algod import LocalAlgod
+from local_state import chain_prefix, chain_value, max_bits, max_bytes, max_keys, page_size
+from relayer import BridgeRedeemer, Pipeline, Stage, completion_where, recover_guardian
+from TmplSig import TmplSig
+from vaa import parse_vaa
+
+BRIDGE = 7
+CORE = 5
+ESCROW = 9
+EMITTER = (2).to_bytes(2, "big") + b"\xee" * 32
+GUARDIAN = coincurve.PrivateKey(b"\x01" * 32)
+GUARDIAN_ADDR = keccak.new(digest_bits=256, data=GUARDIAN.public_key.format(compressed=False)[1:]).digest()[12:]
+
+
+def vaa(sequence: int, dest_chain: int = 8, signed: bool = False) -> bytes:
+    raw = vaa_bytes(sequence, EMITTER, transfer_payload(to_chain=dest_chain), num_sigs=1 if signed else 0)
+    if signed:
+        sig = GUARDIAN.sign_recoverable(parse_vaa(raw).digest(), hasher=None)
+        raw = raw[:6] + b"\x00" + sig + raw[6 + 66:]
+    return raw
+
+
+@pytest.fixture(scope="module")
+def fee_model(bridge_teal, escrow_teal):
+    return bridge_fee_model(bridge_teal, escrow_teal)
+
+
+@pytest.fixture
+def setup(fee_model):
+    algod = LocalAlgod()
+    sk, sender = account.generate_account()
+    redeemer = BridgeRedeemer(algod, TmplSig("sig"), BRIDGE, CORE, sender, sk,
+                              LogicSigAccount(b"\x06\x81\x01"), 1002000, fee_model)
+    return algod, redeemer
+
+
+def decoded(group: list) -> list:
+    """
+    A submitted group as algosdk objects, raw groups arrive as msgpack dicts
+    """
+    return [future_msgpack_decode(b64encode(msgpack.packb(s, use_bin_type=True)).decode()) if isinstance(s, dict) else s
+            for s in group]
+
+
+def store(algod: LocalAlgod, addr: str, app_id: int, blob: bytes):
+    blob = blob.ljust(max_bytes, b"\0")
+    for i in range(max_keys):
+        algod.set_local(addr, app_id, bytes([i]), blob[i * page_size:(i + 1) * page_size])
+
+
+def store_bits(algod: LocalAlgod, redeemer: BridgeRedeemer, block: int, x: int):
+    addr = redeemer.tmpl_sig.get_sig_address(block, EMITTER, BRIDGE, redeemer.bridge_addr)
+    store(algod, addr, BRIDGE, x.to_bytes(max_bytes, "little"))
+
+
+def dup_of(redeemer: BridgeRedeemer, sequence: int):
+    return asyncio.run(redeemer.check_duplicate(asyncio.run(redeemer.decode(vaa(sequence)))))
+
+
+def test_pipeline_counts():
+    async def half(x):
+        return x // 2 if x % 2 == 0 else None
+
+    async def boom(x):
+        if x == 4:
+            raise ValueError(x)
+        return x
+
+    seen = []
+
+    async def collect(x):
+        seen.append(x)
+        return x if x else None
+
+    stages = [Stage("half", half, 4), Stage("boom", boom), Stage("collect", collect)]
+    stats = asyncio.run(Pipeline(stages, queue_size=4).run(range(20)))
+
+    assert stats["half"] == {"in": 20, "out": 10, "dropped": 10, "failed": 0}
+    assert stats["boom"] == {"in": 10, "out": 9, "dropped": 1, "failed": 1}
+    assert stats["collect"] == {"in": 9, "out": 8, "dropped": 1, "failed": 0}
+    assert sorted(seen) == [0, 1, 2, 3, 5, 6, 7, 8, 9]
+
+
+def test_recover_guardian():
+    digest = parse_vaa(vaa(1, signed=True)).digest()
+    assert recover_guardian(digest, GUARDIAN.sign_recoverable(digest, hasher=None)) == GUARDIAN_ADDR
+
+
+def test_decode(setup):
+    algod, redeemer = setup
+    r = asyncio.run(redeemer.decode(vaa(3)))
+    assert (r.vaa.emitter, r.vaa.sequence, r.transfer.action) == (EMITTER, 3, 1)
+    assert asyncio.run(redeemer.decode(vaa(3, dest_chain=2))) is None
+    assert asyncio.run(redeemer.decode(vaa(3)[:40])) is None
+
+
+def test_decode_with_registry(setup):
+    algod, redeemer = setup
+    redeemer.registry = EmitterRegistry(BRIDGE)
+    assert asyncio.run(redeemer.decode(vaa(3))) is None
+    redeemer.registry.register(EMITTER[:2], EMITTER[2:])
+    assert asyncio.run(redeemer.decode(vaa(3))) is not None
+
+
+def test_check_duplicate(setup):
+    algod, redeemer = setup
+    store_bits(algod, redeemer, 0, 1 << 3)
+
+    assert dup_of(redeemer, 3) is None
+    r = dup_of(redeemer, 4)
+    assert r is not None and not r.needs_optin
+    assert r.replay.address() == redeemer.tmpl_sig.get_sig_address(0, EMITTER, BRIDGE, redeemer.bridge_addr)
+    # Block 1 has no account yet
+    assert dup_of(redeemer, max_bits).needs_optin
+
+
+def test_check_duplicate_below_low_mark(setup):
+    algod, redeemer = setup
+    assert dup_of(redeemer, 5).needs_optin
+
+    # The block was retired and its account closed since the marks were read
+    algod.set_global(BRIDGE, chain_prefix + EMITTER[:2], chain_value(EMITTER[2:], 1))
+    assert dup_of(redeemer, 5) is None
+    assert dup_of(redeemer, max_bits + 5).needs_optin
+
+    # Once the mark is known the retired block isn't looked up at all
+    fetched = algod.calls["local_state"]
+    assert dup_of(redeemer, 6) is None
+    assert algod.calls["local_state"] == fetched
+
+
+def test_completion_where(fee_model):
+    counts = {(payout, bfee, fee): fee_model.inner_txns("completeTransfer", completion_where(payout, bfee, fee))
+              for payout in (False, True) for bfee in (False, True) for fee in (False, True)}
+    # Every combination has a branch.  Each fee adds a payment to the payout call, or a
+    # transfer call and its payment without payout
+    assert counts[(True, False, False)] == counts[(True, True, True)] - 2
+    assert counts[(False, False, False)] == counts[(False, True, True)] - 4
+    assert counts[(True, True, False)] == counts[(True, False, True)]
+    assert counts[(False, True, False)] == counts[(False, False, True)]
+    assert max(counts.values()) == fee_model.inner_txns("completeTransfer")
+
+
+@pytest.mark.parametrize("pooled", [False, True])
+def test_full_group(setup, fee_model, pooled):
+    algod, redeemer = setup
+    if pooled:
+        redeemer.signer = BatchSigner(redeemer.private_key, processes=1)
+    tmpl = redeemer.tmpl_sig
+    treasury = account.generate_account()[1]
+    algod.set_global(BRIDGE, b"Treasury", decode_address(treasury))
+    store(algod, tmpl.get_sig_address(0, b"guardian", CORE, get_application_address(CORE)), CORE, b"\x01" + GUARDIAN_ADDR)
+    # ALGO's record, with its escrow
+    store(algod, tmpl.get_sig_address(0, b"native", BRIDGE, redeemer.bridge_addr), BRIDGE,
+          bytes(190) + ESCROW.to_bytes(8, "big"))
+    store_bits(algod, redeemer, 0, 1 << 3)
+
+    forged = bytearray(vaa(5, signed=True))
+    forged[-1] ^= 1
+    raws = [vaa(3, signed=True), vaa(4, signed=True), bytes(forged), vaa(max_bits, signed=True)]
+    stats = asyncio.run(Pipeline(redeemer.stages()).run(raws))
+    if pooled:
+        redeemer.signer.close()
+
+    assert stats["duplicate"]["dropped"] == 1
+    assert stats["verify"]["dropped"] == 1
+    assert stats["submit"]["out"] == 2
+
+    # The new block is opted in ahead of its redeem
+    sent = sorted((decoded(g) for g in algod.sent), key=len)
+    assert [len(g) for g in sent] == [2, 3, 3]
+    assert [t.transaction.type for t in sent[0]] == ["pay", "appl"]
+
+    for group in sent[1:]:
+        assert isinstance(group[0], LogicSigTransaction) and isinstance(group[1], SignedTransaction)
+        verify, core, call = (s.transaction for s in group)
+        for s in group[1:]:
+            VerifyKey(decode_address(redeemer.sender)).verify(b"TX" + b64decode(msgpack_encode(s.transaction)), b64decode(s.signature))
+        assert verify.app_args[0] == b"verifySigs" and core.app_args[0] == b"verifyVAA"
+        assert call.app_args[0] == b"completeTransfer"
+        assert call.accounts[3] == treasury and call.foreign_apps == [CORE, ESCROW]
+        # The lsig pays nothing, the first signed transaction covers it
+        assert [verify.fee, core.fee] == [0, 2000]
+        # Priced by the branch that runs: no payout on the escrow, no fees to pay
+        inner = fee_model.inner_txns("completeTransfer", completion_where(False, False, False))
+        assert inner < fee_model.inner_txns("completeTransfer")
+        assert call.fee == 1000 * (1 + inner)
+        assert len({verify.group, core.group, call.group}) == 1
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("algosdk")
+pytest.importorskip("pyteal")
+
+from algosdk import account
+from algosdk.logic import get_application_address
+
+from local_algod import LocalAlgod
+from local_state import chain_prefix, chain_value, max_keys, page_size
+from replay_compactor import ReplayCompactor, reclaim_group, retire_txn
+from TmplSig import TmplSig
+
+BRIDGE = 7
+EMITTER = (2).to_bytes(2, "big") + b"\xee" * 32
+
+
+@pytest.fixture
+def comp():
+    sk, sender = account.generate_account()
+    treasury_key = account.generate_account()[0]
+    return ReplayCompactor(LocalAlgod(), TmplSig("sig"), BRIDGE, sender, sk, treasury_key, [EMITTER])
+
+
+def fill(comp: ReplayCompactor, block: int, full: bool = True):
+    addr = comp.storage(EMITTER, block)
+    for i in range(max_keys):
+        page = b"\xff" * page_size if full or i else b"\xfe" + b"\xff" * (page_size - 1)
+        comp.algod.set_local(addr, BRIDGE, bytes([i]), page)
+    return addr
+
+
+def test_partial_block_is_kept(comp):
+    comp.algod.set_global(BRIDGE, chain_prefix + EMITTER[:2], chain_value(EMITTER[2:]))
+    fill(comp, 0, full=False)
+    assert asyncio.run(comp.tick()) == []
+    assert comp.algod.sent == []
+
+
+def test_unregistered_emitter_is_left_alone(comp):
+    # No "Chain" global to keep the mark in, retireBlock would be rejected
+    fill(comp, 0)
+    assert asyncio.run(comp.tick()) == []
+    assert comp.algod.sent == []
+
+
+def test_retire_then_reclaim(comp):
+    algod = comp.algod
+    addr = fill(comp, 1)
+    algod.set_global(BRIDGE, chain_prefix + EMITTER[:2], chain_value(EMITTER[2:], 1))
+
+    assert len(asyncio.run(comp.tick())) == 1
+    [retire] = algod.sent[-1]
+    txn = retire.transaction
+    assert txn.app_args == [b"retireBlock", EMITTER] and txn.accounts == [addr]
+    # Pays for the rekey inner transaction
+    assert txn.fee == 2000
+    assert comp.retired == {(EMITTER, 1)}
+
+    # Not confirmed yet: nothing more to send
+    assert asyncio.run(comp.tick()) == []
+
+    # Confirmed: the bridge tagged the account and moved the mark
+    algod.set_local(addr, BRIDGE, b"meta", b"retired")
+    algod.set_global(BRIDGE, chain_prefix + EMITTER[:2], chain_value(EMITTER[2:], 2))
+    assert len(asyncio.run(comp.tick())) == 1
+    clear, close = algod.sent[-1]
+    assert clear.transaction.type == "appl" and clear.transaction.on_complete == 3
+    assert close.transaction.close_remainder_to == comp.treasury
+    assert {clear.transaction.sender, close.transaction.sender} == {addr}
+    # Signed by the Treasury, the rekeyed account's auth address
+    assert clear.authorizing_address == close.authorizing_address == comp.treasury
+    assert (clear.transaction.fee, close.transaction.fee) == (2000, 0)
+    assert comp.retired == set()
+
+    # Closed out
+    del algod.locals[(addr, BRIDGE)]
+    assert asyncio.run(comp.tick()) == []
+
+
+def test_group_builders():
+    sp = asyncio.run(LocalAlgod().suggested_params())
+    treasury = account.generate_account()[1]
+    storage = TmplSig("sig").get_sig_address(0, EMITTER, BRIDGE, get_application_address(BRIDGE))
+    txn = retire_txn(sp, treasury, BRIDGE, EMITTER, storage)
+    assert txn.index == BRIDGE and txn.fee == 2 * sp.min_fee
+    clear, close = reclaim_group(sp, storage, BRIDGE, treasury)
+    assert clear.group == close.group and close.amt == 0
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("algosdk")
+pytest.importorskip("msgpack")
+pytest.importorskip("pyteal")
+
+from local_algod import LocalAlgod
+from local_state import chain_prefix, chain_value, max_bits, max_bytes, max_keys, page_size
+from replay_scan import FULL, ReplayScanner, runs
+from TmplSig import TmplSig
+
+BRIDGE = 7
+EMITTER = (2).to_bytes(2, "big") + bytes(31) + b"\x04"
+
+
+def store(algod: LocalAlgod, scanner: ReplayScanner, block: int, x: int):
+    addr = scanner.tmpl_sig.get_sig_address(block, EMITTER, BRIDGE, scanner.bridge_addr)
+    blob = x.to_bytes(max_bytes, "little")
+    for i in range(max_keys):
+        algod.set_local(addr, BRIDGE, bytes([i]), blob[i * page_size:(i + 1) * page_size])
+
+
+def ones(start: int, end: int) -> int:
+    return ((1 << (end - start + 1)) - 1) << start
+
+
+@pytest.fixture
+def setup():
+    algod = LocalAlgod()
+    return algod, ReplayScanner(algod, TmplSig("sig"), BRIDGE)
+
+
+def test_runs():
+    assert runs(0) == []
+    assert runs(0b1) == [(0, 0)]
+    assert runs(0b11101100) == [(2, 3), (5, 7)]
+    assert runs(FULL) == [(0, max_bits - 1)]
+
+
+def test_run_across_blocks(setup):
+    algod, scanner = setup
+    store(algod, scanner, 0, ones(0, 9) | ones(max_bits - 3, max_bits - 1))
+    store(algod, scanner, 1, ones(0, 1))
+
+    latest = max_bits + 5
+    [report] = asyncio.run(scanner.scan({EMITTER: latest}, now=100.0))
+
+    assert report.redeemed == [(0, 9), (max_bits - 3, max_bits + 1)]
+    assert [(g.start, g.end) for g in report.gaps] == [(10, max_bits - 4), (max_bits + 2, latest)]
+    assert report.unredeemed == (max_bits - 13) + (latest - max_bits - 1)
+    assert report.lag == latest - 10
+
+
+def test_gap_keeps_its_age(setup):
+    algod, scanner = setup
+    asyncio.run(scanner.scan({EMITTER: 20}, now=100.0))
+
+    # Both pieces of the split gap date from the first scan, the tail joins the second
+    store(algod, scanner, 0, ones(5, 9))
+    [report] = asyncio.run(scanner.scan({EMITTER: 30}, now=200.0))
+
+    assert [tuple(g) for g in report.gaps] == [(0, 4, 100.0), (10, 30, 100.0)]
+    assert report.oldest == 100.0
+
+
+def test_full_blocks_are_not_fetched_again(setup):
+    algod, scanner = setup
+    store(algod, scanner, 0, FULL)
+    asyncio.run(scanner.scan({EMITTER: max_bits + 1}, now=0.0))
+    fetched = algod.calls["local_state"]
+
+    [report] = asyncio.run(scanner.scan({EMITTER: max_bits + 1}, now=0.0))
+    assert algod.calls["local_state"] == fetched + 1
+    assert report.redeemed == [(0, max_bits - 1)]
+
+
+
+def test_blocks_below_low_mark_count_as_full(setup):
+    algod, scanner = setup
+    algod.set_global(BRIDGE, chain_prefix + EMITTER[:2], chain_value(EMITTER[2:], 2))
+    store(algod, scanner, 2, ones(0, 0))
+
+    [report] = asyncio.run(scanner.scan({EMITTER: 2 * max_bits + 3}, now=0.0))
+    assert report.redeemed == [(0, 2 * max_bits)]
+    assert algod.calls["local_state"] == 1
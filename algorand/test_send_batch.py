@@ -0,0 +1,131 @@
+import pytest
+
+pytest.importorskip("algosdk")
+pytest.importorskip("pyteal")
+
+from algosdk import account
+from algosdk.encoding import decode_address
+from algosdk.future import transaction
+from algosdk.logic import get_application_address
+
+from cost_report import lap_cost, method_costs
+from fees import bridge_fee_model
+from send_batch import (BUDGET_PER_CALL, INNER_PER_CALL, MAX_GROUP, Outbound, batch_nops, build_send_batch,
+                        max_batch, send_where)
+from TmplSig import TmplSig
+
+BRIDGE, CORE, ESCROW, AID = 20, 10, 30, 77
+SENDER = account.generate_account()[1]
+
+
+@pytest.fixture(scope="module")
+def model(bridge_teal, escrow_teal):
+    return bridge_fee_model(bridge_teal, escrow_teal)
+
+
+@pytest.fixture
+def sp():
+    return transaction.SuggestedParams(1000, 1, 1000, "A" * 44, flat_fee=True, min_fee=1000)
+
+
+def batch(n):
+    return [Outbound(100 + i, bytes([i]) * 20, 2, fee=i) for i in range(n)]
+
+
+def test_group_layout(sp):
+    tmpl = TmplSig("sig")
+    txns = build_send_batch(SENDER, sp, tmpl, BRIDGE, CORE, ESCROW, AID, batch(3), message_fee=5)
+
+    assert [t.type for t in txns] == ["pay", "axfer", "axfer", "axfer", "appl"]
+    assert txns[0].amt == 15 and txns[0].receiver == get_application_address(BRIDGE)
+    assert [t.amount for t in txns[1:4]] == [100, 101, 102]
+    assert {t.receiver for t in txns[1:4]} == {get_application_address(ESCROW)}
+    assert len({t.group for t in txns}) == 1
+
+    call = txns[-1]
+    assert call.app_args[0] == b"sendTransferBatch"
+    assert call.app_args[1] == AID.to_bytes(8, "big")
+    assert call.app_args[2] == b"".join(bytes(12) + bytes([i]) * 20 for i in range(3))
+    assert call.app_args[3] == bytes([0, 2]) * 3
+    assert call.app_args[4] == b"".join(i.to_bytes(8, "big") for i in range(3))
+    assert call.accounts[1] == tmpl.get_sig_address(AID, b"native", BRIDGE, get_application_address(BRIDGE))
+    assert call.accounts[0] == tmpl.get_sig_address(0, decode_address(get_application_address(BRIDGE)),
+                                                    CORE, get_application_address(CORE))
+    assert call.foreign_apps == [CORE, ESCROW] and call.foreign_assets == [AID]
+
+
+def test_algo_batch_without_message_fee(sp):
+    txns = build_send_batch(SENDER, sp, TmplSig("sig"), BRIDGE, CORE, ESCROW, 0, batch(2), message_fee=0, nops=2)
+    assert [t.type for t in txns] == ["pay", "pay", "appl", "appl", "appl"]
+    assert not txns[2].foreign_assets
+    assert [t.app_args[0] for t in txns[3:]] == [b"nop", b"nop"]
+
+
+def test_batch_size(sp):
+    tmpl = TmplSig("sig")
+    # Without a model only the group size limits the batch
+    most = MAX_GROUP - 1
+    build_send_batch(SENDER, sp, tmpl, BRIDGE, CORE, ESCROW, AID, batch(most), 0)
+    for transfers, nops in ((batch(0), 0), (batch(most + 1), 0), (batch(most), 1)):
+        with pytest.raises(ValueError):
+            build_send_batch(SENDER, sp, tmpl, BRIDGE, CORE, ESCROW, AID, transfers, 0, nops=nops)
+    with pytest.raises(ValueError):
+        build_send_batch(SENDER, sp, tmpl, BRIDGE, CORE, ESCROW, AID, [Outbound(1, bytes(33), 2)], 0)
+
+
+def test_batch_nops(model):
+    costs = method_costs(model)
+    lap = lap_cost(model, "sendTransferBatch")
+    assert lap > 0
+
+    largest = max_batch(model)
+    assert 1 <= largest < max_batch(model, mfee=False) <= MAX_GROUP - 2
+    nops = [batch_nops(model, n) for n in range(1, largest + 1)]
+    assert nops == sorted(nops)
+    for n, k in zip(range(1, largest + 1), nops):
+        assert 1 + n + 1 + k <= MAX_GROUP
+        # Enough inner transactions and opcode budget for n transfers
+        assert INNER_PER_CALL * (1 + k) >= model.inner_txns("sendTransferBatch", items=n)
+        assert BUDGET_PER_CALL * (1 + k) - costs["nop"] * k >= costs["sendTransferBatch"] + (n - 1) * lap
+
+    with pytest.raises(ValueError):
+        batch_nops(model, largest + 1)
+
+
+def test_model_sets_the_nops(sp, model):
+    tmpl = TmplSig("sig")
+    txns = build_send_batch(SENDER, sp, tmpl, BRIDGE, CORE, ESCROW, AID, batch(3), 5, model=model)
+    assert [t.app_args[0] for t in txns[5:]] == [b"nop"] * batch_nops(model, 3)
+    with pytest.raises(ValueError):
+        build_send_batch(SENDER, sp, tmpl, BRIDGE, CORE, ESCROW, AID, batch(3), 5, model=model,
+                         nops=batch_nops(model, 3) - 1)
+    with pytest.raises(ValueError):
+        build_send_batch(SENDER, sp, tmpl, BRIDGE, CORE, ESCROW, AID, batch(max_batch(model) + 1), 5, model=model)
+
+
+def test_pooled_fee_on_the_call(sp, model):
+    txns = build_send_batch(SENDER, sp, TmplSig("sig"), BRIDGE, CORE, ESCROW, AID, batch(4), 5, model=model)
+    call = [t for t in txns if t.type == "appl" and t.app_args[0] == b"sendTransferBatch"][0]
+    inner = model.inner_txns("sendTransferBatch", items=4)
+    assert call.fee == 1000 * (1 + inner)
+    assert all(t.fee == 1000 for t in txns if t is not call)
+
+
+def test_send_where(model):
+    # Inner transactions of one transfer by (payout, bfee): the escrow's payout books it and
+    # pays the treasury if there is a fee, older escrows take a transfer and a liquidity
+    counts = {(p, f): model.inner_txns("sendTransferBatch", send_where(p, f), 1) for p in (0, 1) for f in (0, 1)}
+    assert counts == {(0, 0): 3, (0, 1): 5, (1, 0): 3, (1, 1): 4}
+    assert model.inner_txns("sendTransferBatch", items=1) == 7
+    assert all(model.inner_txns("sendTransfer", send_where(p, f)) == n for (p, f), n in counts.items())
+
+
+def test_treasury_and_where(sp, model):
+    treasury = account.generate_account()[1]
+    where = send_where(payout=True, bfee=True)
+    txns = build_send_batch(SENDER, sp, TmplSig("sig"), BRIDGE, CORE, ESCROW, AID, batch(4), 5, model=model,
+                            where=where, treasury=treasury)
+    call = [t for t in txns if t.type == "appl" and t.app_args[0] == b"sendTransferBatch"][0]
+    assert call.accounts[2] == treasury
+    assert call.fee == 1000 * (1 + model.inner_txns("sendTransferBatch", where, 4)) == 1000 * 11
+    assert len(build_send_batch(SENDER, sp, TmplSig("sig"), BRIDGE, CORE, ESCROW, AID, batch(1), 5)[-1].accounts) == 2
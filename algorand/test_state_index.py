@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("algosdk")
+
+from algosdk import account
+
+from local_algod import LocalAlgod
+from local_state import max_bytes, page_size
+from state_index import HEADER, RECORD, LocalSource, StateIndex
+
+BRIDGE = 7
+
+
+@pytest.fixture
+def setup(tmp_path):
+    algod = LocalAlgod(round=10)
+    index = StateIndex(str(tmp_path / "bridge.idx"), BRIDGE)
+    yield algod, index, LocalSource(algod, BRIDGE)
+    index.close()
+
+
+def addrs(n: int):
+    return [account.generate_account()[1] for _ in range(n)]
+
+
+def test_first_refresh_takes_every_account(setup):
+    algod, index, source = setup
+    a, b = addrs(2)
+    algod.opt_in(a, BRIDGE)
+    algod.set_local(b, BRIDGE, b"\x01", b"\x07" * page_size)
+    algod.opt_in(addrs(1)[0], BRIDGE + 1)
+
+    assert asyncio.run(index.refresh(algod, source)) == 2
+    assert (index.round, index.count) == (10, 2)
+    assert index.blob(a) == bytes(max_bytes)
+    assert index.blob(b)[page_size:2 * page_size] == b"\x07" * page_size
+    assert index.blob(addrs(1)[0]) is None
+    assert sorted(x[0] for x in index.items()) == sorted([a, b])
+
+
+def test_refresh_fetches_only_changes(setup):
+    algod, index, source = setup
+    a, b, c = addrs(3)
+    for x in (a, b):
+        algod.opt_in(x, BRIDGE)
+    asyncio.run(index.refresh(algod, source))
+
+    algod.round = 20
+    algod.set_local(a, BRIDGE, b"\x00", b"\x01" * page_size)
+    algod.opt_in(c, BRIDGE)
+    fetched = algod.calls["local_state"]
+    assert asyncio.run(index.refresh(algod, source)) == 2
+    assert algod.calls["local_state"] == fetched + 2
+
+    assert index.round == 20
+    assert index.blob(a)[:page_size] == b"\x01" * page_size
+    assert dict((x, r) for x, r, _ in index.items()) == {a: 20, b: 10, c: 20}
+
+    # Closed out accounts keep a zeroed record
+    algod.round = 30
+    del algod.locals[(a, BRIDGE)]
+    algod.updated[(a, BRIDGE)] = 30
+    asyncio.run(index.refresh(algod, source))
+    assert index.blob(a) == bytes(max_bytes) and index.count == 3
+
+
+def test_reopen(tmp_path):
+    algod = LocalAlgod(round=10)
+    path = str(tmp_path / "bridge.idx")
+    [a] = addrs(1)
+    algod.set_local(a, BRIDGE, b"\x0e", b"\x09" * page_size)
+
+    index = StateIndex(path, BRIDGE)
+    asyncio.run(index.refresh(algod, LocalSource(algod, BRIDGE)))
+    index.close()
+    with open(path, "rb") as f:
+        assert len(f.read()) == HEADER + RECORD
+
+    index = StateIndex(path, BRIDGE)
+    assert index.round == 10 and index.blob(a)[-page_size:] == b"\x09" * page_size
+    index.close()
+
+    with pytest.raises(ValueError):
+        StateIndex(path, BRIDGE + 1)
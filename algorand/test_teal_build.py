@@ -0,0 +1,62 @@
+from cost_report import method_costs
+from fees import FeeModel
+from teal_build import match_router
+
+ROUTER = """#pragma version 8
+intcblock 0 1
+bytecblock 0x6e6f70 0x61
+txn ApplicationID
+intc_0 // 0
+==
+bnz main_l9
+txna ApplicationArgs 0
+bytec_0 // "nop"
+==
+bnz main_l8
+txna ApplicationArgs 0
+bytec_1 // "a"
+==
+bnz main_l7
+txna ApplicationArgs 0
+pushbytes 0x62 // "b"
+==
+bnz main_l6
+err
+main_l6:
+intc_1 // 1
+return
+main_l7:
+intc_0 // 0
+assert
+intc_1 // 1
+return
+main_l8:
+intc_1 // 1
+return
+main_l9:
+intc_1 // 1
+return
+"""
+
+
+def test_match_router():
+    teal = match_router(ROUTER)
+    lines = teal.splitlines()
+    i = lines.index("txna ApplicationArgs 0")
+    assert lines[i - 3:i] == ['bytec_0 // "nop"', 'bytec_1 // "a"', 'pushbytes 0x62 // "b"']
+    assert lines[i + 1] == "match main_l8 main_l7 main_l6"
+    assert lines[i + 2] == "err"
+    assert "==" in lines[:i]        # the ApplicationID check is left alone
+    assert teal.count("assert") == ROUTER.count("assert")
+
+
+def test_match_router_entries():
+    before = FeeModel(ROUTER)
+    after = FeeModel(match_router(ROUTER))
+    assert set(after.entries) == set(before.entries) == {"nop", "a", "b"}
+    assert method_costs(after)["a"] == method_costs(before)["a"]
+
+
+def test_single_entry_left_alone():
+    teal = "\n".join(l for l in ROUTER.splitlines()[:11]) + "\nerr\nmain_l8:\nintc_1\nreturn\nmain_l9:\nintc_1\nreturn"
+    assert match_router(teal) == teal
@@ -0,0 +1,100 @@
+import pytest
+
+pytest.importorskip("pyteal")
+
+from pyteal import Assert, Int, Seq, Txn
+
+from conftest import compile_app
+from teal_map import MARK, AssertMap, AssertSites, assert_lines, strip_marks
+
+
+def program(sites: AssertSites = None):
+    def check(cond):
+        return sites.mark(cond) if sites is not None else Assert(cond)
+
+    return Seq([
+        check(Txn.fee() == Int(0)),
+        Assert(Txn.application_args.length() == Int(1)),
+        check(Txn.rekey_to() == Txn.sender()),
+        Int(1),
+    ])
+
+
+@pytest.fixture(scope="module")
+def builds():
+    sites = AssertSites()
+    return compile_app(program(sites)), compile_app(program()), sites
+
+
+def line_per_pc(teal: str) -> dict:
+    # A source map taking pc n to 0 based line n, one step down per pc
+    return {"version": 3, "sources": [], "names": [],
+            "mappings": ";".join(["AAAA"] + ["AACA"] * (len(teal.splitlines()) - 1))}
+
+
+def test_mark(builds):
+    marked, teal, sites = builds
+    here = __file__.split("/")[-1]
+    assert [s[0] for s in sites.sites] == [here, here]
+    assert str(MARK) in marked and str(MARK + 1) in marked
+    assert str(MARK) not in teal
+    assert marked.count("assert") == teal.count("assert") == 3
+
+
+def test_assert_lines(builds):
+    marked, teal, sites = builds
+    lines = assert_lines(marked, teal, sites)
+    asserts = [n for n, l in enumerate(teal.splitlines(), 1) if l == "assert"]
+    assert [lines[n] for n in asserts] == [sites.sites[0], None, sites.sites[1]]
+
+
+def test_strip_marks(builds):
+    marked, teal, sites = builds
+    assert strip_marks(marked, sites) == teal
+
+
+def test_repeated_mark():
+    # A marked Assert emitted twice puts its mark in the int constant block
+    sites = AssertSites()
+    check = sites.mark(Txn.fee() == Int(0), depth=1)
+    marked = compile_app(Seq([check, check, Int(1)]))
+    assert str(MARK) in marked.splitlines()[1] and "intcblock" in marked.splitlines()[1]
+
+    teal = strip_marks(marked, sites)
+    assert "&&" not in teal and teal.count("assert") == 2
+    assert list(assert_lines(marked, teal, sites).values()) == [sites.sites[0]] * 2
+
+
+def test_assert_count_mismatch(builds):
+    marked, teal, sites = builds
+    with pytest.raises(ValueError):
+        assert_lines(marked, "#pragma version 6\nassert\n", sites)
+
+
+def test_explain(builds, tmp_path):
+    pytest.importorskip("algosdk")
+    marked, teal, sites = builds
+    amap = AssertMap.build(marked, teal, sites, line_per_pc(teal))
+
+    first = [n for n, l in enumerate(teal.splitlines(), 1) if l == "assert"][0]
+    assert amap.explain("logic eval error: assert failed pc={}".format(first - 1)) == "{}:{}".format(*sites.sites[0])
+    assert amap.explain("logic eval error: assert failed pc=0") is None
+    assert amap.explain("rejected by logic") is None
+
+    amap.save(str(tmp_path / "map.json"))
+    assert AssertMap.load(str(tmp_path / "map.json")).pcs == amap.pcs
+
+
+def test_compiled_bridge(bridge_teal):
+    from TmplSig import TmplSig
+    from token_bridge import approve_token_bridge
+
+    sites = AssertSites()
+    marked = compile_app(approve_token_bridge(1002000, TmplSig("sig"), False, sites))
+    # The deployed program is the marked build with the marks taken out
+    teal = strip_marks(marked, sites)
+    assert len(teal.splitlines()) == len(bridge_teal.splitlines())
+    lines = assert_lines(marked, teal, sites)
+    found = [s for s in lines.values() if s is not None]
+    assert len(found) == len(sites.sites)
+    assert {s[0] for s in found} == {"token_bridge.py"}
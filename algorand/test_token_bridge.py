@@ -0,0 +1,152 @@
+import re
+
+import pytest
+
+pytest.importorskip("algosdk")
+pytest.importorskip("pyteal")
+
+from conftest import compile_app
+
+
+def labels(teal: str, name: str) -> list:
+    return re.findall(r"^{}_\d+:".format(name), teal, re.M)
+
+
+def calls(teal: str, name: str) -> int:
+    return len(re.findall(r"^callsub {}_\d+$".format(name), teal, re.M))
+
+
+def body(teal: str, name: str) -> list:
+    """
+    The lines of a subroutine, up to its first retsub
+    """
+    lines = teal.splitlines()
+    start = lines.index(labels(teal, name)[0])
+    end = lines.index("retsub", start)
+    return lines[start + 1:end]
+
+
+@pytest.mark.parametrize("name", ["checkCommon", "checkNop", "checkVerifyVAA", "checkDeposit"])
+def test_group_checks_are_subroutines(bridge_teal, name):
+    # Emitted once, shared by every call site
+    assert len(labels(bridge_teal, name)) == 1
+    assert calls(bridge_teal, name) > 1
+
+
+def test_redeem_reads_the_verify_vaa_before_it(bridge_teal):
+    # One VAA per group, completeTransfer does not search the group for its verifyVAA
+    assert not labels(bridge_teal, "findVerifyVAA")
+    assert calls(bridge_teal, "checkVerifyVAA") >= 1
+
+
+def test_common_checks_are_emitted_once(bridge_teal):
+    common = body(bridge_teal, "checkCommon")
+    for field in ("RekeyTo", "CloseRemainderTo", "AssetCloseTo", "OnCompletion"):
+        assert "gtxns " + field in common
+    assert bridge_teal.count("gtxns AssetCloseTo") == 1
+
+
+def test_core_read(bridge_teal):
+    from fees import FeeModel
+
+    assert "syncCore" not in FeeModel(bridge_teal).methods()
+    # MessageFee comes straight from the core, there is no copy to go stale
+    assert body(bridge_teal, "getMessageFee").count("app_global_get_ex") == 1
+    assert "app_params_get AppGlobalNumUint" not in bridge_teal
+
+
+@pytest.mark.parametrize("full_attest", [False, True])
+def test_attest_storage(full_attest):
+    from TmplSig import TmplSig
+    from token_bridge import approve_token_bridge
+
+    teal = compile_app(approve_token_bridge(1002000, TmplSig("sig"), False, full_attest=full_attest))
+    # The hash-only build keeps the keccak256 of the body instead of the body
+    assert ("keccak256" in teal) != full_attest
+
+
+def test_attest_defaults_to_full(bridge_teal):
+    from cost_report import method_costs
+    from fees import FeeModel
+    from TmplSig import TmplSig
+    from token_bridge import approve_token_bridge
+
+    assert "keccak256" not in bridge_teal
+    # Hashing costs more ops than it saves, receiveAttest still needs the nop calls'
+    # budget either way
+    hashed = compile_app(approve_token_bridge(1002000, TmplSig("sig"), False, full_attest=False))
+    costs = [method_costs(FeeModel(t))["receiveAttest"] for t in (bridge_teal, hashed)]
+    assert 700 < costs[0] < costs[1]
+
+
+def test_sends_pay_only_the_treasury(bridge_teal):
+    # A send books the amount with the escrow and at most pays the treasury its fee, so it
+    # only needs the treasury in its accounts, a redeem passes all three receivers.  Both
+    # build the call once for algo and once for an asset
+    assert calls(bridge_teal, "escrowBook") == 2
+    assert body(bridge_teal, "escrowBook").count("itxn_field Accounts") == 2
+    assert body(bridge_teal, "escrowPayout").count("itxn_field Accounts") == 2 * 3
+
+
+def test_batch_books_the_escrow_once(bridge_teal, escrow_teal):
+    from fees import bridge_fee_model
+
+    # The messages are published in the loop, one per transfer, the escrow is called once
+    # for the whole batch
+    model = bridge_fee_model(bridge_teal, escrow_teal)
+    for b in model.branches("sendTransferBatch"):
+        assert b.count("publishMessage") == 0
+        assert b.count("liquidity") + b.count("payout") == 1
+    assert model.per_item("sendTransferBatch") == 2
+
+
+def test_retire_block(bridge_teal):
+    from fees import FeeModel
+
+    model = FeeModel(bridge_teal)
+    # One inner payment, the rekey to the Treasury
+    assert [b.calls for b in model.branches("retireBlock")] == [(("pay", None),)]
+    assert bridge_teal.count("itxn_field RekeyTo") == 1
+    # The low water mark is checked ahead of the replay bit, read from the emitter's
+    # "Chain" global and written back there by retireBlock
+    assert calls(bridge_teal, "lowMark") >= 2
+    mark = body(bridge_teal, "lowMark")
+    assert any(l.endswith('// "Chain"') for l in mark) and "extract_uint64" in mark
+    assert "itob" in bridge_teal
+    assert "Lows" not in bridge_teal and '"Low"' not in bridge_teal
+
+
+def test_duplicate_checks_the_low_mark(bridge_teal):
+    # Below the low water mark the block's account may be gone, so the mark is asserted
+    # before the replay bit is read
+    ops = body(bridge_teal, "checkForDuplicate")
+    mark = next(i for i, l in enumerate(ops) if l.startswith("callsub lowMark_"))
+    assert ops[mark + 1:mark + 3] == [">=", "assert"]
+    assert mark < ops.index("getbit")
+
+
+def test_scale_read_from_the_record(bridge_teal):
+    # completeTransfer, sendTransfer and sendTransferBatch take the scale off the record,
+    # the asa lookup and the exp only run for records written without one
+    assert calls(bridge_teal, "loadScale") >= 3
+    ops = body(bridge_teal, "loadScale")
+    legacy = next(i for i, l in enumerate(ops) if l.startswith("bnz "))
+    assert "extract 0 1" in ops[:legacy]
+    assert not [l for l in ops[:legacy] if l == "exp" or l.startswith("callsub ")]
+
+
+def test_packed_record(bridge_teal):
+    from fees import FeeModel
+
+    assert "migrateAsset" in FeeModel(bridge_teal).methods()
+    # The transfers read the record with loadRecord, one read of the packed copy
+    assert calls(bridge_teal, "loadRecord") >= 3
+    assert calls(bridge_teal, "packRecord") >= 3
+
+
+def test_header_parsed_once(bridge_teal):
+    # completeTransfer and receiveAttest parse the header, checkForDuplicate reads the slots
+    assert calls(bridge_teal, "parseHeader") == 2
+    assert "callsub parseHeader" not in "\n".join(body(bridge_teal, "checkForDuplicate"))
+    # The signature count is only read for the body offset
+    assert bridge_teal.count("extract 5 1") == 1
@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import transfer_payload, vaa_bytes
+from vaa import parse_vaa
+
+EMITTER = (2).to_bytes(2, "big") + b"\xee" * 32
+
+
+def test_parse_vaa():
+    payload = transfer_payload()
+    raw = vaa_bytes(sequence=77, emitter=EMITTER, payload=payload, num_sigs=3, guardian_set=2, timestamp=5, nonce=6)
+    v = parse_vaa(raw)
+    assert (v.version, v.guardian_set_index, v.num_sigs) == (1, 2, 3)
+    assert v.body_offset == 6 + 3 * 66
+    assert (v.timestamp, v.nonce, v.emitter_chain, v.sequence, v.consistency) == (5, 6, 2, 77, 15)
+    assert v.emitter == EMITTER and v.emitter_address == EMITTER[2:]
+    assert v.payload == payload and v.action == 1
+    assert v.signatures == bytes(3 * 66)
+    assert v.body == raw[6 + 3 * 66:]
+
+
+def test_parse_vaa_too_short():
+    with pytest.raises(ValueError):
+        parse_vaa(b"\x01\x00")
+    with pytest.raises(ValueError):
+        parse_vaa(vaa_bytes(num_sigs=2)[:6 + 2 * 66 + 50])
+    assert parse_vaa(vaa_bytes()).action == 0
+
+
+def test_digest():
+    keccak = pytest.importorskip("Cryptodome.Hash.keccak")
+    v = parse_vaa(vaa_bytes(payload=b"\x01"))
+    inner = keccak.new(digest_bits=256, data=v.body).digest()
+    assert v.digest() == keccak.new(digest_bits=256, data=inner).digest()
@@ -23,10 +23,13 @@ from pyteal.compiler import *
 from pyteal.ir import *
 from pyteal.types import *
 
+from algod_async import shared_algod
 from globals import *
 from inlineasm import *
-from local_blob import LocalBlob
+from local_blob import LocalBlob, intkey
 from TmplSig import TmplSig
+from teal_build import fullyCompileContract
+from teal_map import AssertSites
 
 max_keys = 15
 max_bytes_per_key = 127
@@ -35,29 +38,11 @@ bits_per_byte = 8
 max_bytes = max_bytes_per_key * max_keys
 max_bits = bits_per_byte * max_bytes
 
-def fullyCompileContract(genTeal, client: AlgodClient, contract: Expr, name, devmode) -> bytes:
-    if devmode:
-        teal = compileTeal(contract, mode=Mode.Application, version=6, assembleConstants=True)
-    else:
-        teal = compileTeal(contract, mode=Mode.Application, version=6, assembleConstants=True, optimize=OptimizeOptions(scratch_slots=True))
-
-    if genTeal:
-        with open(name, "w") as f:
-            print("Writing " + name)
-            f.write(teal)
-    else:
-        with open(name, "r") as f:
-            print("Reading " + name)
-            teal = f.read()
-
-    response = client.compile(teal)
-    return response
-
 def clear_token_bridge():
     return Int(1)
 
-def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
-    blob = LocalBlob()
+def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool, sites: AssertSites = None, full_attest: bool = True, version: int = 6):
+    blob = LocalBlob(version)
     tidx = ScratchVar()
     mfee = ScratchVar()
     bfee = ScratchVar()
@@ -66,12 +51,24 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
     normAmount = ScratchVar()
     normFee = ScratchVar()
 
+    # The asset's decimals and 10^|decimals - 8|, see loadScale
+    scaleDec = ScratchVar()
+    scaleFactor = ScratchVar()
+
+    # The hot part of the asset record of this call, see loadRecord
+    rec = ScratchVar()
+
+    # The header of the VAA in application_args[1], see parseHeader
+    vaaBody = ScratchVar()
+    vaaEmitter = ScratchVar()
+    vaaSequence = ScratchVar()
+    vaaPayload = ScratchVar()
+
     def MagicAssert(a) -> Expr:
-        if devMode:
-            from inspect import currentframe
-            return Assert(And(a, Int(currentframe().f_back.f_lineno)))
-        else:
-            return Assert(a)
+        # Only the marked build for the source map knows where it was called from
+        if sites is not None:
+            return sites.mark(a)
+        return Assert(a)
 
     @Subroutine(TealType.uint64)
     def governanceSet() -> Expr:
@@ -83,19 +80,88 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         maybe = App.globalGetEx(App.globalGet(Bytes("coreid")), Bytes("MessageFee"))
         return Seq(maybe, MagicAssert(maybe.hasValue()), maybe.value())
 
+    # "Chain" + chain id holds the registered emitter address, followed once retireBlock
+    # has run for it by the emitter's replay low water mark (8 bytes).  The marks live in
+    # byte slices the bridge already has, so they need no schema of their own
+
+    @Subroutine(TealType.bytes)
+    def registeredEmitter(chain) -> Expr:
+        v = App.globalGet(Concat(Bytes("Chain"), chain))
+        return If(Len(v) > Int(32), Extract(v, Int(0), Int(32)), v)
+
+    @Subroutine(TealType.uint64)
+    def lowMark(emitter) -> Expr:
+        # The first block of the emitter (chain + address) that was not retired
+        v = App.globalGet(Concat(Bytes("Chain"), Extract(emitter, Int(0), Int(2))))
+        return If(And(Len(v) == Int(40), Extract(v, Int(0), Int(32)) == Extract(emitter, Int(2), Int(32))),
+                  ExtractUint64(v, Int(32)),
+                  Int(0))
+
     @Subroutine(TealType.bytes)
     def getAppAddress(appid : Expr) -> Expr:
         maybe = AppParam.address(appid)
         return Seq(maybe, MagicAssert(maybe.hasValue()), maybe.value())
 
-    def assert_common_checks(e) -> Expr:
+    # The group checks below are subroutines rather than inline expansions, they show
+    # up at a dozen call sites and every copy is program size
+
+    @Subroutine(TealType.none)
+    def checkCommon(i):
         return MagicAssert(And(
-            e.rekey_to() == Global.zero_address(),
-            e.close_remainder_to() == Global.zero_address(),
-            e.asset_close_to() == Global.zero_address(),
-            e.on_completion() == OnComplete.NoOp
+            Gtxn[i].rekey_to() == Global.zero_address(),
+            Gtxn[i].close_remainder_to() == Global.zero_address(),
+            Gtxn[i].asset_close_to() == Global.zero_address(),
+            Gtxn[i].on_completion() == OnComplete.NoOp
         ))
 
+    @Subroutine(TealType.none)
+    def checkNop(i):
+        # txn i is a nop call to us from the same sender, bought for its budget
+        return Seq([
+            MagicAssert(And(
+                Gtxn[i].type_enum() == TxnType.ApplicationCall,
+                Gtxn[i].application_id() == Global.current_application_id(),
+                Gtxn[i].application_args[0] == Bytes("nop"),
+                Gtxn[i].sender() == Txn.sender(),
+            )),
+            checkCommon(i),
+        ])
+
+    @Subroutine(TealType.none)
+    def checkVerifyVAA(i):
+        # txn i is the core's verifyVAA of the same vaa, from the same sender
+        return Seq([
+            MagicAssert(And(
+                Gtxn[i].type_enum() == TxnType.ApplicationCall,
+                Gtxn[i].application_id() == App.globalGet(Bytes("coreid")),
+                Gtxn[i].application_args[0] == Bytes("verifyVAA"),
+                Gtxn[i].sender() == Txn.sender(),
+                Gtxn[i].on_completion() == OnComplete.NoOp,
+                Gtxn[i].application_args[1] == Txn.application_args[1],
+            )),
+            checkCommon(i),
+        ])
+
+    @Subroutine(TealType.uint64)
+    def checkDeposit(i, aid, receiver):
+        # txn i sends asset aid (0 for algo) from the same sender to receiver, returns the amount
+        return Seq([
+            If(aid == Int(0),
+               MagicAssert(And(
+                   Gtxn[i].type_enum() == TxnType.Payment,
+                   Gtxn[i].sender() == Txn.sender(),
+                   Gtxn[i].receiver() == receiver,
+               )),
+               MagicAssert(And(
+                   Gtxn[i].type_enum() == TxnType.AssetTransfer,
+                   Gtxn[i].sender() == Txn.sender(),
+                   Gtxn[i].xfer_asset() == aid,
+                   Gtxn[i].asset_receiver() == receiver,
+               ))),
+            checkCommon(i),
+            Return(If(aid == Int(0), Gtxn[i].amount(), Gtxn[i].asset_amount())),
+        ])
+
     @Subroutine(TealType.none)
     def checkFeePmt(off : Expr):
         return Seq([
@@ -107,27 +173,53 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                         Gtxn[tidx.load()].receiver() == Global.current_application_address(),
                         Gtxn[tidx.load()].amount() >= mfee.load()
                     )),
-                    assert_common_checks(Gtxn[tidx.load()])
+                    checkCommon(tidx.load())
             ]))
         ])
     
+    # Asset records keep their fields at 0-8 and 116-209.  Version 2 records also keep a
+    # packed copy in the third page, 254-356:
+    #
+    #   254 version (2), 255-348 what is at 116-209, 348-356 what is at 0-8
+    #
+    # so a transfer gets everything it needs from one page.  Writers keep updating the
+    # old offsets and repack at the end, migrateAsset packs records from before
+    @Subroutine(TealType.bytes)
+    def packedRecord(acct):
+        return Concat(Bytes("base16", "02"), blob.read(acct, Int(116), Int(209)), blob.read(acct, Int(0), Int(8)))
+
+    @Subroutine(TealType.none)
+    def packRecord(acct):
+        return Pop(blob.write(acct, Int(254), packedRecord(acct)))
+
     @Subroutine(TealType.none)
-    def checkTokenLimit(acct, amount):
+    def loadRecord(acct):
+        return Seq([
+            rec.store(blob.read(acct, Int(254), Int(356))),
+            If(GetByte(rec.load(), Int(0)) != Int(2), rec.store(packedRecord(acct))),
+        ])
+
+    def recField(start, end) -> Expr:
+        # The field at start-end of the record, in the packed copy
+        return Extract(rec.load(), Int(94 if start == 0 else start - 115), Int(end - start))
+
+    @Subroutine(TealType.none)
+    def checkTokenLimit(amount):
         maxToken = ScratchVar()
         minToken = ScratchVar()
         return Seq([
-            maxToken.store(Btoi(blob.read(acct, Int(124), Int(132)))),
-            minToken.store(Btoi(blob.read(acct, Int(132), Int(140)))),
+            maxToken.store(Btoi(recField(124, 132))),
+            minToken.store(Btoi(recField(132, 140))),
             If (maxToken.load() > Int(0), Seq([
                 MagicAssert(And(maxToken.load() >= amount, minToken.load() <= amount)),
             ])),
         ])
 
     @Subroutine(TealType.none)
-    def checkTokenMax(acct, amount):
+    def checkTokenMax(amount):
         maxToken = ScratchVar()
         return Seq([
-            maxToken.store(Btoi(blob.read(acct, Int(124), Int(132)))),
+            maxToken.store(Btoi(recField(124, 132))),
             If (maxToken.load() > Int(0), Seq([
                 MagicAssert(And(maxToken.load() >= amount)),
             ])),
@@ -199,6 +291,65 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             ])),
         ])
 
+    @Subroutine(TealType.uint64)
+    def escrowHasPayout(escrow):
+        # Escrows created before payout existed have no "ver" and only know transfer/liquidity
+        maybe = App.globalGetEx(escrow, Bytes("ver"))
+        return Seq(maybe, And(maybe.hasValue(), maybe.value() >= Int(1)))
+
+    def payoutFields(escrow, aid, ain, aout, pays):
+        # One payout call booking ain/aout and paying each (account, amount) of pays, the
+        # escrow skips zero amounts
+        fields = {
+            TxnField.type_enum: TxnType.ApplicationCall,
+            TxnField.application_id: escrow,
+            TxnField.application_args: [Bytes("payout"), Itob(ain), Itob(aout)] + [Itob(amt) for _, amt in pays],
+            TxnField.accounts: [acct for acct, _ in pays],
+            TxnField.applications: [Global.current_application_id()],
+            TxnField.fee: Int(0),
+        }
+        return If(aid == Int(0),
+                  InnerTxnBuilder.SetFields(fields),
+                  InnerTxnBuilder.SetFields({**fields, TxnField.assets: [aid]}))
+
+    @Subroutine(TealType.none)
+    def escrowPayout(escrow, aid, ain, aout, receiver, amt, fee):
+        # Pays the treasury its bridge fee (bfee), the receiver amt and the relayer (the sender) fee
+        # and books ain/aout, all in one inner call
+        return payoutFields(escrow, aid, ain, aout,
+                            [(App.globalGet(Bytes("Treasury")), bfee.load()), (receiver, amt), (Txn.sender(), fee)])
+
+    @Subroutine(TealType.none)
+    def escrowBook(escrow, aid, ain):
+        # A send books ain and pays at most the treasury its bridge fee, the treasury is
+        # only passed (and has to be in our accounts) when there is a fee
+        return If(bfee.load() > Int(0),
+                  payoutFields(escrow, aid, ain, Int(0), [(App.globalGet(Bytes("Treasury")), bfee.load())]),
+                  payoutFields(escrow, aid, ain, Int(0), []))
+
+    def redeemPayout(escrow, asset, Destination, Amount, Fee):
+        return Seq([
+            InnerTxnBuilder.Begin(),
+            If(escrowHasPayout(escrow),
+               escrowPayout(escrow, asset, Int(0), Amount, Destination, Amount, Fee),
+               Seq([
+                    If(bfee.load() > Int(0), Seq([
+                        escrowTransfer(escrow, App.globalGet(Bytes("Treasury")), bfee.load(), asset),
+                        InnerTxnBuilder.Next(),
+                    ])),
+
+                    escrowTransfer(escrow, Destination, Amount, asset),
+                    InnerTxnBuilder.Next(),
+                    escrowLiquidity(escrow, Int(0), Amount),
+
+                    If(Fee > Int(0), Seq([
+                        InnerTxnBuilder.Next(),
+                        escrowTransfer(escrow, Txn.sender(), Fee, asset),
+                    ])),
+               ])),
+            InnerTxnBuilder.Submit(),
+        ])
+
     @Subroutine(TealType.bytes)
     def encode_uvarint(val: Expr, b: Expr):
         buff = ScratchVar()
@@ -242,21 +393,21 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
     #     ])
 
     @Subroutine(TealType.uint64)
-    def calculateBridgeFee(acc, asset, amount, isTransfer):
+    def calculateBridgeFee(asset, amount, isTransfer):
         src = ScratchVar()
         dest = ScratchVar()
         bridgeFee = ScratchVar()
         ret = ScratchVar()
 
         return Seq([
-            src.store(Btoi(blob.read(acc, Int(198), Int(199)))),
-            dest.store(Btoi(blob.read(acc, Int(199), Int(200)))),
+            src.store(Btoi(recField(198, 199))),
+            dest.store(Btoi(recField(199, 200))),
 
             If (isTransfer == Int(1), Seq([
                 # src == true || (!src && !dest)
                 If (Or(src.load() == Int(1), And(src.load() == Int(0), dest.load() == Int(0))), Seq([
                     # Send Transfer Fee
-                    bridgeFee.store(Btoi(blob.read(acc, Int(174), Int(182)))),
+                    bridgeFee.store(Btoi(recField(174, 182))),
                 ]), Seq([
                     bridgeFee.store(Int(0)),
                 ]))
@@ -264,7 +415,7 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                 # dest == true || (!src && !dest)
                 If (Or(dest.load() == Int(1), And(src.load() == Int(0), dest.load() == Int(0))), Seq([
                     # Redeem / Complete Transfer Fee
-                    bridgeFee.store(Btoi(blob.read(acc, Int(182), Int(190)))),
+                    bridgeFee.store(Btoi(recField(182, 190))),
                 ]), Seq([
                     bridgeFee.store(Int(0)),
                 ]))
@@ -280,46 +431,65 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             Return(ret.load()),
         ])
 
-    @Subroutine(TealType.none) # when completeTransfer - Always make it the same decimal as ASA
-    def normalizedAmount(dec, amount, fee):
-        d = ScratchVar()
+    # Asset records keep decimals + 1 at 200 (0 for records from before the scale was
+    # stored) and 10^|decimals - 8| at 201-209, so transfers neither look the asset up
+    # nor take a power
+    @Subroutine(TealType.none)
+    def storeScale(acct, dec):
+        return If(dec <= Int(19),
+            Pop(blob.write(acct, Int(200), Concat(
+                Extract(Itob(dec + Int(1)), Int(7), Int(1)),
+                Itob(If(dec < Int(9), Exp(Int(10), Int(8) - dec), Exp(Int(10), dec - Int(8)))),
+            )))
+        )
+
+    @Subroutine(TealType.none)
+    def loadScale(aid):
+        s = ScratchVar()
 
-        return Cond(
-            [dec < Int(9),
+        return Seq([
+            s.store(recField(200, 209)),
+            scaleDec.store(Btoi(Extract(s.load(), Int(0), Int(1)))),
+            If(scaleDec.load() == Int(0),
+               Seq([
+                   # Legacy record, ALGO has 6 decimals
+                   If(aid == Int(0), scaleDec.store(Int(6)), scaleDec.store(Btoi(extract_decimal(aid)))),
+                   MagicAssert(scaleDec.load() <= Int(19)),
+                   scaleFactor.store(If(scaleDec.load() < Int(9),
+                                        Exp(Int(10), Int(8) - scaleDec.load()),
+                                        Exp(Int(10), scaleDec.load() - Int(8)))),
+               ]),
+               Seq([
+                   scaleDec.store(scaleDec.load() - Int(1)),
+                   scaleFactor.store(Btoi(Extract(s.load(), Int(1), Int(8)))),
+               ])
+            ),
+        ])
+
+    @Subroutine(TealType.none) # when completeTransfer - Always make it the same decimal as ASA
+    def normalizedAmount(amount, fee):
+        return If(scaleDec.load() < Int(9),
+            Seq([
+                normAmount.store(amount / scaleFactor.load()),
+                normFee.store(fee / scaleFactor.load()),
+            ]),
             Seq([
-                d.store(Exp(Int(10), Int(8) - dec)),
-                normAmount.store(amount / d.load()),
-                normFee.store(fee / d.load()),
-            ])],
-
-            [dec > Int(19), Reject()],
-
-            [Int(1), Seq([
-                d.store(Exp(Int(10), dec - Int(8))),
-                normAmount.store(amount * d.load()),
-                normFee.store(fee * d.load()),
-            ])]
+                normAmount.store(amount * scaleFactor.load()),
+                normFee.store(fee * scaleFactor.load()),
+            ])
         )
 
     @Subroutine(TealType.none) # when sendTransfer - Always make it 8 decimals
-    def denormalizedAmount(dec, amount, fee):
-        d = ScratchVar()
-
-        return Cond(
-            [dec < Int(9),
+    def denormalizedAmount(amount, fee):
+        return If(scaleDec.load() < Int(9),
             Seq([
-                d.store(Exp(Int(10), Int(8) - dec)),
-                normAmount.store(amount * d.load()),
-                normFee.store(fee * d.load())
-            ])],
-
-            [dec > Int(19), Reject()],
-
-            [Int(1), Seq([
-                d.store(Exp(Int(10), dec - Int(8))),
-                normAmount.store(amount / d.load()),
-                normFee.store(fee / d.load()),
-            ])]
+                normAmount.store(amount * scaleFactor.load()),
+                normFee.store(fee * scaleFactor.load())
+            ]),
+            Seq([
+                normAmount.store(amount / scaleFactor.load()),
+                normFee.store(fee / scaleFactor.load()),
+            ])
         )
 
     @Subroutine(TealType.bytes)
@@ -413,8 +583,10 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         ])
 
     def registerChain():
+        old = ScratchVar()
+
         return Seq([
-            assert_common_checks(Txn),
+            checkCommon(Txn.group_index()),
             MagicAssert(Txn.sender() == App.globalGet(Bytes("owner"))),
 
             # Remove check for enabling re-registering foreign contract 
@@ -422,7 +594,12 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
 
             # Txn.application_args[1] is the chainId
             # Txn.application_args[2] is ther emitterAddress
-            App.globalPut(Concat(Bytes("Chain"), Txn.application_args[1]), Txn.application_args[2]),
+            old.store(App.globalGet(Concat(Bytes("Chain"), Txn.application_args[1]))),
+            # An emitter with retired blocks keeps its low water mark and can't be replaced,
+            # its retired sequences would be redeemable again if it came back
+            If(Len(old.load()) > Int(32),
+               MagicAssert(Extract(old.load(), Int(0), Int(32)) == Txn.application_args[2]),
+               App.globalPut(Concat(Bytes("Chain"), Txn.application_args[1]), Txn.application_args[2])),
 
             Approve()
         ])
@@ -440,24 +617,12 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             # Only the admin can receiveAttest
             MagicAssert(Txn.sender() == App.globalGet(Bytes("owner"))),
 
+            parseHeader(),
             checkForDuplicate(),
 
-            tidx.store(Txn.group_index() - Int(5)),
+            # Lets see if the vaa we are about to process was actually verified by the core
+            checkVerifyVAA(Txn.group_index() - Int(5)),
 
-            MagicAssert(And(
-                # Lets see if the vaa we are about to process was actually verified by the core
-                Gtxn[tidx.load()].type_enum() == TxnType.ApplicationCall,
-                Gtxn[tidx.load()].application_id() == App.globalGet(Bytes("coreid")),
-                Gtxn[tidx.load()].application_args[0] == Bytes("verifyVAA"),
-                Gtxn[tidx.load()].sender() == Txn.sender(),
-                Gtxn[tidx.load()].on_completion() == OnComplete.NoOp,
-
-                # we are all taking about the same vaa?
-                Gtxn[tidx.load()].application_args[1] == Txn.application_args[1],
-
-                )),
-            assert_common_checks(Gtxn[tidx.load()]),
-                
             tidx.store(Txn.group_index() - Int(4)),
             MagicAssert(And(
                 # Did the user pay the lsig to attest a new product?
@@ -466,48 +631,21 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                 Gtxn[tidx.load()].sender() == Txn.sender(),
                 Gtxn[tidx.load()].receiver() == Txn.accounts[3],
                 )),
-            assert_common_checks(Gtxn[tidx.load()]),
-
-            tidx.store(Txn.group_index() - Int(3)),
-            MagicAssert(And(
-                Gtxn[tidx.load()].type_enum() == TxnType.ApplicationCall,
-                Gtxn[tidx.load()].application_id() == Global.current_application_id(),
-                Gtxn[tidx.load()].application_args[0] == Bytes("nop"),
-                Gtxn[tidx.load()].sender() == Txn.sender(),
-                
-                (Global.group_size() - Int(1)) == Txn.group_index()    # This should be the last entry...
-            )),
-            assert_common_checks(Gtxn[tidx.load()]),
-
-            tidx.store(Txn.group_index() - Int(2)),
-            MagicAssert(And(
-                # We had to buy some extra CPU
-                Gtxn[tidx.load()].type_enum() == TxnType.ApplicationCall,
-                Gtxn[tidx.load()].application_id() == Global.current_application_id(),
-                Gtxn[tidx.load()].application_args[0] == Bytes("nop"),
-                Gtxn[tidx.load()].sender() == Txn.sender(),
-                )),
-            assert_common_checks(Gtxn[tidx.load()]),
+            checkCommon(tidx.load()),
 
-            tidx.store(Txn.group_index() - Int(1)),
-            MagicAssert(And(
-                Gtxn[tidx.load()].type_enum() == TxnType.ApplicationCall,
-                Gtxn[tidx.load()].application_id() == Global.current_application_id(),
-                Gtxn[tidx.load()].application_args[0] == Bytes("nop"),
-                Gtxn[tidx.load()].sender() == Txn.sender(),
-                
-                (Global.group_size() - Int(1)) == Txn.group_index()    # This should be the last entry...
-            )),
-            assert_common_checks(Gtxn[tidx.load()]),
+            # We had to buy some extra CPU
+            checkNop(Txn.group_index() - Int(3)),
+            checkNop(Txn.group_index() - Int(2)),
+            checkNop(Txn.group_index() - Int(1)),
+            MagicAssert((Global.group_size() - Int(1)) == Txn.group_index()),    # This should be the last entry...
 
-            off.store(Btoi(Extract(Txn.application_args[1], Int(5), Int(1))) * Int(66) + Int(6) + Int(8)), # The offset of the chain
-            Chain.store(Btoi(Extract(Txn.application_args[1], off.load(), Int(2)))),
+            Chain.store(Btoi(Extract(vaaEmitter.load(), Int(0), Int(2)))),
 
             # Make sure that the emitter on the sending chain is correct for the token bridge
-            MagicAssert(App.globalGet(Concat(Bytes("Chain"), Extract(Txn.application_args[1], off.load(), Int(2)))) 
-                   == Extract(Txn.application_args[1], off.load() + Int(2), Int(32))),
-            
-            off.store(off.load()+Int(43)),
+            MagicAssert(registeredEmitter(Extract(vaaEmitter.load(), Int(0), Int(2)))
+                   == Extract(vaaEmitter.load(), Int(2), Int(32))),
+
+            off.store(vaaPayload.load()),
 
             MagicAssert(Int(2) ==      Btoi(Extract(Txn.application_args[1], off.load(),      Int(1)))),
             Address.store(             Extract(Txn.application_args[1], off.load() + Int(1),  Int(32))),
@@ -521,7 +659,7 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             asset.store(blob.read(Int(3), Int(0), Int(8))),
 
             # The # offset to the digest
-            off.store(Btoi(Extract(Txn.application_args[1], Int(5), Int(1))) * Int(66) + Int(6)), 
+            off.store(vaaBody.load()),
 
             # New asset
             If(asset.load() == Itob(Int(0))).Then(Seq([
@@ -544,15 +682,33 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             Pop(blob.write(Int(4), Int(198), Itob(Btoi(Txn.application_args[8])))), # Source Fee
             Pop(blob.write(Int(4), Int(199), Itob(Btoi(Txn.application_args[9])))), # Destination Fee
 
-            # We save away the entire digest that created this asset in case we ever need to reproduce it while sending this
-            # coin to another chain
+            # The wrapped asa's decimals, when it was passed in.  Without it transfers
+            # fall back to looking them up
+            If(And(Txn.assets.length() > Int(0), Txn.assets[0] == Btoi(asset.load())),
+               storeScale(Int(4), Btoi(extract_decimal(Btoi(asset.load()))))),
 
             buf.store(Txn.application_args[1]),
+        ] + ([
+            # We save away the entire digest that created this asset in case we ever need to reproduce it while sending this
+            # coin to another chain
             Pop(blob.write(Int(3), Int(8), Extract(buf.load(), off.load(), Len(buf.load()) - off.load()))),
 
             Pop(blob.write(Int(4), Int(140), blob.read(Int(3), Int(60), Int(92)))),
             Pop(blob.write(Int(4), Int(172), blob.read(Int(3), Int(92), Int(94)))),
+        ] if full_attest else [
+            # Only the hash of the digest that created this asset, the origin stays where the
+            # full copy keeps it (60-94) so the write stays inside the first page
+            Pop(blob.write(Int(3), Int(8), Concat(
+                Keccak256(Extract(buf.load(), off.load(), Len(buf.load()) - off.load())),
+                BytesZero(Int(20)),
+                Address.load(),
+                Extract(buf.load(), off.load() + Int(84), Int(2)),
+            ))),
 
+            Pop(blob.write(Int(4), Int(140), Address.load())),
+            Pop(blob.write(Int(4), Int(172), Extract(buf.load(), off.load() + Int(84), Int(2)))),
+        ]) + [
+            packRecord(Int(4)),
             Approve()
         ])
 
@@ -569,7 +725,6 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         DestChain = ScratchVar()
         Fee = ScratchVar()
         asset = ScratchVar()
-        assetD = ScratchVar()
 
         zb = ScratchVar()
         action = ScratchVar()
@@ -580,41 +735,30 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         return Seq([
             checkPaused(),
 
+            parseHeader(),
             checkForDuplicate(),
 
             zb.store(BytesZero(Int(32))),
 
             tidx.store(Txn.group_index() - Int(1)),
 
-            MagicAssert(And(
-                # Lets see if the vaa we are about to process was actually verified by the core
-                Gtxn[tidx.load()].type_enum() == TxnType.ApplicationCall,
-                Gtxn[tidx.load()].application_id() == App.globalGet(Bytes("coreid")),
-                Gtxn[tidx.load()].application_args[0] == Bytes("verifyVAA"),
-                Gtxn[tidx.load()].sender() == Txn.sender(),
-                Gtxn[tidx.load()].on_completion() == OnComplete.NoOp,
-
-                # Lets see if the vaa we are about to process was actually verified by the core
-                Gtxn[tidx.load()].application_args[1] == Txn.application_args[1],
-
-                # We all opted into the same accounts?
-                Gtxn[tidx.load()].accounts[0] == Txn.accounts[0],
-            )),
-            assert_common_checks(Gtxn[tidx.load()]),
-            assert_common_checks(Txn),
+            # Lets see if the vaa we are about to process was actually verified by the core
+            checkVerifyVAA(tidx.load()),
 
-            off.store(Btoi(Extract(Txn.application_args[1], Int(5), Int(1))) * Int(66) + Int(6) + Int(8)), # The offset of the chain
+            # We all opted into the same accounts?
+            MagicAssert(Gtxn[tidx.load()].accounts[0] == Txn.accounts[0]),
+            checkCommon(Txn.group_index()),
 
-            Chain.store(Btoi(Extract(Txn.application_args[1], off.load(), Int(2)))),
-            Emitter.store(Extract(Txn.application_args[1], off.load() + Int(2), Int(32))),
+            Chain.store(Btoi(Extract(vaaEmitter.load(), Int(0), Int(2)))),
+            Emitter.store(Extract(vaaEmitter.load(), Int(2), Int(32))),
 
             # We coming from the correct emitter on the sending chain for the token bridge
             # ... This is 90% of the security...
             If(Chain.load() == Int(8),
                MagicAssert(Global.current_application_address() == Emitter.load()), # This came from us?
-               MagicAssert(App.globalGet(Concat(Bytes("Chain"), Extract(Txn.application_args[1], off.load(), Int(2)))) == Emitter.load())),
+               MagicAssert(registeredEmitter(Extract(vaaEmitter.load(), Int(0), Int(2))) == Emitter.load())),
 
-            off.store(off.load()+Int(43)),
+            off.store(vaaPayload.load()),
 
             # This is a transfer message... right?
             action.store(Btoi(Extract(Txn.application_args[1], off.load(), Int(1)))),
@@ -657,7 +801,8 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
 
                     # Get the escrow
                     MagicAssert(Txn.accounts[3] == get_sig_address(asset.load(), Bytes("native"))),
-                    escrow.store(Btoi(blob.read(Int(3), Int(190), Int(198)))), # Escrow APP ID
+                    loadRecord(Int(3)),
+                    escrow.store(Btoi(recField(190, 198))), # Escrow APP ID
 
                    MagicAssert(Txn.accounts[3] == get_sig_address(asset.load(), Bytes("native"))),
                    # Now, the horrible part... we have to scale the amount back out to compensate for the "dedusting" 
@@ -666,48 +811,36 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                    If(asset.load() == Int(0),
                       Seq([
                         # normalize to ALGO decimal (6 decimals)
-                        normalizedAmount(Int(6), Amount.load(), Fee.load()),
+                        scaleDec.store(Int(6)),
+                        scaleFactor.store(Int(100)),
+                        normalizedAmount(Amount.load(), Fee.load()),
                         Amount.store(normAmount.load()),
                         Fee.store(normFee.load()),
 
                         # Check max token transfer amount
-                        checkTokenMax(Int(3), Amount.load()),
+                        checkTokenMax(Amount.load()),
 
                         # Calculate Bridge Fees
-                        bfee.store(calculateBridgeFee(Int(3), Int(0), Amount.load(), Int(0))),
+                        bfee.store(calculateBridgeFee(Int(0), Amount.load(), Int(0))),
                         Amount.store(Amount.load() - bfee.load()),
 
-                          InnerTxnBuilder.Begin(),
-                          If(bfee.load() > Int(0), Seq([
-                                escrowTransfer(escrow.load(), App.globalGet(Bytes("Treasury")), bfee.load(), asset.load()),
-                                InnerTxnBuilder.Next(),
-                          ])),
-
-                            escrowTransfer(escrow.load(), Destination.load(), Amount.load(), asset.load()),
-                            InnerTxnBuilder.Next(),
-                            escrowLiquidity(escrow.load(), Int(0), Amount.load()),
-                 
-                          If(Fee.load() > Int(0), Seq([
-                                  InnerTxnBuilder.Next(),
-                                  escrowTransfer(escrow.load(), Txn.sender(), Fee.load(), asset.load()),
-                          ])),
-                          InnerTxnBuilder.Submit(),
-
-                          Approve()
+                        redeemPayout(escrow.load(), asset.load(), Destination.load(), Amount.load(), Fee.load()),
+
+                        Approve()
                       ]),            # End of special case for algo
                       Seq([          # Start of handling code for algorand tokens
                         
                         # Normalize back to asa decimal
-                        assetD.store(Btoi(extract_decimal(asset.load()))),
-                        normalizedAmount(assetD.load(), Amount.load(), Fee.load()),
+                        loadScale(asset.load()),
+                        normalizedAmount(Amount.load(), Fee.load()),
                         Amount.store(normAmount.load()),
                         Fee.store(normFee.load()),
 
                         # Check max token transfer amount
-                        checkTokenMax(Int(3), Amount.load()),
+                        checkTokenMax(Amount.load()),
 
                         # Calculate Bridge Fees
-                        bfee.store(calculateBridgeFee(Int(3), asset.load(), Amount.load(), Int(0))),
+                        bfee.store(calculateBridgeFee(asset.load(), Amount.load(), Int(0))),
                         Amount.store(Amount.load() - bfee.load()),
 
                                     # If(factor.load() != Int(1),
@@ -718,8 +851,9 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                # OriginChain.load() != Int(8),
                Seq([
                    # Lets see if we've seen this asset before
-                   asset.store(Btoi(blob.read(Int(3), Int(0), Int(8)))),
-                   escrow.store(Btoi(blob.read(Int(3), Int(190), Int(198)))), # Escrow APP ID
+                   loadRecord(Int(3)),
+                   asset.store(Btoi(recField(0, 8))),
+                   escrow.store(Btoi(recField(190, 198))), # Escrow APP ID
 
                    MagicAssert(And(
                        asset.load() != Int(0),
@@ -728,37 +862,23 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                    ),
 
                     # Normalize back to asa decimal
-                    assetD.store(Btoi(extract_decimal(asset.load()))),
-                    normalizedAmount(assetD.load(), Amount.load(), Fee.load()),
+                    loadScale(asset.load()),
+                    normalizedAmount(Amount.load(), Fee.load()),
                     Amount.store(normAmount.load()),
                     Fee.store(normFee.load()),
 
                     # Check max token transfer amount
-                    checkTokenMax(Int(3), Amount.load()),
+                    checkTokenMax(Amount.load()),
 
                     # Calculate Bridge Fees
-                    bfee.store(calculateBridgeFee(Int(3), asset.load(), Amount.load(), Int(0))),
+                    bfee.store(calculateBridgeFee(asset.load(), Amount.load(), Int(0))),
                     Amount.store(Amount.load() - bfee.load()),
 
                ])  # OriginChain.load() != Int(8),
             ),  #  If(OriginChain.load() == Int(8)
 
             # Actually send the coins...
-            InnerTxnBuilder.Begin(),
-            If(bfee.load() > Int(0), Seq([
-                escrowTransfer(escrow.load(), App.globalGet(Bytes("Treasury")), bfee.load(), asset.load()),
-                InnerTxnBuilder.Next(),
-            ])),
-
-            escrowTransfer(escrow.load(), Destination.load(), Amount.load(), asset.load()),
-            InnerTxnBuilder.Next(),
-            escrowLiquidity(escrow.load(), Int(0), Amount.load()),
-
-            If(Fee.load() > Int(0), Seq([
-                InnerTxnBuilder.Next(),
-                escrowTransfer(escrow.load(), Txn.sender(), Fee.load(), asset.load()),
-            ])),
-            InnerTxnBuilder.Submit(),
+            redeemPayout(escrow.load(), asset.load(), Destination.load(), Amount.load(), Fee.load()),
 
             Approve()
         ])
@@ -824,30 +944,24 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
 
             # Get the escrow
             MagicAssert(Txn.accounts[2] == get_sig_address(aid.load(), Bytes("native"))),
-            escrow.store(Btoi(blob.read(Int(2), Int(190), Int(198)))), # Escrow APP ID
+            loadRecord(Int(2)),
+            escrow.store(Btoi(recField(190, 198))), # Escrow APP ID
 
             tidx.store(Txn.group_index() - Int(1)),
 
             If(aid.load() == Int(0),
                Seq([
-                   MagicAssert(And(
-                       # The previous txn is the asset transfer itself
-                       Gtxn[tidx.load()].type_enum() == TxnType.Payment,
-                       Gtxn[tidx.load()].sender() == Txn.sender(),
-                       Gtxn[tidx.load()].receiver() == getAppAddress(escrow.load()),
-                   )),
-                   assert_common_checks(Gtxn[tidx.load()]),
-
-                   amount.store(Gtxn[tidx.load()].amount()),
+                   # The previous txn is the asset transfer itself
+                   amount.store(checkDeposit(tidx.load(), aid.load(), getAppAddress(escrow.load()))),
 
                    # Check min and max token transfer amount
-                    checkTokenLimit(Int(2), amount.load()),
+                    checkTokenLimit(amount.load()),
                    
                    MagicAssert(fee.load() < amount.load()),
                    amount.store(amount.load() - fee.load()),
 
                     # Bridge Fees
-                   bfee.store(calculateBridgeFee(Int(2), aid.load(), amount.load(), Int(1))),
+                   bfee.store(calculateBridgeFee(aid.load(), amount.load(), Int(1))),
                    amount.store(amount.load() - bfee.load()),
 
                    # Normalize to 8 decimals (ALGO has 6 decimals)
@@ -856,30 +970,23 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                ]),
                Seq([
 
-                   MagicAssert(And(
-                       # The previous txn is the asset transfer itself
-                       Gtxn[tidx.load()].type_enum() == TxnType.AssetTransfer,
-                       Gtxn[tidx.load()].sender() == Txn.sender(),
-                       Gtxn[tidx.load()].xfer_asset() == aid.load(),
-                       Gtxn[tidx.load()].asset_receiver() == getAppAddress(escrow.load()),
-                   )),
-                   assert_common_checks(Gtxn[tidx.load()]),
-
-                   amount.store(Gtxn[tidx.load()].asset_amount()),
+                   # The previous txn is the asset transfer itself
+                   amount.store(checkDeposit(tidx.load(), aid.load(), getAppAddress(escrow.load()))),
 
                     # Check min and max token transfer amount
-                    checkTokenLimit(Int(2), amount.load()),
+                    checkTokenLimit(amount.load()),
 
                    # peal the fee off the amount
                    MagicAssert(fee.load() <= amount.load()),
                    amount.store(amount.load() - fee.load()),
 
                     # Bridge Fees
-                    bfee.store(calculateBridgeFee(Int(2), aid.load(), amount.load(), Int(1))),
+                    bfee.store(calculateBridgeFee(aid.load(), amount.load(), Int(1))),
                     amount.store(amount.load() - bfee.load()),
 
                     # Normalize amount to 8 decimals
-                    denormalizedAmount(Btoi(extract_decimal(aid.load())), amount.load(), fee.load()),
+                    loadScale(aid.load()),
+                    denormalizedAmount(amount.load(), fee.load()),
                     amount.store(normAmount.load()),
                     fee.store(normFee.load()),
                ]),
@@ -888,20 +995,20 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             # If it is nothing but dust lets just abort the whole transaction and save 
             MagicAssert(And(amount.load() > Int(0), fee.load() >= Int(0))),
 
-            isN.store(Btoi(blob.read(Int(2), Int(116), Int(124)))),
+            isN.store(Btoi(recField(116, 124))),
 
             # Is the authorizing signature of the creator of the asset the address of the token_bridge app itself?
             If(And(aid.load() != Int(0), isN.load() == Int(0)),
                Seq([
                    # Foreign/Non Native Tokens
 #                   Log(Bytes("Wormhole wrapped")),
-                   asset.store(blob.read(Int(2), Int(0), Int(8))),
+                   asset.store(recField(0, 8)),
                    # This the correct asset?
                    MagicAssert(Txn.application_args[1] == asset.load()),
 
                     # Pull the foreign asset data from the storage (receivedAttest)
-                    Address.store(blob.read(Int(2), Int(140), Int(172))),
-                    FromChain.store(blob.read(Int(2), Int(172), Int(174))),
+                    Address.store(recField(140, 172)),
+                    FromChain.store(recField(172, 174)),
 
                ]),
                Seq([
@@ -944,11 +1051,15 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                MagicAssert(Len(p.load()) == Int(133))),
 
             InnerTxnBuilder.Begin(),
-            If(bfee.load() > Int(0), Seq([
-                escrowTransfer(escrow.load(), App.globalGet(Bytes("Treasury")), bfee.load(), aid.load()),
-                InnerTxnBuilder.Next(),
-            ])),
-            escrowLiquidity(escrow.load(), amount.load(), Int(0)),
+            If(escrowHasPayout(escrow.load()),
+               escrowBook(escrow.load(), aid.load(), amount.load()),
+               Seq([
+                    If(bfee.load() > Int(0), Seq([
+                        escrowTransfer(escrow.load(), App.globalGet(Bytes("Treasury")), bfee.load(), aid.load()),
+                        InnerTxnBuilder.Next(),
+                    ])),
+                    escrowLiquidity(escrow.load(), amount.load(), Int(0)),
+               ])),
             InnerTxnBuilder.Next(),
             sendMfee(),
             InnerTxnBuilder.SetFields(
@@ -966,6 +1077,167 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             Approve()
         ])
 
+    # Several sendTransfers of one asset in a single call
+    #   args:     sendTransferBatch, aid, receivers (32 bytes each), chains (2 bytes each), fees (8 bytes each)
+    #   accounts: emitter, asset storage, [Treasury, when the asset takes a bridge fee]
+    #   group:    [mfee payment for every message], one pay/axfer per transfer to the escrow, sendTransferBatch
+    #
+    # Each transfer gets its own message, the liquidity and the treasury fee are booked once.
+    # There is no aggregated message: a payload carries a single transfer and the token
+    # bridges on the other chains could not redeem anything else
+    def sendTransferBatch():
+        aid = ScratchVar()
+        n = ScratchVar()
+        i = ScratchVar()
+        amount = ScratchVar()
+        fee = ScratchVar()
+        total = ScratchVar()
+        totalBfee = ScratchVar()
+        p = ScratchVar()
+        asset = ScratchVar()
+        Address = ScratchVar()
+        FromChain = ScratchVar()
+        zb = ScratchVar()
+
+        escrow = ScratchVar()
+        escrowAddr = ScratchVar()
+
+        isN = ScratchVar() # is native?
+
+        return Seq([
+            checkPaused(),
+
+            zb.store(BytesZero(Int(32))),
+
+            aid.store(Btoi(Txn.application_args[1])),
+            n.store(Len(Txn.application_args[2]) / Int(32)),
+
+            MagicAssert(And(
+                n.load() > Int(0),
+                Txn.application_args.length() == Int(5),
+                Len(Txn.application_args[2]) == n.load() * Int(32),
+                Len(Txn.application_args[3]) == n.load() * Int(2),
+                Len(Txn.application_args[4]) == n.load() * Int(8),
+                Txn.group_index() >= n.load(),
+            )),
+
+            # Mfee check, one payment before the transfers covers all the messages
+            mfee.store(getMessageFee() * n.load()),
+            checkFeePmt(n.load() + Int(1)),
+            mfee.store(mfee.load() / n.load()),
+
+            # Get the escrow
+            MagicAssert(Txn.accounts[2] == get_sig_address(aid.load(), Bytes("native"))),
+            loadRecord(Int(2)),
+            escrow.store(Btoi(recField(190, 198))), # Escrow APP ID
+            escrowAddr.store(getAppAddress(escrow.load())),
+
+            isN.store(Btoi(recField(116, 124))),
+
+            If(And(aid.load() != Int(0), isN.load() == Int(0)),
+               Seq([
+                   # Foreign/Non Native Tokens
+                   asset.store(recField(0, 8)),
+                   # This the correct asset?
+                   MagicAssert(Txn.application_args[1] == asset.load()),
+
+                    # Pull the foreign asset data from the storage (receivedAttest)
+                    Address.store(recField(140, 172)),
+                    FromChain.store(recField(172, 174)),
+               ]),
+               Seq([
+                   # Native Tokens
+                   FromChain.store(Bytes("base16", "0008")),
+                   Address.store(Txn.application_args[1]),
+               ])
+            ),
+
+            MagicAssert(And(
+                Len(Address.load()) <= Int(32),
+                Len(FromChain.load()) == Int(2),
+            )),
+
+            # ALGO has 6 decimals
+            loadScale(aid.load()),
+
+            total.store(Int(0)),
+            totalBfee.store(Int(0)),
+
+            For(i.store(Int(0)), i.load() < n.load(), i.store(i.load() + Int(1))).Do(Seq([
+                # The transfers are right before us, in the same order as the args
+                tidx.store(Txn.group_index() - n.load() + i.load()),
+
+                amount.store(checkDeposit(tidx.load(), aid.load(), escrowAddr.load())),
+
+                # Check min and max token transfer amount
+                checkTokenLimit(amount.load()),
+
+                # peal the fee off the amount, ALGO has to leave something like sendTransfer
+                fee.store(Btoi(Extract(Txn.application_args[4], i.load() * Int(8), Int(8)))),
+                If(aid.load() == Int(0),
+                   MagicAssert(fee.load() < amount.load()),
+                   MagicAssert(fee.load() <= amount.load())),
+                amount.store(amount.load() - fee.load()),
+
+                # Bridge Fees
+                bfee.store(calculateBridgeFee(aid.load(), amount.load(), Int(1))),
+                amount.store(amount.load() - bfee.load()),
+                totalBfee.store(totalBfee.load() + bfee.load()),
+
+                # Normalize amount to 8 decimals
+                denormalizedAmount(amount.load(), fee.load()),
+
+                # If it is nothing but dust lets just abort the whole transaction and save
+                MagicAssert(normAmount.load() > Int(0)),
+                total.store(total.load() + normAmount.load()),
+
+                p.store(Concat(
+                    Bytes("base16", "01"),
+                    Extract(zb.load(), Int(0), Int(24)),
+                    Itob(normAmount.load()),  # 8 bytes
+                    Extract(zb.load(), Int(0), Int(32) - Len(Address.load())),
+                    Address.load(),
+                    FromChain.load(),
+                    Extract(Txn.application_args[2], i.load() * Int(32), Int(32)),
+                    Extract(Txn.application_args[3], i.load() * Int(2), Int(2)),
+                    Extract(zb.load(), Int(0), Int(24)),
+                    Itob(normFee.load()),  # 8 bytes
+                )),
+                MagicAssert(Len(p.load()) == Int(133)),
+
+                InnerTxnBuilder.Begin(),
+                sendMfee(),
+                InnerTxnBuilder.SetFields(
+                    {
+                        TxnField.type_enum: TxnType.ApplicationCall,
+                        TxnField.application_id: App.globalGet(Bytes("coreid")),
+                        TxnField.application_args: [Bytes("publishMessage"), p.load(), Itob(Int(0))],
+                        TxnField.accounts: [Txn.accounts[1]],
+                        TxnField.note: Bytes("publishMessage"),
+                        TxnField.fee: Int(0),
+                    }
+                ),
+                InnerTxnBuilder.Submit(),
+            ])),
+
+            # Liquidity and the treasury fee once for the whole batch
+            bfee.store(totalBfee.load()),
+
+            InnerTxnBuilder.Begin(),
+            If(escrowHasPayout(escrow.load()),
+               escrowBook(escrow.load(), aid.load(), total.load()),
+               Seq([
+                    If(bfee.load() > Int(0), Seq([
+                        escrowTransfer(escrow.load(), App.globalGet(Bytes("Treasury")), bfee.load(), aid.load()),
+                        InnerTxnBuilder.Next(),
+                    ])),
+                    escrowLiquidity(escrow.load(), total.load(), Int(0)),
+               ])),
+            InnerTxnBuilder.Submit(),
+
+            Approve()
+        ])
+
     def updateTokenConfig():
         return Seq([
             # Only the admin can do the fee update
@@ -980,6 +1252,7 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             Pop(blob.write(Int(1), Int(124), Itob(Btoi(Txn.application_args[5])))), # Max Token
             Pop(blob.write(Int(1), Int(198), Itob(Btoi(Txn.application_args[6])))), # Source Fee
             Pop(blob.write(Int(1), Int(199), Itob(Btoi(Txn.application_args[7])))), # Destination Fee
+            packRecord(Int(1)),
 
             Approve(),
         ])
@@ -1049,7 +1322,7 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                 Txn.accounts[1] == get_sig_address(Btoi(Txn.application_args[1]), Bytes("native")),
                 Txn.sender() == App.globalGet(Bytes("owner")),
             )),
-            assert_common_checks(Txn),
+            checkCommon(Txn.group_index()),
 
             InnerTxnBuilder.Begin(),
             InnerTxnBuilder.SetFields(
@@ -1075,6 +1348,7 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         uname = ScratchVar()
         name = ScratchVar()
         aid = ScratchVar()
+        dec = ScratchVar()
 
         return Seq([
             # Only the admin can attestToken
@@ -1096,11 +1370,13 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             If(aid.load() == Int(0),
                 Seq([
                     d.store(Bytes("base16", "06")),
+                    dec.store(Int(6)),
                     uname.store(Bytes("ALGO")),
                     name.store(Bytes("ALGO"))
                 ]),
                 Seq([
                     d.store(extract_decimal(aid.load())),
+                    dec.store(Btoi(d.load())),
                     If(Btoi(d.load()) > Int(8), d.store(Bytes("base16", "08"))),
                     uname.store(extract_unit_name(aid.load())),
                     name.store(extract_name(aid.load())),
@@ -1147,6 +1423,10 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
             Pop(blob.write(Int(2), Int(198), Itob(Btoi(Txn.application_args[7])))), # Source Fee
             Pop(blob.write(Int(2), Int(199), Itob(Btoi(Txn.application_args[8])))), # Destination Fee
 
+            # The asa's own decimals, not the 8 it is capped to in the attestation
+            storeScale(Int(2), dec.load()),
+            packRecord(Int(2)),
+
             InnerTxnBuilder.Begin(),
             sendMfee(),
             InnerTxnBuilder.SetFields(
@@ -1165,38 +1445,117 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         ])
 
     @Subroutine(TealType.none)
-    def checkForDuplicate():
-        off = ScratchVar()
-        emitter = ScratchVar()
-        sequence = ScratchVar()
-        b = ScratchVar()
-        byte_offset = ScratchVar()
-
+    def parseHeader():
+        # Everything a method needs from the VAA header, once per call
         return Seq(
             # VM only is version 1
             MagicAssert(Btoi(Extract(Txn.application_args[1], Int(0), Int(1))) == Int(1)),
 
-            off.store(Btoi(Extract(Txn.application_args[1], Int(5), Int(1))) * Int(66) + Int(14)), # The offset of the emitter
+            # The body follows the signatures
+            vaaBody.store(Btoi(Extract(Txn.application_args[1], Int(5), Int(1))) * Int(66) + Int(6)),
 
             # emitter is chain/contract-address
-            emitter.store(Extract(Txn.application_args[1], off.load(), Int(34))),
-            sequence.store(Btoi(Extract(Txn.application_args[1], off.load() + Int(34), Int(8)))),
+            vaaEmitter.store(Extract(Txn.application_args[1], vaaBody.load() + Int(8), Int(34))),
+            vaaSequence.store(Btoi(Extract(Txn.application_args[1], vaaBody.load() + Int(42), Int(8)))),
+            vaaPayload.store(vaaBody.load() + Int(51)),
+        )
 
+    @Subroutine(TealType.none)
+    def checkForDuplicate():
+        b = ScratchVar()
+        byte_offset = ScratchVar()
+
+        # Needs parseHeader
+        return Seq(
             # They passed us the correct account?  In this case, byte_offset points at the whole block
-            byte_offset.store(sequence.load() / Int(max_bits)),
-            MagicAssert(Txn.accounts[1] == get_sig_address(byte_offset.load(), emitter.load())),
+            byte_offset.store(vaaSequence.load() / Int(max_bits)),
+            MagicAssert(Txn.accounts[1] == get_sig_address(byte_offset.load(), vaaEmitter.load())),
+
+            # Blocks below the emitter's low water mark were retired, their accounts may be gone
+            MagicAssert(byte_offset.load() >= lowMark(vaaEmitter.load())),
 
             # Now, lets go grab the raw byte
-            byte_offset.store((sequence.load() / Int(8)) % Int(max_bytes)),
-            b.store(blob.get_byte(Int(1), byte_offset.load())),
+            byte_offset.store((vaaSequence.load() / Int(8)) % Int(max_bytes)),
+            *(markSeen(b, byte_offset) if version >= 7 else [
+                b.store(blob.get_byte(Int(1), byte_offset.load())),
 
-            # I would hope we've never seen this packet before...   throw an exception if we have
-            MagicAssert(GetBit(b.load(), sequence.load() % Int(8)) == Int(0)),
+                # I would hope we've never seen this packet before...   throw an exception if we have
+                MagicAssert(GetBit(b.load(), vaaSequence.load() % Int(8)) == Int(0)),
 
-            # Lets mark this bit so that we never see it again
-            blob.set_byte(Int(1), byte_offset.load(), SetBit(b.load(), sequence.load() % Int(8), Int(1)))
+                # Lets mark this bit so that we never see it again
+                blob.set_byte(Int(1), byte_offset.load(), SetBit(b.load(), vaaSequence.load() % Int(8), Int(1))),
+            ])
         )
 
+    def markSeen(b: ScratchVar, byte_offset: ScratchVar):
+        # checkForDuplicate from TEAL 7: the page is read once, the bit tested and set on it
+        key = ScratchVar()
+        page = ScratchVar()
+        off = byte_offset.load() % Int(max_bytes_per_key)
+        return [
+            key.store(intkey(byte_offset.load() / Int(max_bytes_per_key))),
+            page.store(App.localGet(Int(1), key.load())),
+            b.store(GetByte(page.load(), off)),
+            MagicAssert(GetBit(b.load(), vaaSequence.load() % Int(8)) == Int(0)),
+            App.localPut(Int(1), key.load(), SetByte(page.load(), off, SetBit(b.load(), vaaSequence.load() % Int(8), Int(1)))),
+        ]
+
+    def migrateAsset():
+        return Seq([
+            checkCommon(Txn.group_index()),
+            # Anyone may pack a record, nothing in it changes
+            MagicAssert(Txn.accounts[1] == get_sig_address(Btoi(Txn.application_args[1]), Bytes("native"))),
+            packRecord(Int(1)),
+            Approve(),
+        ])
+
+    def retireBlock():
+        emitter = ScratchVar()
+        chain = ScratchVar()
+        low = ScratchVar()
+        full = ScratchVar()
+        i = ScratchVar()
+
+        return Seq([
+            checkCommon(Txn.group_index()),
+
+            # Only registered emitters have somewhere to keep a mark
+            emitter.store(Txn.application_args[1]),
+            MagicAssert(Len(emitter.load()) == Int(34)),
+            chain.store(Extract(emitter.load(), Int(0), Int(2))),
+            MagicAssert(registeredEmitter(chain.load()) == Extract(emitter.load(), Int(2), Int(32))),
+
+            # accounts[1] is the bitmap at the emitter's low water mark
+            low.store(lowMark(emitter.load())),
+            MagicAssert(Txn.accounts[1] == get_sig_address(low.load(), emitter.load())),
+
+            # Only once every sequence in it has been redeemed
+            full.store(BytesNot(BytesZero(Int(max_bytes_per_key)))),
+            For(i.store(Int(0)), i.load() < Int(max_keys), i.store(i.load() + Int(1))).Do(
+                MagicAssert(App.localGet(Int(1), intkey(i.load())) == full.load())
+            ),
+
+            App.globalPut(Concat(Bytes("Chain"), chain.load()),
+                          Concat(Extract(emitter.load(), Int(2), Int(32)), Itob(low.load() + Int(1)))),
+            blob.meta(Int(1), Bytes("retired")),
+
+            # Hand the account to the Treasury, which clears its state and closes it out
+            InnerTxnBuilder.Begin(),
+            InnerTxnBuilder.SetFields(
+                {
+                    TxnField.type_enum: TxnType.Payment,
+                    TxnField.sender: Txn.accounts[1],
+                    TxnField.receiver: Txn.accounts[1],
+                    TxnField.amount: Int(0),
+                    TxnField.rekey_to: App.globalGet(Bytes("Treasury")),
+                    TxnField.fee: Int(0),
+                }
+            ),
+            InnerTxnBuilder.Submit(),
+
+            Approve(),
+        ])
+
     def nop():
         return Return (Txn.rekey_to() == Global.zero_address())
 
@@ -1207,7 +1566,7 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
                 Global.group_size() == Int(1),
                 Txn.accounts.length() == Int(1),
             )),
-            assert_common_checks(Txn),
+            checkCommon(Txn.group_index()),
 
             App.globalPut(Bytes("owner"), Txn.accounts[1]),
 
@@ -1235,6 +1594,7 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         [METHOD == Bytes("attestToken"), attestToken()],
         [METHOD == Bytes("completeTransfer"), completeTransfer()],
         [METHOD == Bytes("sendTransfer"), sendTransfer()],
+        [METHOD == Bytes("sendTransferBatch"), sendTransferBatch()],
         [METHOD == Bytes("optin"), do_optin()],
         [METHOD == Bytes("withdraw"), do_withdraw()],
         [METHOD == Bytes("deposit"), do_deposit()],
@@ -1244,6 +1604,8 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         [METHOD == Bytes("updateEscrow"), updateEscrow()],
         [METHOD == Bytes("updateWhitelist"), updateWhitelist()],
         [METHOD == Bytes("updateTreasury"), updateTreasury()],
+        [METHOD == Bytes("retireBlock"), retireBlock()],
+        [METHOD == Bytes("migrateAsset"), migrateAsset()],
     )
 
     on_create = Seq( [
@@ -1304,10 +1666,12 @@ def approve_token_bridge(seed_amt: int, tmpl_sig: TmplSig, devMode: bool):
         [Txn.on_completion() == OnComplete.NoOp, router]
     )
 
-def get_token_bridge(genTeal, approve_name, clear_name, client: AlgodClient, seed_amt: int, tmpl_sig: TmplSig, devMode: bool) -> Tuple[bytes, bytes]:
+def get_token_bridge(genTeal, approve_name, clear_name, client: AlgodClient, seed_amt: int, tmpl_sig: TmplSig, devMode: bool, full_attest: bool = True, version: int = 6) -> Tuple[bytes, bytes]:
     if not devMode:
-        client = AlgodClient("aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa", "https://testnet-api.algonode.cloud")
-    APPROVAL_PROGRAM = fullyCompileContract(True, client, approve_token_bridge(seed_amt, tmpl_sig, devMode), approve_name, devMode)
-    CLEAR_STATE_PROGRAM = fullyCompileContract(True, client, clear_token_bridge(), clear_name, devMode)
+        client = shared_algod()
+    sites = AssertSites()
+    APPROVAL_PROGRAM = fullyCompileContract(True, client, approve_token_bridge(seed_amt, tmpl_sig, devMode, sites, full_attest, version),
+                                            approve_name, devMode, sites, version)
+    CLEAR_STATE_PROGRAM = fullyCompileContract(True, client, clear_token_bridge(), clear_name, devMode, version=version)
 
     return APPROVAL_PROGRAM, CLEAR_STATE_PROGRAM
@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+"""
+Host side decoding of VAAs
+
+The offsets are the ones the token bridge uses on chain: the body starts after
+6 + 66 * num_sigs bytes, the 34 byte emitter (chain + address) sits 8 bytes into the
+body and the payload 51 bytes into it.
+"""
+from typing import NamedTuple
+
+
+class VAA(NamedTuple):
+    raw: bytes
+    version: int
+    guardian_set_index: int
+    num_sigs: int
+    body_offset: int
+    timestamp: int
+    nonce: int
+    emitter_chain: int
+    emitter_address: bytes
+    sequence: int
+    consistency: int
+    payload: bytes
+
+    @property
+    def signatures(self) -> bytes:
+        return self.raw[6:self.body_offset]
+
+    @property
+    def body(self) -> bytes:
+        return self.raw[self.body_offset:]
+
+    @property
+    def emitter(self) -> bytes:
+        """
+        The raw chain + address, the way checkForDuplicate and registerChain key on it
+        """
+        return self.raw[self.body_offset + 8:self.body_offset + 42]
+
+    @property
+    def action(self) -> int:
+        return self.payload[0] if self.payload else 0
+
+    def digest(self) -> bytes:
+        """
+        The hash the guardians sign, keccak256(keccak256(body))
+        """
+        from Cryptodome.Hash import keccak
+        inner = keccak.new(digest_bits=256, data=self.body).digest()
+        return keccak.new(digest_bits=256, data=inner).digest()
+
+
+def parse_vaa(raw: bytes) -> VAA:
+    if len(raw) < 6:
+        raise ValueError("vaa too short")
+
+    num_sigs = raw[5]
+    off = 6 + num_sigs * 66
+    if len(raw) < off + 51:
+        raise ValueError("vaa too short for {} signatures".format(num_sigs))
+
+    return VAA(
+        raw=raw,
+        version=raw[0],
+        guardian_set_index=int.from_bytes(raw[1:5], "big"),
+        num_sigs=num_sigs,
+        body_offset=off,
+        timestamp=int.from_bytes(raw[off:off + 4], "big"),
+        nonce=int.from_bytes(raw[off + 4:off + 8], "big"),
+        emitter_chain=int.from_bytes(raw[off + 8:off + 10], "big"),
+        emitter_address=raw[off + 10:off + 42],
+        sequence=int.from_bytes(raw[off + 42:off + 50], "big"),
+        consistency=raw[off + 50],
+        payload=raw[off + 51:],
+    )
+
+
+class Transfer(NamedTuple):
+    action: int             # 1 transfer, 3 transfer with payload
+    amount_high: bytes      # top 24 bytes of the uint256, the bridge only takes zeros
+    amount: int
+    origin: bytes
+    origin_chain: int
+    destination: bytes      # an app id in the last 8 bytes for payload 3
+    dest_chain: int
+    fee_high: bytes
+    fee: int
+    payload: bytes          # payload 3 only
+
+
+def parse_transfer(payload: bytes) -> Transfer:
+    """
+    The transfer payload, at the offsets completeTransfer reads it at
+    """
+    if len(payload) < 133:
+        raise ValueError("transfer payload too short")
+
+    return Transfer(
+        action=payload[0],
+        amount_high=payload[1:25],
+        amount=int.from_bytes(payload[25:33], "big"),
+        origin=payload[33:65],
+        origin_chain=int.from_bytes(payload[65:67], "big"),
+        destination=payload[67:99],
+        dest_chain=int.from_bytes(payload[99:101], "big"),
+        fee_high=payload[101:125],
+        fee=int.from_bytes(payload[125:133], "big"),
+        payload=payload[133:],
+    )
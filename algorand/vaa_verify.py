@@ -81,24 +81,19 @@ def sig_check(signatures, dhash, keys):
                     si.store(si.load() + Int(66)),
                     ki.store(ki.load() + Int(20))
                 ])).Do(
-                    Seq([
-                        InlineAssembly(
-                            "ecdsa_pk_recover Secp256k1",
-                            dhash,
-                            Btoi(Extract(signatures, si.load() + Int(65), Int(1))),
-                            Extract(signatures, si.load() + Int(1), Int(32)),       # R
-                            Extract(signatures, si.load() + Int(33), Int(32)),      # S
-                            type=TealType.none),
-
-                        # returned values in stack, pass to scratch-vars
-
-                        InlineAssembly("store " + str(SLOTID_RECOVERED_PK_Y)),
-                        InlineAssembly("store " + str(SLOTID_RECOVERED_PK_X)),
-
+                    InlineAssembly(
+                        "ecdsa_pk_recover Secp256k1",
+                        dhash,
+                        Btoi(Extract(signatures, si.load() + Int(65), Int(1))),
+                        Extract(signatures, si.load() + Int(1), Int(32)),       # R
+                        Extract(signatures, si.load() + Int(33), Int(32)),      # S
+                        outputs=[TealType.bytes, TealType.bytes],
+                        # The fixed slots keep the program, and so the lsig address, as deployed
+                        slots=[rec_pk_x.slot, rec_pk_y.slot],
+                    ).outputReducer(
                         # Generate Ethereum-type public key, compare with guardian key.
-
-                        Assert(Extract(keys, ki.load(), Int(20)) == Substring(Keccak256(Concat(rec_pk_x.load(), rec_pk_y.load())), Int(12), Int(32)))
-                    ])
+                        lambda pk_x, pk_y: Assert(Extract(keys, ki.load(), Int(20)) == Substring(Keccak256(Concat(pk_x, pk_y)), Int(12), Int(32)))
+                    )
             ),
             Return(Int(1))
         ]
@@ -117,8 +112,8 @@ def vaa_verify_program():
         Approve()]
     )
 
-def get_vaa_verify():
-    teal = compileTeal(vaa_verify_program(), mode=Mode.Signature, version=6)
+def get_vaa_verify(version: int = 6):
+    teal = compileTeal(vaa_verify_program(), mode=Mode.Signature, version=version)
 
     with open("teal/vaa_verify.teal", "w") as f:
         f.write(teal)